@@ -0,0 +1,95 @@
+"""
+ClaudeSDKClient falso con latencia configurable y respuesta por tokens.
+
+Reemplaza al cliente real de claude_agent_sdk, así RealStateAgent
+(sesiones, compactación, métricas) corre completo sin llamar a la API:
+
+    from benchmarks.fakes import agent as fake_agent
+    fake_agent.install(first_token_latency=1.5, tokens=300)
+"""
+
+import asyncio
+import random
+import time
+import uuid
+from dataclasses import dataclass
+
+import claude_agent_sdk
+from claude_agent_sdk import AssistantMessage, ResultMessage, TextBlock
+
+
+@dataclass
+class FakeAgentProfile:
+    connect_latency: float = 0.3  # Arranque del CLI / conexión MCP
+    first_token_latency: float = 1.5  # Hasta el primer texto (incluye tool calls)
+    jitter: float = 0.5
+    tokens: int = 200  # Largo de la respuesta
+    tokens_per_second: float = 80.0
+    tokens_per_message: int = 20  # Tokens por AssistantMessage
+    context_tokens: int = 8_000  # Contexto que se informa en ResultMessage.usage
+
+
+SAMPLE_WORDS = (
+    "El contrato de la propiedad en Providencia vence el próximo mes y el voucher "
+    "de arriendo de **450.000 CLP** sigue pendiente de pago según el registro"
+).split()
+
+
+class FakeClaudeSDKClient:
+    """Misma interfaz que usa RealStateAgent: async with, query() y receive_response()"""
+
+    profile = FakeAgentProfile()
+
+    def __init__(self, options=None):
+        self.options = options
+        self.session_id = getattr(options, "resume", None) or str(uuid.uuid4())
+        self.prompt: str | None = None
+
+    async def __aenter__(self):
+        await asyncio.sleep(self.profile.connect_latency)
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def query(self, prompt: str):
+        self.prompt = prompt
+
+    async def receive_response(self):
+        profile = self.profile
+        start = time.monotonic()
+        await asyncio.sleep(profile.first_token_latency + random.uniform(0, profile.jitter))
+
+        words = [SAMPLE_WORDS[i % len(SAMPLE_WORDS)] for i in range(profile.tokens)]
+        for i in range(0, len(words), profile.tokens_per_message):
+            chunk = words[i : i + profile.tokens_per_message]
+            if i:
+                await asyncio.sleep(len(chunk) / profile.tokens_per_second)
+            prefix = "\n\n- " if i else ""
+            yield AssistantMessage(content=[TextBlock(prefix + " ".join(chunk))], model="fake")
+
+        elapsed_ms = int((time.monotonic() - start) * 1000)
+        yield ResultMessage(
+            subtype="success",
+            duration_ms=elapsed_ms,
+            duration_api_ms=elapsed_ms,
+            is_error=False,
+            num_turns=1,
+            session_id=self.session_id,
+            usage={
+                "input_tokens": 50,
+                "cache_creation_input_tokens": 0,
+                "cache_read_input_tokens": profile.context_tokens,
+                "output_tokens": profile.tokens,
+            },
+        )
+
+
+def install(**profile) -> FakeAgentProfile:
+    """
+    Reemplaza claude_agent_sdk.ClaudeSDKClient (src.agent.agent lo resuelve
+    en cada uso); `profile` son campos de FakeAgentProfile.
+    """
+    FakeClaudeSDKClient.profile = FakeAgentProfile(**profile)
+    claude_agent_sdk.ClaudeSDKClient = FakeClaudeSDKClient
+    return FakeClaudeSDKClient.profile
@@ -0,0 +1,58 @@
+"""
+Endpoint falso de transcripción compatible con la API de Groq (OpenAI).
+
+Uso (desde bot/):
+    python -m benchmarks.fakes.groq --port 8100 --latency 0.8 --error-rate 0.1
+    GROQ_BASE_URL=http://localhost:8100 python main.py
+"""
+
+import argparse
+import asyncio
+import random
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+def create_app(latency: float = 0.5, jitter: float = 0.2, error_rate: float = 0.0) -> FastAPI:
+    """
+    `latency` simula el tiempo de inferencia (más `jitter` aleatorio) y
+    `error_rate` la proporción de respuestas 503 (error transitorio).
+    """
+    app = FastAPI(title="Fake Groq")
+    app.state.requests = 0
+
+    @app.post("/openai/v1/audio/transcriptions")
+    async def transcriptions(request: Request):
+        body = await request.body()
+        app.state.requests += 1
+        await asyncio.sleep(latency + random.uniform(0, jitter))
+
+        if random.random() < error_rate:
+            return JSONResponse(
+                {"error": {"message": "Service unavailable", "type": "internal_server_error"}},
+                status_code=503,
+            )
+        return {"text": f"Transcripción de prueba ({len(body)} bytes)"}
+
+    @app.get("/stats")
+    async def stats():
+        return {"requests": app.state.requests}
+
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    uvicorn.run(
+        create_app(args.latency, args.jitter, args.error_rate),
+        host="127.0.0.1",
+        port=args.port,
+    )
@@ -0,0 +1,235 @@
+"""
+Servidor falso de Supabase PostgREST (/rest/v1) con datos sintéticos en memoria.
+
+Soporta lo que usa src/services/supabase_client.py: select de columnas,
+filtros eq/neq/in/lt/lte/gt/gte, order, limit/offset, insert y update.
+
+Uso (desde bot/):
+    python -m benchmarks.fakes.supabase --port 8102 --users 200 --orgs 20
+    SUPABASE_URL=http://localhost:8102 python main.py
+
+Los usuarios vinculados tienen telegram_id desde FIRST_TELEGRAM_ID.
+"""
+
+import argparse
+import asyncio
+import random
+import uuid
+from datetime import date, timedelta
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+FIRST_TELEGRAM_ID = 100_000
+RESERVED_PARAMS = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+
+
+def seed(users: int, orgs: int, today: date | None = None) -> dict[str, list[dict]]:
+    """Genera organizaciones, usuarios vinculados, propiedades, contratos, vouchers y payouts"""
+    today = today or date.today()
+    rng = random.Random(0)
+    tables: dict[str, list[dict]] = {
+        "organizaciones": [],
+        "users": [],
+        "telegram_users": [],
+        "user_organizacion": [],
+        "propiedades": [],
+        "contratos": [],
+        "vouchers": [],
+        "payouts": [],
+    }
+
+    for o in range(orgs):
+        tables["organizaciones"].append(
+            {"organizacion_id": f"org-{o}", "nombre": f"Corredora {o}", "url": f"corredora-{o}"}
+        )
+        for p in range(5):
+            propiedad_id = o * 100 + p
+            tables["propiedades"].append(
+                {
+                    "propiedad_id": propiedad_id,
+                    "organizacion_id": f"org-{o}",
+                    "calle": "Av. Providencia",
+                    "numero": str(1000 + propiedad_id),
+                    "comuna": "Providencia",
+                }
+            )
+            tables["contratos"].append(
+                {
+                    "contrato_id": propiedad_id,
+                    "organizacion_id": f"org-{o}",
+                    "propiedad_id": propiedad_id,
+                    "estado": "VIGENTE",
+                    "fecha_termino": (today + timedelta(days=rng.randint(0, 365))).isoformat(),
+                }
+            )
+            tables["vouchers"].append(
+                {
+                    "voucher_id": propiedad_id,
+                    "organizacion_id": f"org-{o}",
+                    "propiedad_id": propiedad_id,
+                    "folio": propiedad_id,
+                    "periodo": today.strftime("%Y-%m"),
+                    "fecha_vencimiento": (today + timedelta(days=rng.randint(-20, 20))).isoformat(),
+                    "moneda": "CLP",
+                    "monto_arriendo": 450_000,
+                    "monto_arriendo_clp": 450_000,
+                    "estado": rng.choice(["GENERADO", "ENVIADO", "VENCIDO", "PAGADO"]),
+                }
+            )
+            tables["payouts"].append(
+                {
+                    "payout_id": propiedad_id,
+                    "organizacion_id": f"org-{o}",
+                    "voucher_id": propiedad_id,
+                    "estado": rng.choice(["pending", "processing", "completed"]),
+                    "monto": 405_000,
+                    "moneda": "CLP",
+                }
+            )
+
+    for u in range(users):
+        org = f"org-{u % max(orgs, 1)}"
+        tables["users"].append({"user_id": f"user-{u}", "nombre": "Usuario", "apellido": str(u)})
+        tables["telegram_users"].append(
+            {
+                "id": f"00000000-0000-0000-0000-{u:012d}",
+                "telegram_id": FIRST_TELEGRAM_ID + u,
+                "user_id": f"user-{u}",
+                "organizacion_id": org,
+            }
+        )
+        tables["user_organizacion"].append({"user_id": f"user-{u}", "organizacion_id": org})
+
+    return tables
+
+
+def _coerce(value: str, sample):
+    """Convierte el valor del filtro al tipo de la columna"""
+    if isinstance(sample, bool):
+        return value == "true"
+    if isinstance(sample, int):
+        return int(value)
+    if isinstance(sample, float):
+        return float(value)
+    return value
+
+
+def _matches(row: dict, column: str, expression: str) -> bool:
+    operator, _, raw = expression.partition(".")
+    current = row.get(column)
+    if operator == "in":
+        values = [v.strip('"') for v in raw.strip("()").split(",")]
+        return str(current) in values
+    if current is None:
+        return False
+
+    value = _coerce(raw, current)
+    if operator == "eq":
+        return current == value
+    if operator == "neq":
+        return current != value
+    if operator == "lt":
+        return current < value
+    if operator == "lte":
+        return current <= value
+    if operator == "gt":
+        return current > value
+    if operator == "gte":
+        return current >= value
+    raise ValueError(f"Unsupported operator: {operator}")
+
+
+def _filter(rows: list[dict], params) -> list[dict]:
+    for column, expression in params.multi_items():
+        if column in RESERVED_PARAMS:
+            continue
+        rows = [row for row in rows if _matches(row, column, expression)]
+    return rows
+
+
+def _project(rows: list[dict], select: str | None) -> list[dict]:
+    if not select or select == "*" or "(" in select:
+        return rows
+    columns = [c.strip() for c in select.split(",")]
+    return [{c: row.get(c) for c in columns} for row in rows]
+
+
+def create_app(
+    users: int = 200,
+    orgs: int = 20,
+    latency: float = 0.01,
+    jitter: float = 0.005,
+) -> FastAPI:
+    """`latency` (más `jitter`) simula el round-trip a la base de datos por consulta"""
+    app = FastAPI(title="Fake Supabase PostgREST")
+    app.state.tables = seed(users, orgs)
+    app.state.requests = 0
+
+    async def delay():
+        app.state.requests += 1
+        await asyncio.sleep(latency + random.uniform(0, jitter))
+
+    @app.get("/rest/v1/{table}")
+    async def select(table: str, request: Request):
+        await delay()
+        params = request.query_params
+        rows = _filter(app.state.tables.get(table, []), params)
+
+        if order := params.get("order"):
+            column, _, direction = order.partition(".")
+            rows = sorted(rows, key=lambda r: (r.get(column) is None, r.get(column)))
+            if direction.startswith("desc"):
+                rows.reverse()
+
+        offset = int(params.get("offset", 0))
+        limit = params.get("limit")
+        rows = rows[offset : offset + int(limit) if limit else None]
+        return _project(rows, params.get("select"))
+
+    @app.post("/rest/v1/{table}")
+    async def insert(table: str, request: Request):
+        await delay()
+        body = await request.json()
+        rows = body if isinstance(body, list) else [body]
+        target = app.state.tables.setdefault(table, [])
+        for row in rows:
+            row.setdefault("id", str(uuid.uuid4()))
+            target.append(row)
+        return JSONResponse(rows, status_code=201)
+
+    @app.patch("/rest/v1/{table}")
+    async def update(table: str, request: Request):
+        await delay()
+        changes = await request.json()
+        rows = _filter(app.state.tables.get(table, []), request.query_params)
+        for row in rows:
+            row.update(changes)
+        return rows
+
+    @app.get("/stats")
+    async def stats():
+        return {
+            "requests": app.state.requests,
+            "rows": {name: len(rows) for name, rows in app.state.tables.items()},
+        }
+
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8102)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--orgs", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.01)
+    parser.add_argument("--jitter", type=float, default=0.005)
+    args = parser.parse_args()
+
+    uvicorn.run(
+        create_app(args.users, args.orgs, args.latency, args.jitter),
+        host="127.0.0.1",
+        port=args.port,
+    )
@@ -0,0 +1,121 @@
+"""
+Servidor falso de la Bot API de Telegram (sendMessage, getFile, descarga de
+archivos y webhook).
+
+Uso (desde bot/):
+    python -m benchmarks.fakes.telegram --port 8101 --latency 0.05
+    TELEGRAM_API_URL=http://localhost:8101 python main.py
+"""
+
+import argparse
+import asyncio
+import random
+from collections import Counter
+
+import uvicorn
+from fastapi import FastAPI, Request, Response
+
+
+def create_app(
+    latency: float = 0.05,
+    jitter: float = 0.02,
+    file_size: int = 32 * 1024,
+    pdf_pages: int = 20,
+) -> FastAPI:
+    """
+    `latency` (más `jitter` aleatorio) simula el tiempo de respuesta de la API
+    y `file_size` el tamaño de los archivos que entrega getFile. Los archivos
+    cuyo file_id empieza con "document" se entregan como un PDF sintético de
+    `pdf_pages` páginas.
+    """
+    app = FastAPI(title="Fake Telegram Bot API")
+    app.state.sent = Counter()
+    app.state.requests = Counter()
+    payload = bytes(random.getrandbits(8) for _ in range(file_size))
+    pdf = b""
+    if pdf_pages:
+        from benchmarks.pdf_extraction import build_pdf
+
+        pdf = build_pdf(pdf_pages)
+
+    def content(file_id: str) -> bytes:
+        return pdf if pdf and file_id.startswith("document") else payload
+
+    async def delay():
+        await asyncio.sleep(latency + random.uniform(0, jitter))
+
+    @app.post("/bot{token}/sendMessage")
+    async def send_message(token: str, request: Request):
+        body = await request.json()
+        app.state.requests["sendMessage"] += 1
+        await delay()
+        app.state.sent[body["chat_id"]] += 1
+        return {
+            "ok": True,
+            "result": {
+                "message_id": sum(app.state.sent.values()),
+                "chat": {"id": body["chat_id"], "type": "private"},
+                "date": 0,
+                "text": body["text"],
+            },
+        }
+
+    @app.get("/bot{token}/getMe")
+    async def get_me(token: str):
+        app.state.requests["getMe"] += 1
+        await delay()
+        return {"ok": True, "result": {"id": 1, "is_bot": True, "first_name": "Fake"}}
+
+    @app.get("/bot{token}/getFile")
+    async def get_file(token: str, file_id: str):
+        app.state.requests["getFile"] += 1
+        await delay()
+        return {
+            "ok": True,
+            "result": {
+                "file_id": file_id,
+                "file_unique_id": file_id,
+                "file_size": len(content(file_id)),
+                "file_path": f"files/{file_id}",
+            },
+        }
+
+    @app.get("/file/bot{token}/{file_path:path}")
+    async def download(token: str, file_path: str):
+        app.state.requests["download"] += 1
+        await delay()
+        return Response(
+            content(file_path.removeprefix("files/")), media_type="application/octet-stream"
+        )
+
+    @app.post("/bot{token}/{method}")
+    async def other(token: str, method: str):
+        """setWebhook, deleteWebhook y cualquier otro método: siempre ok"""
+        app.state.requests[method] += 1
+        return {"ok": True, "result": True}
+
+    @app.get("/stats")
+    async def stats():
+        return {
+            "requests": dict(app.state.requests),
+            "messages_sent": sum(app.state.sent.values()),
+            "chats": len(app.state.sent),
+        }
+
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8101)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--file-size", type=int, default=32 * 1024)
+    parser.add_argument("--pdf-pages", type=int, default=20)
+    args = parser.parse_args()
+
+    uvicorn.run(
+        create_app(args.latency, args.jitter, args.file_size, args.pdf_pages),
+        host="127.0.0.1",
+        port=args.port,
+    )
@@ -0,0 +1,363 @@
+"""
+Prueba de carga del webhook con servicios externos falsos.
+
+Levanta servidores falsos de la Bot API de Telegram, Supabase PostgREST y
+Groq, reemplaza ClaudeSDKClient por un cliente falso
+(benchmarks/fakes/agent.py) y levanta la app FastAPI real con su lifespan,
+cada uno con uvicorn en su propio thread.
+Luego envía updates a POST /webhook con llegadas Poisson a la tasa pedida
+(carga abierta: no espera respuestas para enviar el siguiente) y reporta
+latencia p50/p95/p99, throughput y uso de recursos, además de los
+percentiles por etapa de /metrics.
+
+Uso (desde bot/):
+    python -m benchmarks.load --rate 5 --duration 60
+    python -m benchmarks.load --rate 20 --duration 30 --voice 0.3 --agent-latency 3
+    python -m benchmarks.load --rate 10 --json report.json --fail-p95-ms 8000
+
+Todo corre en un solo proceso (y comparte el GIL), así que el CPU de los falsos y del generador
+se suma al de la app: sirve para comparar versiones entre sí en la misma
+máquina, no como medida absoluta de capacidad.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import resource
+import socket
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from collections.abc import AsyncIterator
+
+import httpx
+import uvicorn
+
+from benchmarks.fakes import groq as fake_groq
+from benchmarks.fakes import supabase as fake_supabase
+from benchmarks.fakes import telegram as fake_telegram
+
+
+TEXTS = [
+    "¿Qué vouchers están vencidos este mes?",
+    "Muéstrame los contratos que terminan pronto",
+    "¿Cuánto debe el arrendatario de Av. Providencia 1002?",
+    "Resumen de pagos pendientes por propiedad",
+]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _serve(app, port: int) -> uvicorn.Server:
+    """
+    Levanta una app ASGI con uvicorn en su propio thread y event loop: así un
+    bloqueo del loop de la app (p.ej. el cliente síncrono de Supabase) no
+    frena a los falsos ni al generador de carga, y se ve en las latencias.
+    """
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on")
+    )
+    thread = threading.Thread(target=server.run, name=f"uvicorn-{port}", daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError(f"Server on port {port} failed to start")
+        time.sleep(0.01)
+    server.thread = thread
+    return server
+
+
+def _percentiles(samples: list[float]) -> dict[str, float | None]:
+    ordered = sorted(samples)
+    result = {}
+    for p in (0.50, 0.95, 0.99):
+        key = f"p{round(p * 100)}"
+        result[key] = (
+            round(ordered[min(int(len(ordered) * p), len(ordered) - 1)] * 1000, 1)
+            if ordered
+            else None
+        )
+    return result
+
+
+class UpdateFactory:
+    """Genera updates de Telegram según la mezcla de usuarios y tipos de mensaje"""
+
+    def __init__(self, args):
+        self.args = args
+        self.update_id = 0
+        self.rng = random.Random(args.seed)
+
+    def next(self) -> tuple[str, dict]:
+        self.update_id += 1
+        args = self.args
+
+        if self.rng.random() < args.unlinked:
+            telegram_id = 1 + self.rng.randrange(1_000)
+        else:
+            telegram_id = fake_supabase.FIRST_TELEGRAM_ID + self.rng.randrange(args.users)
+
+        message = {
+            "message_id": self.update_id,
+            "from": {"id": telegram_id, "first_name": "Carga"},
+            "date": int(time.time()),
+        }
+        roll = self.rng.random()
+        if roll < args.commands:
+            kind = "command"
+            message["text"] = self.rng.choice(["/start", "/help", "/resumen"])
+        elif roll < args.commands + args.voice:
+            kind = "voice"
+            message["voice"] = {
+                "file_id": f"voice-{self.update_id}",
+                "file_unique_id": f"voice-{self.update_id}",
+                "duration": 8,
+                "mime_type": "audio/ogg",
+                "file_size": args.file_size,
+            }
+        else:
+            kind = "text"
+            message["text"] = self.rng.choice(TEXTS)
+
+        if telegram_id < fake_supabase.FIRST_TELEGRAM_ID:
+            kind = f"{kind}/unlinked"
+        return kind, {"update_id": self.update_id, "message": message}
+
+
+class ResourceSampler:
+    """Muestrea el lag del event loop (del generador) y los descriptores abiertos"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.lags: list[float] = []
+        self.max_fds = 0
+
+    async def run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(time.perf_counter() - start - self.interval, 0))
+            if os.path.isdir("/proc/self/fd"):
+                self.max_fds = max(self.max_fds, len(os.listdir("/proc/self/fd")))
+
+
+async def drive(args, updates: AsyncIterator[tuple[str, dict]], label: str) -> dict:
+    """
+    Levanta el entorno (falsos + app real), envía a POST /webhook cada
+    (tipo, update) que entrega `updates` en el momento en que lo entrega, y
+    arma el reporte. También lo usa benchmarks/replay.py.
+    """
+    ports = {name: _free_port() for name in ("telegram", "supabase", "groq", "app")}
+    data_dir = tempfile.mkdtemp(prefix="bot-load-")
+
+    # La configuración se lee al importar main, así que va antes del import
+    os.environ.update(
+        {
+            "TELEGRAM_BOT_TOKEN": "load-test",
+            "TELEGRAM_API_URL": f"http://127.0.0.1:{ports['telegram']}",
+            "SUPABASE_URL": f"http://127.0.0.1:{ports['supabase']}",
+            "SUPABASE_SERVICE_ROLE_KEY": "load-test",
+            "SUPABASE_PROJECT_REF": "load-test",
+            "SUPABASE_ACCESS_TOKEN": "load-test",
+            "GROQ_API_KEY": "load-test",
+            "GROQ_BASE_URL": f"http://127.0.0.1:{ports['groq']}",
+            "WEBHOOK_URL": "",
+            "NOTIFICATIONS_ENABLED": "false",
+            "CAPTURE_ENABLED": "false",
+            "DATA_DIR": data_dir,
+            # Sin límite de envío real: se mide el bot, no el rate limit de Telegram
+            "TELEGRAM_GLOBAL_RATE": "10000",
+            "TELEGRAM_CHAT_RATE": "1000",
+            "TELEGRAM_CHAT_BURST": "100",
+        }
+    )
+
+    from benchmarks.fakes import agent as fake_agent
+
+    fake_agent.install(
+        connect_latency=args.agent_connect,
+        first_token_latency=args.agent_latency,
+        jitter=args.agent_jitter,
+        tokens=args.agent_tokens,
+    )
+    import main
+
+    # Sin el log de cada request HTTP de la app y los falsos
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    servers = [
+        _serve(
+            fake_telegram.create_app(
+                args.telegram_latency, file_size=args.file_size, pdf_pages=args.pdf_pages
+            ),
+            ports["telegram"],
+        ),
+        _serve(fake_supabase.create_app(args.users, args.orgs, args.db_latency), ports["supabase"]),
+        _serve(fake_groq.create_app(args.stt_latency), ports["groq"]),
+        _serve(main.app, ports["app"]),
+    ]
+
+    latencies: dict[str, list[float]] = defaultdict(list)
+    statuses: Counter = Counter()
+    sampler = ResourceSampler()
+    sampler_task = asyncio.create_task(sampler.run())
+    base_url = f"http://127.0.0.1:{ports['app']}"
+
+    async with httpx.AsyncClient(
+        base_url=base_url,
+        timeout=args.timeout,
+        limits=httpx.Limits(max_connections=None, max_keepalive_connections=100),
+    ) as client:
+
+        async def send(kind: str, update: dict):
+            start = time.perf_counter()
+            try:
+                response = await client.post("/webhook", json=update)
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            statuses[status] += 1
+            if status == "200":
+                latencies[kind].append(time.perf_counter() - start)
+
+        print(label)
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        tasks = [asyncio.create_task(send(kind, update)) async for kind, update in updates]
+        await asyncio.gather(*tasks)
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+
+        stages = (await client.get("/metrics")).json().get("stages", {})
+        telegram_stats = (
+            await client.get(f"http://127.0.0.1:{ports['telegram']}/stats")
+        ).json()
+
+    sampler_task.cancel()
+    for server in reversed(servers):
+        server.should_exit = True
+        server.thread.join(timeout=10)
+
+    all_latencies = [s for samples in latencies.values() for s in samples]
+    return {
+        "config": vars(args),
+        "requests": len(tasks),
+        "ok": len(all_latencies),
+        "statuses": dict(statuses),
+        "duration_s": round(wall, 2),
+        "throughput_rps": round(len(all_latencies) / wall, 2),
+        "latency_ms": _percentiles(all_latencies),
+        "latency_by_kind_ms": {
+            kind: {"n": len(samples), **_percentiles(samples)}
+            for kind, samples in sorted(latencies.items())
+        },
+        "stages_ms": {
+            name: {key: snap[key] for key in ("count", "p50", "p95", "p99")}
+            for name, snap in stages.items()
+        },
+        "resources": {
+            "cpu_percent": round(cpu / wall * 100, 1),
+            "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "max_open_fds": sampler.max_fds,
+            "loop_lag_ms": _percentiles(sampler.lags),
+        },
+        "telegram": telegram_stats,
+    }
+
+
+async def poisson_updates(args) -> AsyncIterator[tuple[str, dict]]:
+    """Updates sintéticos con llegadas Poisson a `args.rate` por segundo"""
+    factory = UpdateFactory(args)
+    rng = random.Random(args.seed)
+    start = next_at = time.perf_counter()
+    while next_at - start < args.duration:
+        await asyncio.sleep(max(next_at - time.perf_counter(), 0))
+        yield factory.next()
+        next_at += rng.expovariate(args.rate)
+
+
+def print_report(report: dict):
+    print(
+        f"\n{report['ok']}/{report['requests']} ok en {report['duration_s']}s "
+        f"-> {report['throughput_rps']} req/s   statuses={report['statuses']}"
+    )
+    lat = report["latency_ms"]
+    print(f"{'total':<22} p50={lat['p50']}ms p95={lat['p95']}ms p99={lat['p99']}ms")
+    for kind, lat in report["latency_by_kind_ms"].items():
+        print(
+            f"{kind:<22} n={lat['n']:<5} "
+            f"p50={lat['p50']}ms p95={lat['p95']}ms p99={lat['p99']}ms"
+        )
+
+    print("\nEtapas (/metrics):")
+    for name, stage in report["stages_ms"].items():
+        print(
+            f"  {name:<24} n={stage['count']:<5} "
+            f"p50={stage['p50']}ms p95={stage['p95']}ms p99={stage['p99']}ms"
+        )
+
+    res = report["resources"]
+    print(
+        f"\nCPU {res['cpu_percent']}%  RSS máx {res['max_rss_mb']} MB  "
+        f"fds máx {res['max_open_fds']}  lag del loop p99={res['loop_lag_ms']['p99']}ms"
+    )
+
+
+def add_environment_args(parser: argparse.ArgumentParser):
+    """Opciones del entorno falso (usuarios, latencias) y del reporte"""
+    parser.add_argument("--users", type=int, default=200, help="usuarios vinculados")
+    parser.add_argument("--orgs", type=int, default=20)
+    parser.add_argument("--agent-connect", type=float, default=0.3)
+    parser.add_argument("--agent-latency", type=float, default=1.5, help="hasta el primer token")
+    parser.add_argument("--agent-jitter", type=float, default=0.5)
+    parser.add_argument("--agent-tokens", type=int, default=200)
+    parser.add_argument("--telegram-latency", type=float, default=0.05)
+    parser.add_argument("--db-latency", type=float, default=0.01)
+    parser.add_argument("--stt-latency", type=float, default=0.5)
+    parser.add_argument("--file-size", type=int, default=32 * 1024)
+    parser.add_argument("--pdf-pages", type=int, default=20, help="páginas de los PDFs falsos")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--json", help="guarda el reporte en este archivo")
+    parser.add_argument(
+        "--fail-p95-ms", type=float, help="sale con código 1 si el p95 total supera este valor"
+    )
+
+
+def finish(args, report: dict):
+    """Imprime y guarda el reporte; falla si se pasó el umbral de p95"""
+    print_report(report)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if args.fail_p95_ms and (report["latency_ms"]["p95"] or 0) > args.fail_p95_ms:
+        raise SystemExit(f"p95 {report['latency_ms']['p95']}ms > {args.fail_p95_ms}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--rate", type=float, default=5.0, help="updates por segundo")
+    parser.add_argument("--duration", type=float, default=30.0, help="segundos de carga")
+    parser.add_argument("--unlinked", type=float, default=0.05, help="fracción no vinculados")
+    parser.add_argument("--voice", type=float, default=0.2, help="fracción de notas de voz")
+    parser.add_argument("--commands", type=float, default=0.05, help="fracción de comandos")
+    parser.add_argument("--seed", type=int, default=1)
+    add_environment_args(parser)
+    args = parser.parse_args()
+
+    label = (
+        f"Carga: {args.rate}/s durante {args.duration}s, {args.users} usuarios "
+        f"(voice={args.voice}, commands={args.commands}, unlinked={args.unlinked})"
+    )
+    finish(args, asyncio.run(drive(args, poisson_updates(args), label)))
@@ -0,0 +1,138 @@
+"""
+Benchmark de extracción de texto de PDFs (contratos de cientos de páginas).
+
+Genera un contrato sintético y mide la extracción con 1 proceso vs el pool
+configurado, el efecto del límite de tiempo y la selección por relevancia.
+
+Uso (desde bot/):
+    python -m benchmarks.pdf_extraction --pages 300 --workers 4
+"""
+
+import argparse
+import asyncio
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from src.config import get_settings
+from src.services.documents import DocumentPipeline, chunk_pages, select_relevant
+
+
+CLAUSES = [
+    "El arrendador da en arriendo al arrendatario el inmueble ubicado en {calle} {numero}.",
+    "La renta mensual de arrendamiento será de {monto} pesos, pagaderos por anticipado.",
+    "El arrendatario entrega en este acto la suma de {monto} pesos por concepto de garantía.",
+    "Serán de cargo del arrendatario los gastos comunes y consumos de agua, luz y gas.",
+    "El arrendatario no podrá subarrendar ni ceder el contrato sin autorización escrita.",
+    "La renta se reajustará cada doce meses según la variación del IPC.",
+    "El atraso en el pago de la renta devengará una multa diaria del {tasa} por ciento.",
+    "Las reparaciones locativas serán de cargo del arrendatario durante toda la vigencia.",
+]
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def build_pdf(pages: int, lines_per_page: int = 45) -> bytes:
+    """PDF mínimo válido con texto (Helvetica, WinAnsi) en cada página"""
+    objects: list[bytes] = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(b"")  # Se completa al final
+    pages_obj = add(b"")
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+
+    page_ids = []
+    for number in range(1, pages + 1):
+        lines = [f"CONTRATO DE ARRENDAMIENTO - PAGINA {number}"]
+        for i in range(lines_per_page):
+            clause = CLAUSES[(number + i) % len(CLAUSES)]
+            lines.append(
+                f"{i + 1}. "
+                + clause.format(calle="Los Aromos", numero=number, monto=450000 + i, tasa=0.5)
+            )
+        text = "BT /F1 9 Tf 11 TL 40 800 Td " + " ".join(
+            f"({_escape(line)}) '" for line in lines
+        ) + " ET"
+        stream = text.encode("cp1252")
+        content = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        page_ids.append(
+            add(
+                b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] "
+                b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>"
+                % (pages_obj, font, content)
+            )
+        )
+
+    kids = b" ".join(b"%d 0 R" % pid for pid in page_ids)
+    objects[catalog - 1] = b"<< /Type /Catalog /Pages %d 0 R >>" % pages_obj
+    objects[pages_obj - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % i + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1,
+        catalog,
+        xref,
+    )
+    return bytes(out)
+
+
+async def bench(pipeline: DocumentPipeline, pdf: bytes, label: str) -> list[str]:
+    # Levantar todos los procesos (spawn) fuera de la medición
+    await pipeline.extract_pages(build_pdf(pipeline.settings.document_workers * 2))
+
+    start = time.perf_counter()
+    pages, truncated, _ = await pipeline.extract_pages(pdf)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{label:<12} {len(pages):4d} pages  {elapsed:6.2f}s  "
+        f"{elapsed / max(len(pages), 1) * 1000:6.1f} ms/page  truncated={truncated}"
+    )
+    return pages
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--query", default="¿De cuánto es la garantía y la multa por atraso?")
+    args = parser.parse_args()
+
+    pdf = build_pdf(args.pages)
+    print(f"PDF sintético: {args.pages} páginas, {len(pdf) / 1024:.0f} KiB")
+
+    settings = get_settings()
+    for workers in sorted({1, args.workers}):
+        settings.document_workers = workers
+        pipeline = DocumentPipeline()
+        try:
+            pages = await bench(pipeline, pdf, f"workers={workers}")
+        finally:
+            pipeline.close()
+
+    start = time.perf_counter()
+    chunks = chunk_pages(pages)
+    selected = select_relevant(chunks, args.query, settings.document_token_budget)
+    elapsed = time.perf_counter() - start
+    print(
+        f"selection    {len(selected)}/{len(chunks)} chunks "
+        f"({sum(c.tokens for c in selected)} tokens)  {elapsed * 1000:.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,142 @@
+"""
+Reproduce una captura de tráfico real del webhook (CAPTURE_ENABLED=true, ver
+src/services/capture.py) contra la app con servicios externos falsos, y
+compara distribuciones de latencia entre versiones.
+
+Los updates se envían respetando sus tiempos de llegada originales, a 1x o
+acelerados (--speed N). Cada usuario de la captura se asigna a un usuario
+vinculado del Supabase falso; audios y PDFs los entrega el Telegram falso y
+el agente es el cliente falso de benchmarks/fakes/agent.py.
+
+Uso (desde bot/):
+    python -m benchmarks.replay .data/capture/updates-20260101-080000.jsonl.gz --json v1.json
+    python -m benchmarks.replay captura.jsonl.gz --speed 4 --json v2.json --baseline v1.json
+    python -m benchmarks.replay --compare v1.json v2.json
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from collections.abc import AsyncIterator
+
+from benchmarks.fakes.supabase import FIRST_TELEGRAM_ID
+from benchmarks.load import add_environment_args, drive, finish
+from src.services.capture import read_capture
+
+
+def classify(update: dict) -> str:
+    if update.get("callback_query"):
+        return "callback"
+    message = update.get("message") or {}
+    text = message.get("text") or ""
+    if text.startswith("/"):
+        return f"command {text}"
+    if text.isdigit():
+        return "selection"
+    if message.get("voice"):
+        return "voice"
+    if message.get("document"):
+        return "document"
+    if message.get("photo"):
+        return "photo"
+    return "text"
+
+
+async def replay_updates(
+    records: list[tuple[float, dict]], speed: float, users: int
+) -> AsyncIterator[tuple[str, dict]]:
+    """Entrega los updates de la captura en sus tiempos (divididos por `speed`)"""
+    user_map: dict[int, int] = {}
+    start = time.perf_counter()
+    first = records[0][0] if records else 0.0
+
+    for offset, update in records:
+        await asyncio.sleep(max(start + (offset - first) / speed - time.perf_counter(), 0))
+
+        callback = update.get("callback_query")
+        message = callback or update["message"]
+        pseudonym = message["from"]["id"]
+        if pseudonym not in user_map:
+            user_map[pseudonym] = FIRST_TELEGRAM_ID + len(user_map) % users
+        message["from"]["id"] = user_map[pseudonym]
+        sent = callback.get("message") if callback else message
+        if sent:
+            sent["date"] = int(time.time())
+        yield classify(update), update
+
+
+def _delta(before: float | None, after: float | None) -> str:
+    if before is None or after is None:
+        return f"{before} -> {after}"
+    change = (after - before) / before * 100 if before else 0.0
+    return f"{before:>8.1f} -> {after:>8.1f}ms ({change:+5.1f}%)"
+
+
+def compare_reports(baseline: dict, current: dict) -> float | None:
+    """Imprime p50/p95/p99 de ambas corridas por tipo; retorna el cambio relativo del p95 total"""
+    rows = [("total", baseline["latency_ms"], current["latency_ms"])]
+    kinds = sorted(set(baseline["latency_by_kind_ms"]) | set(current["latency_by_kind_ms"]))
+    for kind in kinds:
+        rows.append(
+            (
+                kind,
+                baseline["latency_by_kind_ms"].get(kind, {}),
+                current["latency_by_kind_ms"].get(kind, {}),
+            )
+        )
+
+    print(f"\n{'':<22} {'baseline -> actual':^36}")
+    for name, before, after in rows:
+        for p in ("p50", "p95", "p99"):
+            label = name if p == "p50" else ""
+            print(f"{label:<22} {p}  {_delta(before.get(p), after.get(p))}")
+
+    before, after = baseline["latency_ms"]["p95"], current["latency_ms"]["p95"]
+    if not before or after is None:
+        return None
+    return (after - before) / before
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("capture", nargs="?", help="archivo .jsonl.gz de la captura")
+    parser.add_argument("--speed", type=float, default=1.0, help="factor de aceleración")
+    parser.add_argument("--limit", type=int, help="reproduce solo los primeros N updates")
+    parser.add_argument("--baseline", help="reporte JSON de otra versión para comparar")
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        help="sale con código 1 si el p95 total empeora más que esta fracción (p.ej. 0.2)",
+    )
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "ACTUAL"))
+    add_environment_args(parser)
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f, open(args.compare[1]) as g:
+            compare_reports(json.load(f), json.load(g))
+        raise SystemExit(0)
+    if not args.capture:
+        parser.error("falta la captura (o --compare)")
+
+    records = read_capture(args.capture)[: args.limit]
+    if not records:
+        raise SystemExit(f"{args.capture} no tiene updates")
+    span = records[-1][0] - records[0][0]
+    label = (
+        f"Replay: {len(records)} updates de {args.capture} "
+        f"({span:.0f}s a {args.speed}x -> {span / args.speed:.0f}s)"
+    )
+
+    report = asyncio.run(drive(args, replay_updates(records, args.speed, args.users), label))
+    finish(args, report)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regression = compare_reports(json.load(f), report)
+        limit = args.max_regression
+        if limit is not None and regression is not None and regression > limit:
+            raise SystemExit(f"p95 empeoró {regression:+.0%} (máximo {limit:+.0%})")
@@ -0,0 +1,117 @@
+"""
+Perfil de arranque del bot.
+
+1. Imports: corre `python -X importtime -c "import main"` en un proceso nuevo y
+   lista los módulos que más tardan (acumulado, incluye sus dependencias).
+2. Arranque: levanta `uvicorn main:app` en un proceso nuevo, mide el tiempo
+   hasta que /health responde y muestra las fases de `startup` en /metrics.
+
+Usa la configuración de .env con WEBHOOK_URL y notificaciones desactivados
+(no toca el webhook real). Con --prewarm además se conecta a Telegram,
+Supabase y el agente antes de estar listo (necesita credenciales válidas).
+
+Uso (desde bot/):
+    python -m benchmarks.startup
+    python -m benchmarks.startup --prewarm --top 30
+"""
+
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+
+def import_profile(top: int) -> float:
+    """Imprime los `top` módulos más lentos de importar; retorna el total en segundos"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        capture_output=True,
+        text=True,
+        env=_env(prewarm=False),
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        own, cumulative, name = line.removeprefix("import time:").split("|")
+        rows.append((int(cumulative), int(own), name.strip()))
+
+    total = next((c for c, _, name in rows if name == "main"), 0) / 1e6
+    print(f"import main: {total * 1000:.0f}ms\n")
+    print(f"{'acumulado':>10} {'propio':>8}  módulo")
+    for cumulative, own, name in sorted(rows, reverse=True)[:top]:
+        print(f"{cumulative / 1000:>8.0f}ms {own / 1000:>6.0f}ms  {name}")
+    return total
+
+
+def _env(prewarm: bool) -> dict:
+    env = dict(os.environ)
+    env.update(
+        {
+            "WEBHOOK_URL": "",
+            "NOTIFICATIONS_ENABLED": "false",
+            "PREWARM_ENABLED": "true" if prewarm else "false",
+        }
+    )
+    return env
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def boot_profile(prewarm: bool, timeout: float) -> dict | None:
+    """Arranca uvicorn y mide hasta el primer /health; retorna la sección startup de /metrics"""
+    port = _free_port()
+    start = time.monotonic()
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "main:app",
+            "--port", str(port), "--log-level", "warning",
+        ],
+        env=_env(prewarm),
+    )
+    try:
+        while time.monotonic() - start < timeout:
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if process.poll() is not None:
+                print("El servidor terminó antes de responder /health")
+                return None
+            time.sleep(0.02)
+        else:
+            print(f"/health no respondió en {timeout}s")
+            return None
+
+        health = time.monotonic() - start
+        print(f"\n/health respondió {health * 1000:.0f}ms después de lanzar el proceso")
+        report = httpx.get(f"http://127.0.0.1:{port}/metrics", timeout=10).json()["startup"]
+        print(f"Listo (según la app) a los {report['ready_after_ms']}ms:")
+        for name, ms in report["phases_ms"].items():
+            print(f"  {name:<20} {ms:>6}ms")
+        return report
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--top", type=int, default=20, help="módulos a listar")
+    parser.add_argument("--prewarm", action="store_true", help="arranca con PREWARM_ENABLED")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+
+    import_profile(args.top)
+    boot_profile(args.prewarm, args.timeout)
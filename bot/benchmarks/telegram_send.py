@@ -0,0 +1,95 @@
+"""
+Benchmark de latencia por envío hacia la Bot API de Telegram.
+
+Compara un cliente HTTP nuevo por request (handshake TCP + TLS en cada envío)
+contra el pool compartido de TelegramService.
+
+Uso (desde bot/):
+    python -m benchmarks.telegram_send --n 20
+    python -m benchmarks.telegram_send --n 20 --chat-id 123456
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import httpx
+
+from src.services.telegram import get_telegram_service
+
+
+def _report(name: str, samples: list[float]):
+    samples_ms = sorted(s * 1000 for s in samples)
+    p95 = samples_ms[max(int(len(samples_ms) * 0.95) - 1, 0)]
+    print(
+        f"{name:<12} n={len(samples_ms):<4} "
+        f"mean={statistics.mean(samples_ms):7.1f}ms "
+        f"p50={statistics.median(samples_ms):7.1f}ms "
+        f"p95={p95:7.1f}ms "
+        f"first={samples[0] * 1000:7.1f}ms"
+    )
+
+
+async def _request(client: httpx.AsyncClient, base_url: str, chat_id: int | None, i: int):
+    if chat_id is None:
+        response = await client.get(f"{base_url}/getMe")
+    else:
+        response = await client.post(
+            f"{base_url}/sendMessage",
+            json={"chat_id": chat_id, "text": f"benchmark {i}"},
+        )
+    response.raise_for_status()
+
+
+async def bench_per_request(base_url: str, chat_id: int | None, n: int) -> list[float]:
+    """Comportamiento anterior: un AsyncClient por envío"""
+    samples = []
+    for i in range(n):
+        start = time.perf_counter()
+        async with httpx.AsyncClient() as client:
+            await _request(client, base_url, chat_id, i)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+async def bench_pooled(base_url: str, chat_id: int | None, n: int) -> list[float]:
+    """Pool compartido (keep-alive + HTTP/2)"""
+    telegram = get_telegram_service()
+    await telegram.start()
+    samples = []
+    try:
+        for i in range(n):
+            start = time.perf_counter()
+            await _request(telegram.client, base_url, chat_id, i)
+            samples.append(time.perf_counter() - start)
+    finally:
+        await telegram.close()
+    return samples
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n", type=int, default=20, help="Envíos por modo")
+    parser.add_argument(
+        "--chat-id",
+        type=int,
+        default=None,
+        help="Chat al que enviar mensajes; sin él se mide getMe",
+    )
+    args = parser.parse_args()
+
+    base_url = get_telegram_service().base_url
+    endpoint = "sendMessage" if args.chat_id else "getMe"
+    print(f"Endpoint: {endpoint}")
+
+    _report("per-request", await bench_per_request(base_url, args.chat_id, args.n))
+    _report("pooled", await bench_pooled(base_url, args.chat_id, args.n))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
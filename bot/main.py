@@ -1,3 +1,4 @@
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 
@@ -8,9 +9,21 @@ load_dotenv()  # Cargar .env como variables de entorno del proceso
 import uvicorn
 from fastapi import FastAPI
 
+from src.agent.agent import get_agent
 from src.config import get_settings
+from src.services.capture import get_update_recorder
+from src.services.delivery import get_delivery_scheduler
+from src.services.documents import get_document_pipeline
+from src.services.drain import get_drain_coordinator, reap_children
+from src.services.jobs import get_job_queue
+from src.services.notifications import get_notification_engine
+from src.services.pagination import get_result_pager
+from src.services.startup import get_startup_profile, prewarm
+from src.services.summaries import get_summary_materializer
 from src.services.telegram import get_telegram_service
-from src.webhook.handlers import router as webhook_router
+from src.services.tracing import get_tracer
+from src.services.transcription import get_transcription_cache, get_transcription_service
+from src.webhook.handlers import resume_update, router as webhook_router
 
 
 logging.basicConfig(
@@ -19,12 +32,27 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Los clientes pesados (agente, Supabase, Groq, markdown) se importan al primer
+# uso o en el prewarm, así el proceso queda escuchando /health cuanto antes
+startup = get_startup_profile()
+startup.mark("imports")
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Configura el webhook de Telegram al iniciar"""
+    startup.mark("server")
     settings = get_settings()
     telegram = get_telegram_service()
+    await telegram.start()
+    delivery = get_delivery_scheduler()
+    delivery.start()
+    drain = get_drain_coordinator()
+    drain.install_signal_handlers()
+
+    # Antes de registrar el webhook: los updates llegan con todo ya creado
+    if settings.prewarm_enabled:
+        await prewarm(startup)
 
     if settings.webhook_url:
         webhook_url = f"{settings.webhook_url}/webhook"
@@ -36,10 +64,44 @@ async def lifespan(app: FastAPI):
     else:
         logger.warning("WEBHOOK_URL no configurado, el bot no recibirá mensajes")
 
+    notifications_task = None
+    if settings.notifications_enabled:
+        notifications_task = asyncio.create_task(get_notification_engine().run_forever())
+        logger.info(f"Notificación diaria programada a las {settings.notifications_hour}:00")
+
+    summaries_task = None
+    if settings.summaries_enabled:
+        summaries_task = asyncio.create_task(get_summary_materializer().run_forever())
+
+    startup.mark("lifespan")
+    startup.mark_ready()
+
+    # Updates que la instancia anterior no alcanzó a procesar al apagarse
+    resume_task = asyncio.create_task(drain.resume_pending(resume_update))
+
     yield
 
-    # Cleanup al cerrar
+    # Cleanup al cerrar: primero el trabajo en curso (con DRAIN_GRACE_SECONDS),
+    # después los envíos pendientes y los recursos
     logger.info("Cerrando servidor...")
+    await drain.wait()
+    resume_task.cancel()
+    if notifications_task:
+        notifications_task.cancel()
+    if summaries_task:
+        summaries_task.cancel()
+    await get_agent().close()
+    await delivery.stop()
+    await telegram.close()
+    get_transcription_cache().close()
+    get_document_pipeline().close()
+    get_result_pager().close()
+    get_summary_materializer().close()
+    get_update_recorder().close()
+    get_job_queue().close()
+    reaped = await reap_children()
+    removed = telegram.cleanup_temp_files()
+    drain.finish(children_reaped=reaped, temp_files_removed=removed)
 
 
 app = FastAPI(
@@ -62,6 +124,27 @@ async def health():
     return {"status": "healthy"}
 
 
+@app.get("/metrics")
+async def metrics():
+    jobs = None
+    if get_settings().execution_mode == "queue":
+        jobs = await get_job_queue().stats()
+    return {
+        "delivery": get_delivery_scheduler().stats(),
+        "notifications": get_notification_engine().stats(),
+        "summaries": get_summary_materializer().stats(),
+        "pagination": get_result_pager().stats(),
+        "transcription": get_transcription_service().stats(),
+        "transcription_cache": get_transcription_cache().stats(),
+        "document_cache": get_document_pipeline().cache.stats(),
+        "stages": get_tracer().stats(),
+        "capture": get_update_recorder().stats(),
+        "startup": startup.report(),
+        "drain": get_drain_coordinator().stats(),
+        "jobs": jobs,
+    }
+
+
 if __name__ == "__main__":
     settings = get_settings()
     uvicorn.run(
@@ -69,4 +152,6 @@ if __name__ == "__main__":
         host=settings.host,
         port=settings.port,
         reload=False,
+        # uvicorn espera los requests en curso; el drain los corta antes
+        timeout_graceful_shutdown=settings.drain_grace_seconds + 5,
     )
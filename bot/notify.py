@@ -0,0 +1,50 @@
+"""
+Ejecuta la notificación diaria una vez (o retoma la de hoy si se interrumpió).
+
+Uso (desde bot/):
+    python notify.py
+    python notify.py --date 2026-03-01
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+from dataclasses import asdict
+from datetime import date
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from src.services.delivery import get_delivery_scheduler
+from src.services.notifications import get_notification_engine
+from src.services.telegram import get_telegram_service
+
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--date", type=date.fromisoformat, default=None, help="Fecha a notificar")
+    args = parser.parse_args()
+
+    telegram = get_telegram_service()
+    delivery = get_delivery_scheduler()
+    await telegram.start()
+    delivery.start()
+    try:
+        report = await get_notification_engine().run(args.date)
+    finally:
+        await delivery.stop()
+        await telegram.close()
+
+    print(json.dumps(asdict(report), indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,30 +1,62 @@
+import asyncio
 import logging
 import os
-from dataclasses import dataclass
-from datetime import date
-
-from claude_agent_sdk import (
-    ClaudeSDKClient,
-    ClaudeAgentOptions,
-    AssistantMessage,
-    ResultMessage,
-    TextBlock,
-)
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
 
 from src.config import get_settings
-from src.agent.prompts import build_system_prompt
+from src.services.summaries import get_summary_materializer, touches_summary
+from src.services.tracing import get_tracer
+from src.agent.prompts import (
+    COMPACTION_PROMPT,
+    PORTFOLIO_SUMMARY_CONTEXT,
+    build_summary_context,
+    build_system_prompt,
+)
+
+if TYPE_CHECKING:
+    from claude_agent_sdk import ClaudeAgentOptions, ResultMessage
 
 
 logger = logging.getLogger(__name__)
 
 
+def _sdk():
+    """
+    claude_agent_sdk se importa al primer uso (trae mcp y tarda ~0.6 s):
+    el arranque y /health no lo necesitan.
+    """
+    import claude_agent_sdk
+
+    return claude_agent_sdk
+
+
 @dataclass
 class UserSession:
     """Sesión de un usuario con el agente"""
 
-    session_id: str
-    date: date
+    session_id: str | None
     organizacion_id: str
+    context_tokens: int = 0
+    summary: str | None = None  # Resumen de la sesión compactada anterior
+    portfolio_seen: str | None = None  # refreshed_at del resumen de cartera ya enviado
+
+
+@dataclass
+class PreparedTurn:
+    """
+    Turno del agente que se conecta antes de tener el mensaje. El cliente del
+    SDK vive entero en `task` (conectar, consultar y cerrar en la misma tarea,
+    como exige el SDK); el mensaje le llega por `message`.
+    """
+
+    message: asyncio.Future = field(
+        default_factory=lambda: asyncio.get_running_loop().create_future()
+    )
+    task: asyncio.Task | None = None
+    connected: bool = False
+    discarded: bool = False
 
 
 class RealStateAgent:
@@ -33,6 +65,8 @@ class RealStateAgent:
     def __init__(self):
         self.settings = get_settings()
         self.sessions: dict[int, UserSession] = {}  # telegram_id -> session
+        self._compactions: dict[int, asyncio.Task] = {}  # telegram_id -> compactación en curso
+        self._discards: set[asyncio.Task] = set()  # Clientes preparados que se están cerrando
 
     def _get_mcp_servers(self) -> dict:
         """Retorna la configuración de MCP servers"""
@@ -70,27 +104,32 @@ class RealStateAgent:
         org_nombre: str,
         user_nombre: str,
         org_url: str,
-        session_id: str | None = None,
-    ) -> ClaudeAgentOptions:
+        session: UserSession | None = None,
+    ) -> "ClaudeAgentOptions":
         """Crea las opciones del agente"""
+        sdk = _sdk()
         openrouter_env = self._get_openrouter_env()
 
         allowed_tools = ["mcp__supabase__*"]
 
-        if session_id:
+        if session and session.session_id:
             # Resumir sesión existente
-            return ClaudeAgentOptions(
+            return sdk.ClaudeAgentOptions(
                 mcp_servers=self._get_mcp_servers(),
                 permission_mode="acceptEdits",
                 allowed_tools=allowed_tools,
                 model="sonnet",
-                resume=session_id,
+                resume=session.session_id,
                 env=openrouter_env,
             )
         else:
-            # Nueva sesión
-            return ClaudeAgentOptions(
-                system_prompt=build_system_prompt(organizacion_id, org_nombre, user_nombre, org_url),
+            # Nueva sesión (sembrada con el resumen si viene de una compactación)
+            system_prompt = build_system_prompt(organizacion_id, org_nombre, user_nombre, org_url)
+            if session and session.summary:
+                system_prompt += build_summary_context(session.summary)
+
+            return sdk.ClaudeAgentOptions(
+                system_prompt=system_prompt,
                 mcp_servers=self._get_mcp_servers(),
                 permission_mode="acceptEdits",
                 allowed_tools=allowed_tools,
@@ -98,21 +137,29 @@ class RealStateAgent:
                 env=openrouter_env,
             )
 
-    def _get_session(self, telegram_id: int, organizacion_id: str) -> str | None:
+    def _get_session(self, telegram_id: int, organizacion_id: str) -> UserSession | None:
         """
-        Obtiene el session_id si existe una sesión válida para hoy y la misma org.
+        Obtiene la sesión del usuario si existe y corresponde a la misma org.
         """
         session = self.sessions.get(telegram_id)
-        if session and session.date == date.today() and session.organizacion_id == organizacion_id:
-            return session.session_id
+        if session and session.organizacion_id == organizacion_id:
+            return session
         return None
 
-    def _save_session(self, telegram_id: int, session_id: str, organizacion_id: str):
+    def _save_session(
+        self,
+        telegram_id: int,
+        session_id: str,
+        organizacion_id: str,
+        context_tokens: int = 0,
+        portfolio_seen: str | None = None,
+    ):
         """Guarda la sesión del usuario"""
         self.sessions[telegram_id] = UserSession(
             session_id=session_id,
-            date=date.today(),
             organizacion_id=organizacion_id,
+            context_tokens=context_tokens,
+            portfolio_seen=portfolio_seen,
         )
 
     def _clear_session(self, telegram_id: int):
@@ -120,6 +167,147 @@ class RealStateAgent:
         if telegram_id in self.sessions:
             del self.sessions[telegram_id]
 
+    @staticmethod
+    def _estimate_context_tokens(result: "ResultMessage") -> int:
+        """
+        Estima el tamaño del contexto de la sesión a partir del uso reportado.
+
+        El uso del ResultMessage acumula todas las llamadas del turno (una por
+        cada tool call), así que se promedia por número de turnos.
+        """
+        usage = result.usage or {}
+        total = (
+            usage.get("input_tokens", 0)
+            + usage.get("cache_creation_input_tokens", 0)
+            + usage.get("cache_read_input_tokens", 0)
+        )
+        return total // max(result.num_turns or 1, 1)
+
+    async def _await_compaction(self, telegram_id: int):
+        """Espera una compactación en curso antes de usar la sesión"""
+        task = self._compactions.get(telegram_id)
+        if task is None:
+            return
+        try:
+            await task
+        except Exception:
+            pass  # _compact_session ya registra y limpia la sesión
+
+    def _schedule_compaction(self, telegram_id: int, session: UserSession):
+        """Lanza la compactación en segundo plano para no retrasar la respuesta"""
+        if telegram_id in self._compactions:
+            return
+
+        task = asyncio.create_task(self._compact_session(telegram_id, session))
+        self._compactions[telegram_id] = task
+        task.add_done_callback(lambda _: self._compactions.pop(telegram_id, None))
+
+    async def _compact_session(self, telegram_id: int, session: UserSession):
+        """
+        Resume la sesión en un texto corto y la reemplaza por una sesión nueva
+        que parte con el system prompt y ese resumen.
+        """
+        sdk = _sdk()
+        options = sdk.ClaudeAgentOptions(
+            permission_mode="acceptEdits",
+            allowed_tools=[],
+            model="sonnet",
+            resume=session.session_id,
+            max_turns=1,
+            env=self._get_openrouter_env(),
+        )
+
+        summary = ""
+        try:
+            async with sdk.ClaudeSDKClient(options=options) as client:
+                await client.query(COMPACTION_PROMPT)
+
+                async for msg in client.receive_response():
+                    if isinstance(msg, sdk.AssistantMessage):
+                        for block in msg.content:
+                            if isinstance(block, sdk.TextBlock):
+                                summary += block.text
+        except Exception as e:
+            logger.error(f"Error compacting session for {telegram_id}: {e}")
+
+        current = self.sessions.get(telegram_id)
+        if not current or current.session_id != session.session_id:
+            # La sesión cambió mientras resumíamos (p.ej. cambio de org)
+            return
+
+        if not summary.strip():
+            # Sin resumen no podemos seguir creciendo: partir de cero
+            self._clear_session(telegram_id)
+            return
+
+        logger.info(
+            f"Session compacted for {telegram_id}: "
+            f"{session.context_tokens} tokens -> {len(summary)} chars"
+        )
+        self.sessions[telegram_id] = UserSession(
+            session_id=None,
+            organizacion_id=session.organizacion_id,
+            summary=summary.strip(),
+        )
+
+    async def close(self):
+        """Cancela las compactaciones en curso (al apagar); las sesiones quedan sin compactar"""
+        tasks = list(self._compactions.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, *self._discards, return_exceptions=True)
+
+    async def prewarm(self):
+        """
+        Arranca y cierra un cliente del agente sin consultar al modelo: importa
+        el SDK, localiza el CLI y resuelve el paquete del MCP de Supabase
+        (npx), costos que si no paga el primer mensaje del usuario.
+        """
+        sdk = _sdk()
+        options = sdk.ClaudeAgentOptions(
+            mcp_servers=self._get_mcp_servers(),
+            permission_mode="acceptEdits",
+            allowed_tools=["mcp__supabase__*"],
+            model="sonnet",
+            env=self._get_openrouter_env(),
+        )
+        async with sdk.ClaudeSDKClient(options=options):
+            pass
+
+    def prepare(
+        self,
+        telegram_id: int,
+        organizacion_id: str,
+        org_nombre: str,
+        user_nombre: str,
+        org_url: str,
+    ) -> PreparedTurn:
+        """
+        Empieza a conectar el cliente del agente para el siguiente turno del
+        usuario (espera una compactación en curso, arma las opciones con la
+        sesión a retomar y levanta el CLI con el MCP) sin necesitar aún el
+        mensaje. Se completa con `process_message` o se descarta con `discard`.
+        """
+        turn = PreparedTurn()
+        turn.task = asyncio.create_task(
+            self._run_turn(turn, telegram_id, organizacion_id, org_nombre, user_nombre, org_url)
+        )
+        return turn
+
+    def discard(self, turn: PreparedTurn):
+        """
+        Descarta un turno preparado cuyo mensaje no llega al agente. A medio
+        conectar se deja terminar la conexión y el cliente se cierra en su
+        propia tarea, para no dejar el CLI colgando; ya conectado, se cancela.
+        """
+        turn.discarded = True
+        if not turn.message.done():
+            turn.message.set_result(None)
+        if turn.connected:
+            turn.task.cancel()
+        self._discards.add(turn.task)
+        turn.task.add_done_callback(self._discards.discard)
+
     async def process_message(
         self,
         telegram_id: int,
@@ -128,39 +316,113 @@ class RealStateAgent:
         org_nombre: str,
         user_nombre: str,
         org_url: str,
+        prepared: PreparedTurn | None = None,
     ) -> str:
         """
         Procesa un mensaje del usuario y retorna la respuesta del agente.
+        `prepared` es un `prepare` ya lanzado (p.ej. mientras se transcribía
+        el audio); si no se pasa, se conecta aquí.
         """
-        # Intentar resumir sesión existente
-        existing_session_id = self._get_session(telegram_id, organizacion_id)
-
-        options = self._create_options(
-            organizacion_id=organizacion_id,
-            org_nombre=org_nombre,
-            user_nombre=user_nombre,
-            org_url=org_url,
-            session_id=existing_session_id,
+        turn = prepared or self.prepare(
+            telegram_id, organizacion_id, org_nombre, user_nombre, org_url
         )
+        turn.message.set_result(message)
+        try:
+            return await asyncio.shield(turn.task)
+        except asyncio.CancelledError:
+            # Drain o job devuelto a la cola
+            self.discard(turn)
+            raise
 
+    async def _run_turn(
+        self,
+        turn: PreparedTurn,
+        telegram_id: int,
+        organizacion_id: str,
+        org_nombre: str,
+        user_nombre: str,
+        org_url: str,
+    ) -> str:
+        tracer = get_tracer()
+        sdk = _sdk()
         response_text = ""
-        new_session_id = None
+        result: "ResultMessage | None" = None
+        wrote_summary_tables = False
 
         try:
-            async with ClaudeSDKClient(options=options) as client:
+            # Intentar resumir sesión existente (o la sembrada por una compactación)
+            with tracer.span("agent.compaction_wait"):
+                await self._await_compaction(telegram_id)
+            session = self._get_session(telegram_id, organizacion_id)
+
+            options = self._create_options(
+                organizacion_id=organizacion_id,
+                org_nombre=org_nombre,
+                user_nombre=user_nombre,
+                org_url=org_url,
+                session=session,
+            )
+
+            connect_start = time.perf_counter()
+            async with sdk.ClaudeSDKClient(options=options) as client:
+                tracer.record("agent.connect", time.perf_counter() - connect_start, connect_start)
+                turn.connected = True
+                message = await turn.message
+                if message is None or turn.discarded:
+                    return ""
+
+                # Cifras de la cartera precalculadas: solo si la sesión no tiene las actuales
+                portfolio = None
+                if self.settings.summaries_enabled:
+                    portfolio = await get_summary_materializer().get(organizacion_id)
+                if portfolio and (
+                    session is None or session.portfolio_seen != portfolio.refreshed_at
+                ):
+                    message = PORTFOLIO_SUMMARY_CONTEXT.format(**portfolio.values()) + message
+
+                query_start = time.perf_counter()
                 await client.query(message)
 
                 async for msg in client.receive_response():
-                    if isinstance(msg, AssistantMessage):
+                    if isinstance(msg, sdk.AssistantMessage):
                         for block in msg.content:
-                            if isinstance(block, TextBlock):
+                            if isinstance(block, sdk.TextBlock):
+                                if not response_text:
+                                    tracer.record(
+                                        "agent.first_token",
+                                        time.perf_counter() - query_start,
+                                        query_start,
+                                    )
                                 response_text += block.text
-                    elif isinstance(msg, ResultMessage):
-                        new_session_id = msg.session_id
+                            elif isinstance(block, sdk.ToolUseBlock):
+                                query = str((block.input or {}).get("query", ""))
+                                wrote_summary_tables |= touches_summary(query)
+                    elif isinstance(msg, sdk.ResultMessage):
+                        result = msg
+                tracer.record("agent.turn", time.perf_counter() - query_start, query_start)
+
+            if wrote_summary_tables:
+                await get_summary_materializer().invalidate(organizacion_id)
+
+            if result:
+                tracer.annotate(
+                    agent_turns=result.num_turns,
+                    resumed=bool(session and session.session_id),
+                )
 
             # Guardar sesión para futuros mensajes
-            if new_session_id:
-                self._save_session(telegram_id, new_session_id, organizacion_id)
+            if result and result.session_id:
+                context_tokens = self._estimate_context_tokens(result)
+                self._save_session(
+                    telegram_id,
+                    result.session_id,
+                    organizacion_id,
+                    context_tokens,
+                    portfolio_seen=portfolio.refreshed_at if portfolio else None,
+                )
+
+                if context_tokens > self.settings.session_max_tokens:
+                    self._schedule_compaction(telegram_id, self.sessions[telegram_id])
 
             return response_text or "No pude procesar tu mensaje. Intenta de nuevo."
 
@@ -147,6 +147,7 @@ Puedes ayudar con:
 - Usa emojis para hacer las respuestas más visuales
 - Puedes usar markdown estándar: **negrita**, *cursiva*, `código`, listas con - o •
 - Para listas usa viñetas simples (•, -)
+- Si piden un listado completo ("todas las propiedades", "todos los vouchers"), incluye todos los elementos, uno por viñeta o número: el bot lo divide en páginas con botones, no lo resumas ni lo cortes
 - Confirma las acciones realizadas
 - Si hay ambigüedad, pregunta antes de actuar
 
@@ -174,6 +175,34 @@ Responde siempre en español chileno, de forma amigable y profesional.
 """
 
 
+def build_summary_context(summary: str) -> str:
+    """
+    Sección que se agrega al system prompt de una sesión compactada.
+    """
+    return f"""
+
+## RESUMEN DE LA CONVERSACIÓN ANTERIOR
+
+La conversación previa con este usuario se resumió para mantener el contexto acotado.
+Úsalo como contexto; no lo repitas salvo que el usuario lo pida.
+
+{summary}
+"""
+
+
+COMPACTION_PROMPT = """
+Resume esta conversación para continuarla en una sesión nueva. No uses herramientas.
+
+Incluye solo lo necesario para seguir atendiendo al usuario:
+• Qué está haciendo y qué pidió (tareas pendientes o en curso)
+• Entidades mencionadas con sus IDs (propiedades, contratos, vouchers, arrendatarios, etc.)
+• Acciones ya realizadas y confirmaciones dadas
+• Preferencias o aclaraciones que dio el usuario
+
+Responde solo con el resumen, en viñetas y en menos de 400 palabras.
+"""
+
+
 UNLINKED_USER_MESSAGE = """
 Hola! No tengo tu cuenta vinculada todavía.
 
@@ -215,3 +244,54 @@ Selecciona la organización con la que quieres trabajar:
 
 Responde con el número de la organización.
 """
+
+
+DAILY_DIGEST_MESSAGE = """
+☀️ {saludo}
+
+Esto es lo que requiere atención hoy en **{org_nombre}**:
+
+{sections}
+
+Escríbeme si quieres el detalle de alguno.
+"""
+
+DAILY_DIGEST_OVERDUE = "🔴 **Vouchers vencidos: {count}** (total {total})"
+
+DAILY_DIGEST_DUE_SOON = "🟡 **Vouchers que vencen en los próximos {days} días: {count}**"
+
+DAILY_DIGEST_CONTRACTS = "📄 **Contratos que terminan en los próximos {days} días: {count}**"
+
+
+INTERRUPTED_NOTE = """
+
+[Nota del sistema: este mensaje se empezó a procesar antes de un reinicio del \
+servidor y no alcanzó a responderse. Antes de crear o modificar registros, \
+verifica si esos cambios ya se hicieron para no repetirlos.]"""
+
+
+PORTFOLIO_SUMMARY_CONTEXT = """[Resumen de la cartera de la organización (actualizado {refreshed_at}):
+- Deuda vencida: {overdue_total} en {overdue_count} vouchers vencidos
+- Por cobrar hasta fin de mes: {due_total} en {due_count} vouchers
+- Contratos que terminan este mes: {contracts}
+- Payouts pendientes: {payouts_count} por {payouts_total}
+Usa estas cifras para preguntas generales de la cartera sin consultar la base de \
+datos. Consulta la base solo para detalles (qué vouchers, qué propiedades) o si \
+acabas de modificar datos.]
+
+"""
+
+
+PORTFOLIO_SUMMARY_MESSAGE = """
+📊 **Resumen de {org_nombre}** (al {refreshed_at})
+
+🔴 Deuda vencida: **{overdue_total}** en {overdue_count} vouchers
+🟡 Por cobrar hasta fin de mes: **{due_total}** en {due_count} vouchers
+📄 Contratos que terminan este mes: **{contracts}**
+💸 Payouts pendientes: **{payouts_count}** por {payouts_total}
+
+Pregúntame si quieres el detalle de alguno.
+"""
+
+
+PAGE_EXPIRED_MESSAGE = "Estos resultados ya no están disponibles. Vuelve a preguntar."
@@ -4,6 +4,15 @@ from pydantic_settings import BaseSettings
 class Settings(BaseSettings):
     # Telegram
     telegram_bot_token: str
+    telegram_api_url: str = "https://api.telegram.org"  # Para apuntar a un servidor falso
+
+    # Límites de envío de la Bot API (mensajes por segundo)
+    telegram_global_rate: float = 30.0
+    telegram_chat_rate: float = 1.0
+    telegram_chat_burst: int = 3
+
+    # Tamaño máximo de descarga (la Bot API no entrega archivos de más de 20 MB)
+    max_download_bytes: int = 20 * 1024 * 1024
 
     # Supabase MCP
     supabase_project_ref: str
@@ -15,6 +24,63 @@ class Settings(BaseSettings):
 
     # Groq
     groq_api_key: str
+    groq_base_url: str | None = None  # Para apuntar a un endpoint falso en pruebas
+    transcription_concurrency: int = 8
+    transcription_timeout: float = 60.0
+    transcription_max_retries: int = 2
+    transcription_cache_size: int = 5000
+    audio_split_min_seconds: int = 45  # Notas de voz desde este largo se cortan en chunks
+    audio_chunk_seconds: float = 30.0
+
+    # Agente
+    session_max_tokens: int = 60_000  # Umbral de contexto para compactar la sesión
+
+    # Documentos PDF
+    document_workers: int = 2  # Procesos para extraer texto
+    document_max_pages: int = 500
+    document_timeout: float = 60.0
+    document_token_budget: int = 6000  # Tokens del documento que se envían al agente
+    document_cache_size: int = 500
+
+    # Notificación diaria
+    notifications_enabled: bool = False
+    notifications_hour: int = 8  # Hora local de envío
+    notifications_voucher_days: int = 3  # Vouchers que vencen dentro de N días
+    notifications_contract_days: int = 30  # Contratos que terminan dentro de N días
+    timezone: str = "America/Santiago"
+
+    # Respuestas con listas largas: se paginan con botones desde DATA_DIR/pages.db
+    pagination_page_items: int = 10
+    pagination_ttl_minutes: int = 60
+
+    # Resúmenes por organización (deuda, vencidos, contratos, payouts) precalculados
+    # para el agente y /resumen
+    summaries_enabled: bool = True
+    summaries_refresh_minutes: int = 10
+
+    # Tracing: requests más lentos que esto se registran completos en el log
+    trace_slow_seconds: float = 15.0
+
+    # Captura de updates (sanitizados) para reproducirlos en benchmarks/replay.py
+    capture_enabled: bool = False
+
+    # Arranque: crear conexiones y clientes (Telegram, Supabase, agente) antes de estar listo
+    prewarm_enabled: bool = False
+    prewarm_timeout: float = 30.0
+
+    # Apagado: tiempo que se espera a los turnos del agente en curso antes de
+    # guardarlos para la siguiente instancia (debe ser menor al stop timeout del deploy)
+    drain_grace_seconds: float = 25.0
+
+    # Ejecución: "inline" procesa los mensajes en el proceso del webhook; "queue" los
+    # encola en DATA_DIR/jobs.db para los workers (python worker.py)
+    execution_mode: str = "inline"
+    worker_concurrency: int = 4  # Jobs simultáneos por proceso worker
+    worker_poll_interval: float = 0.2  # Espera entre consultas a la cola vacía
+    worker_heartbeat_timeout: float = 30.0  # Sin latido por más que esto, sus jobs se reencolan
+
+    # Estado local (checkpoints, caches)
+    data_dir: str = ".data"
 
     # Server
     webhook_url: str | None = None
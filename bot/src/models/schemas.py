@@ -49,9 +49,21 @@ class TelegramMessage(BaseModel):
     model_config = {"populate_by_name": True}
 
 
+class TelegramCallbackQuery(BaseModel):
+    """Pulsación de un botón de un inline keyboard"""
+
+    id: str
+    from_user: TelegramUser = Field(alias="from")
+    message: TelegramMessage | None = None  # Mensaje que tiene el botón
+    data: str | None = None
+
+    model_config = {"populate_by_name": True}
+
+
 class TelegramUpdate(BaseModel):
     update_id: int
     message: TelegramMessage | None = None
+    callback_query: TelegramCallbackQuery | None = None
 
 
 # ============== App Models ==============
@@ -0,0 +1,201 @@
+import asyncio
+import logging
+import math
+import shutil
+from array import array
+from dataclasses import dataclass
+
+from src.config import get_settings
+
+
+logger = logging.getLogger(__name__)
+
+# Formato de trabajo: PCM 16 bits mono a 16 kHz (lo que usa Whisper internamente)
+SAMPLE_RATE = 16_000
+BYTES_PER_SAMPLE = 2
+FRAME_MS = 30
+FRAME_SAMPLES = SAMPLE_RATE * FRAME_MS // 1000
+
+# Umbral de silencio relativo al nivel del audio y mínimos de duración
+SILENCE_RATIO = 0.1
+SILENCE_FLOOR_RMS = 200
+MIN_SILENCE_MS = 700  # Pausas más cortas no se consideran cortes
+KEEP_SILENCE_MS = 200  # Margen que se deja alrededor de la voz
+
+FFMPEG_TIMEOUT = 60.0
+
+
+class AudioProcessingError(Exception):
+    """ffmpeg no está disponible o no pudo procesar el audio"""
+
+
+@dataclass
+class AudioChunk:
+    """Tramo de voz del audio, en muestras del PCM de trabajo"""
+
+    start: int
+    end: int
+
+    @property
+    def duration(self) -> float:
+        return (self.end - self.start) / SAMPLE_RATE
+
+
+def ffmpeg_available() -> bool:
+    return shutil.which("ffmpeg") is not None
+
+
+async def _ffmpeg(args: list[str], data: bytes) -> bytes:
+    """Ejecuta ffmpeg leyendo de stdin y escribiendo a stdout"""
+    process = await asyncio.create_subprocess_exec(
+        "ffmpeg",
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        *args,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(data), FFMPEG_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise AudioProcessingError("ffmpeg timed out")
+    finally:
+        # Timeout o cancelación (mensaje descartado, drain): no dejar ffmpeg corriendo
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+
+    if process.returncode != 0:
+        raise AudioProcessingError(stderr.decode(errors="replace").strip()[:300])
+    return stdout
+
+
+async def decode_to_pcm(audio: bytes) -> bytes:
+    """Decodifica cualquier formato (OGG/Opus de Telegram) a PCM s16le mono 16 kHz"""
+    return await _ffmpeg(
+        ["-i", "pipe:0", "-ac", "1", "-ar", str(SAMPLE_RATE), "-f", "s16le", "pipe:1"],
+        audio,
+    )
+
+
+async def encode_opus(pcm: bytes) -> bytes:
+    """Codifica PCM de trabajo a OGG/Opus de voz (mucho más liviano que WAV para subir)"""
+    return await _ffmpeg(
+        [
+            "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "-i", "pipe:0",
+            "-c:a", "libopus", "-b:a", "24k", "-application", "voip",
+            "-f", "ogg", "pipe:1",
+        ],
+        pcm,
+    )
+
+
+def _frame_levels(samples: array) -> list[float]:
+    """RMS de cada frame de FRAME_MS"""
+    levels = []
+    for i in range(0, len(samples), FRAME_SAMPLES):
+        frame = samples[i : i + FRAME_SAMPLES]
+        levels.append(math.sqrt(sum(s * s for s in frame) / len(frame)))
+    return levels
+
+
+def find_speech_chunks(pcm: bytes, max_chunk_seconds: float) -> list[AudioChunk]:
+    """
+    Detecta los tramos de voz del PCM y los agrupa en chunks de hasta
+    `max_chunk_seconds`, cortando siempre en un silencio (salvo que un tramo
+    de voz continua sea más largo que el máximo). Los silencios largos quedan
+    fuera de los chunks.
+    """
+    samples = array("h")
+    samples.frombytes(pcm[: len(pcm) - len(pcm) % BYTES_PER_SAMPLE])
+    if not samples:
+        return []
+
+    levels = _frame_levels(samples)
+    ordered = sorted(levels)
+    # Nivel de referencia: percentil 90 (la voz), robusto a picos
+    reference = ordered[int(len(ordered) * 0.9)]
+    threshold = max(reference * SILENCE_RATIO, SILENCE_FLOOR_RMS)
+
+    min_silence_frames = MIN_SILENCE_MS // FRAME_MS
+    keep = KEEP_SILENCE_MS * SAMPLE_RATE // 1000
+
+    # Tramos de voz separados por silencios de al menos MIN_SILENCE_MS
+    segments: list[AudioChunk] = []
+    start = None
+    silent = 0
+    for i, level in enumerate(levels):
+        if level >= threshold:
+            if start is None:
+                start = i
+            silent = 0
+        elif start is not None:
+            silent += 1
+            if silent >= min_silence_frames:
+                segments.append(AudioChunk(start * FRAME_SAMPLES, (i - silent + 1) * FRAME_SAMPLES))
+                start = None
+                silent = 0
+    if start is not None:
+        segments.append(AudioChunk(start * FRAME_SAMPLES, (len(levels) - silent) * FRAME_SAMPLES))
+
+    total = len(samples)
+    segments = [
+        AudioChunk(max(seg.start - keep, 0), min(seg.end + keep, total)) for seg in segments
+    ]
+
+    # Agrupar tramos consecutivos hasta el máximo por chunk
+    max_samples = int(max_chunk_seconds * SAMPLE_RATE)
+    chunks: list[AudioChunk] = []
+    for seg in segments:
+        if chunks and seg.end - chunks[-1].start <= max_samples:
+            chunks[-1].end = seg.end
+            continue
+        # Voz continua más larga que el máximo: corte duro
+        for cut in range(seg.start, seg.end, max_samples):
+            chunks.append(AudioChunk(cut, min(cut + max_samples, seg.end)))
+    return chunks
+
+
+class AudioPipeline:
+    """
+    Preprocesa notas de voz largas para transcribirlas en paralelo:
+    downmix y resampleo a 16 kHz mono, recorte de silencios largos y corte
+    en silencios en chunks de hasta AUDIO_CHUNK_SECONDS, re-codificados a Opus.
+    """
+
+    def __init__(self):
+        settings = get_settings()
+        self.min_duration = settings.audio_split_min_seconds
+        self.max_chunk_seconds = settings.audio_chunk_seconds
+
+    def should_split(self, duration: int | None) -> bool:
+        """Solo vale la pena para audios largos y si hay ffmpeg"""
+        return bool(duration and duration >= self.min_duration) and ffmpeg_available()
+
+    async def split(self, audio: bytes) -> list[bytes]:
+        """Retorna los chunks de voz del audio, en orden, codificados en OGG/Opus"""
+        pcm = await decode_to_pcm(audio)
+        chunks = await asyncio.to_thread(find_speech_chunks, pcm, self.max_chunk_seconds)
+
+        logger.info(
+            f"Audio split: {len(pcm) / BYTES_PER_SAMPLE / SAMPLE_RATE:.1f}s -> "
+            f"{len(chunks)} chunks ({sum(c.duration for c in chunks):.1f}s of speech)"
+        )
+        return await asyncio.gather(
+            *(
+                encode_opus(pcm[c.start * BYTES_PER_SAMPLE : c.end * BYTES_PER_SAMPLE])
+                for c in chunks
+            )
+        )
+
+
+_audio_pipeline: AudioPipeline | None = None
+
+
+def get_audio_pipeline() -> AudioPipeline:
+    global _audio_pipeline
+    if _audio_pipeline is None:
+        _audio_pipeline = AudioPipeline()
+    return _audio_pipeline
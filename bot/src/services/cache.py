@@ -0,0 +1,99 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+
+class PersistentLRUCache:
+    """
+    Cache clave -> texto persistida en SQLite, con tamaño máximo y desalojo LRU.
+
+    Sobrevive a reinicios y deploys (vive en DATA_DIR). Las operaciones se
+    ejecutan en un thread para no bloquear el event loop.
+    """
+
+    def __init__(self, path: str | Path, max_entries: int):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self._entries = 0
+
+        # Métricas
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache(accessed_at)")
+            self._entries = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            self._conn = conn
+        return self._conn
+
+    def _get(self, key: str) -> str | None:
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def _set(self, key: str, value: str):
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT INTO cache (key, value, accessed_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, "
+                "accessed_at = excluded.accessed_at",
+                (key, value, time.time()),
+            )
+            self._entries = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+            overflow = self._entries - self.max_entries
+            if overflow > 0:
+                conn.execute(
+                    "DELETE FROM cache WHERE key IN "
+                    "(SELECT key FROM cache ORDER BY accessed_at LIMIT ?)",
+                    (overflow,),
+                )
+                self._entries -= overflow
+                self.evictions += overflow
+            conn.commit()
+
+    async def get(self, key: str) -> str | None:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: str):
+        await asyncio.to_thread(self._set, key, value)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": self._entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "evictions": self.evictions,
+        }
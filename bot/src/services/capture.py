@@ -0,0 +1,196 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+
+from src.config import get_settings
+
+
+logger = logging.getLogger(__name__)
+
+CAPTURE_VERSION = 1
+FLUSH_EVERY = 50  # Updates por flush del gzip (un flush por línea empeora la compresión)
+FILLER = "texto de ejemplo "
+
+
+def _digest(value, salt: bytes) -> str:
+    return hashlib.sha256(salt + str(value).encode()).hexdigest()[:16]
+
+
+def _redact_text(text: str) -> str:
+    """
+    Reemplaza el texto por relleno del mismo largo. Se conservan los comandos
+    (sin argumentos) y las respuestas numéricas cortas (selección de
+    organización), que cambian el camino que sigue el update.
+    """
+    stripped = text.strip()
+    if stripped.startswith("/"):
+        return stripped.split()[0].split("@")[0]
+    if stripped.isdigit() and len(stripped) <= 3:
+        return stripped
+    return (FILLER * (len(text) // len(FILLER) + 1))[: len(text)]
+
+
+def _redact_file(file: dict, kind: str, salt: bytes) -> dict:
+    """Ids de archivo seudonimizados (el mismo archivo mantiene el mismo id) y solo metadatos"""
+    pseudonym = f"{kind}-{_digest(file.get('file_unique_id'), salt)}"
+    redacted = {"file_id": pseudonym, "file_unique_id": pseudonym}
+    for key in ("duration", "mime_type", "file_size", "width", "height"):
+        if key in file:
+            redacted[key] = file[key]
+    return redacted
+
+
+def _sanitize_user(user: dict, salt: bytes) -> dict:
+    return {"id": int(_digest(user["id"], salt)[:12], 16), "is_bot": False, "first_name": "Usuario"}
+
+
+def _sanitize_callback(callback: dict, salt: bytes) -> dict:
+    """
+    Pulsación de botón: se conserva `data` (solo la generan los botones del
+    bot, p.ej. "pg:<clave>:<página>") y el id del mensaje que tiene el botón.
+    """
+    sanitized = {
+        "id": _digest(callback.get("id"), salt),
+        "from": _sanitize_user(callback["from"], salt),
+    }
+    if callback.get("data"):
+        sanitized["data"] = callback["data"]
+    if callback.get("message"):
+        sanitized["message"] = {"message_id": callback["message"].get("message_id", 0), "date": 0}
+    return sanitized
+
+
+def sanitize_update(update: dict, salt: bytes) -> dict | None:
+    """
+    Versión del update sin datos personales: solo los campos que usa el bot,
+    con el texto reemplazado, el usuario y los archivos seudonimizados con
+    `salt`. None si el update no trae un mensaje ni una pulsación de botón.
+    """
+    callback = update.get("callback_query")
+    if callback and callback.get("from"):
+        return {
+            "update_id": update.get("update_id", 0),
+            "callback_query": _sanitize_callback(callback, salt),
+        }
+
+    message = update.get("message")
+    if not message or not message.get("from"):
+        return None
+
+    sanitized = {
+        "message_id": message.get("message_id", 0),
+        "from": _sanitize_user(message["from"], salt),
+        "date": 0,
+    }
+    if message.get("text"):
+        sanitized["text"] = _redact_text(message["text"])
+    if message.get("caption"):
+        sanitized["caption"] = _redact_text(message["caption"])
+    if message.get("voice"):
+        sanitized["voice"] = _redact_file(message["voice"], "voice", salt)
+    if message.get("document"):
+        document = _redact_file(message["document"], "document", salt)
+        extension = Path(message["document"].get("file_name") or "").suffix
+        document["file_name"] = f"documento{extension}"
+        sanitized["document"] = document
+    if message.get("photo"):
+        sanitized["photo"] = [_redact_file(p, "photo", salt) for p in message["photo"]]
+
+    return {"update_id": update.get("update_id", 0), "message": sanitized}
+
+
+class UpdateRecorder:
+    """
+    Graba los updates del webhook, sanitizados y con su instante de llegada,
+    en DATA_DIR/capture/updates-<inicio>.jsonl.gz (una línea JSON por update:
+    {"t": segundos desde el inicio, "update": ...}). La sal de los seudónimos
+    es aleatoria por archivo y no se guarda.
+    """
+
+    def __init__(self):
+        settings = get_settings()
+        self.enabled = settings.capture_enabled
+        self.directory = Path(settings.data_dir) / "capture"
+        self.salt = os.urandom(16)
+        self.path: Path | None = None
+        self.recorded = 0
+        self._file = None
+        self._started = 0.0
+
+    def _open(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.path = self.directory / f"updates-{datetime.now():%Y%m%d-%H%M%S}.jsonl.gz"
+        self._file = gzip.open(self.path, "at", encoding="utf-8")
+        self._started = time.monotonic()
+        self._file.write(
+            json.dumps({"version": CAPTURE_VERSION, "started_at": datetime.now().isoformat()})
+            + "\n"
+        )
+        logger.info(f"Capturing webhook updates to {self.path}")
+
+    def record(self, update: dict):
+        """Graba un update tal como llegó al webhook (se sanitiza aquí)"""
+        if not self.enabled:
+            return
+        try:
+            sanitized = sanitize_update(update, self.salt)
+            if sanitized is None:
+                return
+            if self._file is None:
+                self._open()
+
+            offset = round(time.monotonic() - self._started, 3)
+            self._file.write(json.dumps({"t": offset, "update": sanitized}) + "\n")
+            self.recorded += 1
+            if self.recorded % FLUSH_EVERY == 0:
+                self._file.flush()
+        except Exception as e:
+            # La captura nunca debe afectar la atención del mensaje
+            logger.error(f"Error capturing update: {e!r}")
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "path": str(self.path) if self.path else None,
+            "recorded": self.recorded,
+        }
+
+
+def read_capture(path: str | Path) -> list[tuple[float, dict]]:
+    """
+    Lee una captura: lista de (segundos desde el inicio, update). Tolera un
+    archivo cortado (proceso terminado sin cerrar el gzip).
+    """
+    records = []
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break  # Última línea incompleta
+                if "update" in record:
+                    records.append((record["t"], record["update"]))
+    except (EOFError, gzip.BadGzipFile) as e:
+        logger.warning(f"Capture {path} is truncated after {len(records)} updates: {e}")
+    return records
+
+
+_update_recorder: UpdateRecorder | None = None
+
+
+def get_update_recorder() -> UpdateRecorder:
+    global _update_recorder
+    if _update_recorder is None:
+        _update_recorder = UpdateRecorder()
+    return _update_recorder
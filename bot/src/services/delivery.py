@@ -0,0 +1,459 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import random
+import time
+from dataclasses import dataclass, field
+from enum import IntEnum
+
+import httpx
+
+from src.config import get_settings
+from src.services.metrics import LatencyWindow
+from src.services.telegram import TelegramService, get_telegram_service
+
+
+logger = logging.getLogger(__name__)
+
+# Reintentos ante errores transitorios (red / 5xx)
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.5
+# Máximo de 429 seguidos antes de dar el envío por perdido
+MAX_RATE_LIMITED = 5
+# 429 en al menos GLOBAL_FLOOD_CHATS chats distintos dentro de GLOBAL_FLOOD_WINDOW
+# segundos: se trata como el límite global del bot
+GLOBAL_FLOOD_CHATS = 3
+GLOBAL_FLOOD_WINDOW = 10.0
+
+
+class Priority(IntEnum):
+    """Prioridad de envío: menor valor sale antes"""
+
+    COMMAND = 0  # Respuestas a comandos (/start, /help, selección de org)
+    REPLY = 1  # Respuestas del agente
+    BULK = 2  # Notificaciones masivas
+
+
+@dataclass
+class OutboundMessage:
+    """Mensaje a enviar por la Bot API"""
+
+    chat_id: int
+    text: str
+    reply_to_message_id: int | None = None
+    parse_mode: str | None = None
+    # Texto plano a enviar si Telegram rechaza el formato (parse_mode)
+    fallback_text: str | None = None
+    reply_markup: dict | None = None  # Inline keyboard
+    edit_message_id: int | None = None  # Si está, edita ese mensaje en vez de enviar uno nuevo
+
+
+@dataclass(order=True)
+class _Job:
+    priority: int
+    seq: int
+    messages: list[OutboundMessage] = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    enqueued_at: float = field(compare=False, default_factory=time.monotonic)
+    results: list[dict] = field(compare=False, default_factory=list)
+    # Contexto de quien encoló (trace del update): los spans de envío quedan en su trace
+    context: contextvars.Context = field(compare=False, default_factory=contextvars.copy_context)
+
+    @property
+    def chat_id(self) -> int:
+        return self.messages[0].chat_id
+
+
+class TokenBucket:
+    """Token bucket simple: `rate` tokens por segundo con ráfagas de `capacity`"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        # Durante una pausa updated_at queda en el futuro: no se acumulan tokens
+        if now > self.updated_at:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+
+    def pause(self, seconds: float):
+        """Bloquea el bucket (p.ej. por un retry_after de Telegram); se rellena desde el fin"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+        self.updated_at = self.paused_until
+
+    @property
+    def idle(self) -> bool:
+        now = time.monotonic()
+        self._refill(now)
+        return self.tokens >= self.capacity and now >= self.paused_until
+
+    def ready_in(self, now: float) -> float:
+        """Segundos hasta que haya un token (0 si ya hay)"""
+        if now < self.paused_until:
+            return self.paused_until - now + 1 / self.rate
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    async def acquire(self) -> bool:
+        """Consume un token esperando si hace falta. Retorna True si tuvo que esperar."""
+        waited = False
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                waited = True
+                await asyncio.sleep(self.paused_until - now)
+                continue
+
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return waited
+
+            waited = True
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class DeliveryScheduler:
+    """
+    Cola de envíos salientes hacia Telegram.
+
+    Respeta los límites de la Bot API con un token bucket global y uno por
+    chat, reintenta los 429 según `retry_after` y los errores transitorios
+    con backoff, y atiende primero las respuestas a comandos.
+
+    Cada chat tiene su propia cola. Un despachador pasa a los workers solo
+    envíos de chats sin otro envío en curso y con cupo en su bucket, así la
+    cola de un chat (p.ej. toques seguidos a los botones de una página) no
+    ocupa workers que podrían atender a otros. Los mensajes de un mismo job
+    se envían en orden y seguidos.
+    """
+
+    def __init__(self, telegram: TelegramService, workers: int = 8):
+        settings = get_settings()
+        self.telegram = telegram
+        self.num_workers = workers
+        self.global_bucket = TokenBucket(
+            settings.telegram_global_rate, settings.telegram_global_rate
+        )
+        self.chat_rate = settings.telegram_chat_rate
+        self.chat_burst = settings.telegram_chat_burst
+        self.chat_buckets: dict[int, TokenBucket] = {}
+
+        self._seq = itertools.count()
+        self._chats: dict[int, list[_Job]] = {}  # chat_id -> jobs pendientes (heap)
+        self._current: dict[int, _Job] = {}  # Job a medio enviar: se termina antes que otros
+        self._busy: set[int] = set()  # Chats con un envío en curso
+        self._scheduled: set[int] = set()  # Chats en _ready o _waiting
+        self._ready: list[tuple[int, int, int]] = []  # (prioridad, seq, chat_id) con cupo
+        self._waiting: list[tuple[float, int]] = []  # (con cupo desde, chat_id)
+        self._pending_jobs = 0
+        self._dispatcher: asyncio.Task | None = None
+        self._sending: set[asyncio.Task] = set()
+        self._slots: asyncio.Semaphore | None = None
+        self._wake: asyncio.Event | None = None
+        self._idle: asyncio.Event | None = None
+
+        # Métricas
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.throttled = 0  # Esperas por los buckets locales
+        self.rate_limited = 0  # 429 recibidos de Telegram
+        self._rate_limited_at: dict[int, float] = {}  # chat_id -> último 429
+        self.latencies = LatencyWindow()
+
+    def start(self):
+        """Levanta el despachador (idempotente)"""
+        if self._dispatcher:
+            return
+        self._slots = asyncio.Semaphore(self.num_workers)
+        self._wake = asyncio.Event()
+        self._idle = asyncio.Event()
+        if not self._pending_jobs:
+            self._idle.set()
+        self._dispatcher = asyncio.create_task(self._dispatch(), name="delivery-dispatcher")
+
+    async def stop(self, timeout: float = 10.0):
+        """Espera a que se vacíe la cola (hasta `timeout`) y detiene los envíos"""
+        if not self._dispatcher:
+            return
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Delivery queue not drained: {self._pending_jobs} pending jobs")
+
+        tasks = [self._dispatcher, *self._sending]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._dispatcher = None
+
+    async def send(
+        self,
+        chat_id: int,
+        text: str,
+        reply_to_message_id: int | None = None,
+        parse_mode: str | None = None,
+        priority: Priority = Priority.REPLY,
+    ) -> dict:
+        """Encola un mensaje y espera la respuesta de Telegram"""
+        results = await self.send_many(
+            [OutboundMessage(chat_id, text, reply_to_message_id, parse_mode)],
+            priority=priority,
+        )
+        return results[0]
+
+    async def send_many(
+        self,
+        messages: list[OutboundMessage],
+        priority: Priority = Priority.REPLY,
+    ) -> list[dict]:
+        """
+        Encola varios mensajes de un mismo chat que se envían en orden.
+        Retorna la respuesta de Telegram de cada uno.
+        """
+        if not messages:
+            return []
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        job = _Job(priority, next(self._seq), messages, future)
+        heapq.heappush(self._chats.setdefault(job.chat_id, []), job)
+        self._pending_jobs += 1
+        self._idle.clear()
+        self._schedule(job.chat_id, time.monotonic())
+        return await future
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) > 10_000:
+                # Descartar buckets de chats inactivos
+                self.chat_buckets = {k: b for k, b in self.chat_buckets.items() if not b.idle}
+            bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self.chat_buckets[chat_id] = bucket
+        return bucket
+
+    # ---------- Despacho por chat ----------
+
+    def _head(self, chat_id: int) -> _Job | None:
+        """Siguiente job del chat: el que está a medio enviar o el de más prioridad"""
+        job = self._current.get(chat_id)
+        if job is None and self._chats.get(chat_id):
+            job = self._chats[chat_id][0]
+        return job
+
+    def _schedule(self, chat_id: int, now: float):
+        """Pone el chat en _ready (tiene cupo) o _waiting (hasta que lo tenga)"""
+        if chat_id in self._busy or chat_id in self._scheduled:
+            return
+        job = self._head(chat_id)
+        if job is None:
+            return
+        self._scheduled.add(chat_id)
+        delay = self._chat_bucket(chat_id).ready_in(now)
+        if delay <= 0:
+            heapq.heappush(self._ready, (job.priority, job.seq, chat_id))
+        else:
+            self.throttled += 1
+            heapq.heappush(self._waiting, (now + delay, chat_id))
+        self._wake.set()
+
+    def _take(self) -> tuple[_Job | None, float | None]:
+        """
+        Job del chat listo de más prioridad. Si no hay, retorna en cuántos
+        segundos se libera el próximo chat en espera (None: no hay ninguno).
+        """
+        now = time.monotonic()
+        while self._waiting and self._waiting[0][0] <= now:
+            _, chat_id = heapq.heappop(self._waiting)
+            self._scheduled.discard(chat_id)
+            self._schedule(chat_id, now)
+
+        while self._ready:
+            _, _, chat_id = heapq.heappop(self._ready)
+            self._scheduled.discard(chat_id)
+            job = self._head(chat_id)
+            if job is not None and chat_id not in self._busy:
+                return job, None
+        return None, (self._waiting[0][0] - now if self._waiting else None)
+
+    async def _dispatch(self):
+        while True:
+            await self._slots.acquire()
+            while True:
+                self._wake.clear()
+                job, delay = self._take()
+                if job is not None:
+                    break
+                try:
+                    await asyncio.wait_for(self._wake.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+
+            if self._current.get(job.chat_id) is not job:
+                heapq.heappop(self._chats[job.chat_id])
+                self._current[job.chat_id] = job
+            self._busy.add(job.chat_id)
+            task = asyncio.create_task(self._send_next(job), context=job.context)
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _send_next(self, job: _Job):
+        """Envía el siguiente mensaje del job y devuelve el chat al despacho"""
+        try:
+            message = job.messages[len(job.results)]
+            job.results.append(await self._deliver(message))
+            if len(job.results) == len(job.messages):
+                self.latencies.add(time.monotonic() - job.enqueued_at)
+                self._finish(job)
+                if not job.future.done():
+                    job.future.set_result(job.results)
+        except Exception as e:
+            self._finish(job)
+            if not job.future.done():
+                job.future.set_exception(e)
+        finally:
+            self._busy.discard(job.chat_id)
+            self._slots.release()
+            self._schedule(job.chat_id, time.monotonic())
+
+    def _finish(self, job: _Job):
+        self._current.pop(job.chat_id, None)
+        if not self._chats.get(job.chat_id):
+            self._chats.pop(job.chat_id, None)
+        self._pending_jobs -= 1
+        if not self._pending_jobs:
+            self._idle.set()
+
+    async def _deliver(self, message: OutboundMessage) -> dict:
+        """Envía un mensaje respetando los límites y reintentando según corresponda"""
+        bucket = self._chat_bucket(message.chat_id)
+        attempts = 0
+        rate_limited = 0
+
+        while True:
+            if await bucket.acquire():
+                self.throttled += 1
+            if await self.global_bucket.acquire():
+                self.throttled += 1
+
+            try:
+                if message.edit_message_id:
+                    result = await self.telegram.edit_message_text(
+                        message.chat_id,
+                        message.edit_message_id,
+                        message.text,
+                        parse_mode=message.parse_mode,
+                        reply_markup=message.reply_markup,
+                    )
+                else:
+                    result = await self.telegram.send_message(
+                        message.chat_id,
+                        message.text,
+                        reply_to_message_id=message.reply_to_message_id,
+                        parse_mode=message.parse_mode,
+                        reply_markup=message.reply_markup,
+                    )
+            except httpx.HTTPError as e:
+                result = {"ok": False, "error_code": None, "description": str(e)}
+
+            if result.get("ok"):
+                self.sent += 1
+                return result
+
+            error_code = result.get("error_code")
+            description = (result.get("description") or "").lower()
+
+            # Edición sin cambios (p.ej. dos toques seguidos al mismo botón): ya está
+            if (
+                error_code == 400
+                and message.edit_message_id
+                and "message is not modified" in description
+            ):
+                return {"ok": True, "result": None}
+
+            # Formato rechazado: reenviar en el mismo turno como texto plano
+            if (
+                error_code == 400
+                and "can't parse entities" in description
+                and message.parse_mode
+                and message.fallback_text is not None
+            ):
+                logger.warning(f"Telegram rejected {message.parse_mode}, sending plain text")
+                message = OutboundMessage(
+                    chat_id=message.chat_id,
+                    text=message.fallback_text,
+                    reply_to_message_id=message.reply_to_message_id,
+                    reply_markup=message.reply_markup,
+                    edit_message_id=message.edit_message_id,
+                )
+                continue
+
+            # Rate limit: esperar lo que indica Telegram
+            if error_code == 429 and rate_limited < MAX_RATE_LIMITED:
+                rate_limited += 1
+                self.rate_limited += 1
+                retry_after = (result.get("parameters") or {}).get("retry_after", 1)
+                logger.warning(f"Rate limited on chat {message.chat_id}, retry after {retry_after}s")
+                bucket.pause(retry_after)
+                # Telegram no dice a qué límite corresponde: solo con 429 en varios
+                # chats a la vez es el límite global del bot y se frenan todos
+                if self._is_global_flood(message.chat_id):
+                    logger.warning(f"Rate limited on several chats, pausing all for {retry_after}s")
+                    self.global_bucket.pause(retry_after)
+                continue
+
+            # Error transitorio (red o 5xx): backoff exponencial con jitter
+            if (error_code is None or error_code >= 500) and attempts < MAX_RETRIES:
+                attempts += 1
+                self.retries += 1
+                delay = BACKOFF_BASE * 2 ** (attempts - 1)
+                await asyncio.sleep(delay + random.uniform(0, delay))
+                continue
+
+            self.failed += 1
+            logger.error(
+                f"Error sending message to {message.chat_id}: "
+                f"{error_code} {result.get('description')}"
+            )
+            return result
+
+    def _is_global_flood(self, chat_id: int) -> bool:
+        """Registra un 429 del chat; True si hubo 429 en varios chats dentro de la ventana"""
+        now = time.monotonic()
+        self._rate_limited_at[chat_id] = now
+        self._rate_limited_at = {
+            chat: at
+            for chat, at in self._rate_limited_at.items()
+            if now - at <= GLOBAL_FLOOD_WINDOW
+        }
+        return len(self._rate_limited_at) >= GLOBAL_FLOOD_CHATS
+
+    def stats(self) -> dict:
+        """Métricas de entrega"""
+        return {
+            "sent": self.sent,
+            "failed": self.failed,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "rate_limited": self.rate_limited,
+            "queue_depth": self._pending_jobs,
+            "latency_ms": self.latencies.percentiles(0.50, 0.95, 0.99),
+        }
+
+
+_delivery_scheduler: DeliveryScheduler | None = None
+
+
+def get_delivery_scheduler() -> DeliveryScheduler:
+    global _delivery_scheduler
+    if _delivery_scheduler is None:
+        _delivery_scheduler = DeliveryScheduler(get_telegram_service())
+    return _delivery_scheduler
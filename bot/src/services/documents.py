@@ -0,0 +1,374 @@
+import asyncio
+import io
+import json
+import logging
+import math
+import multiprocessing
+import os
+import re
+import signal
+import time
+import unicodedata
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+from src.config import get_settings
+from src.models.schemas import TelegramDocument
+from src.services.cache import PersistentLRUCache
+from src.services.telegram import FileTooLargeError, get_telegram_service
+
+
+logger = logging.getLogger(__name__)
+
+# Aproximación de tokens para texto en español
+CHARS_PER_TOKEN = 4
+# Tamaño de cada trozo del documento para la selección por relevancia
+CHUNK_TOKENS = 600
+
+_WORD = re.compile(r"[a-z0-9ñ]{4,}")
+_STOPWORDS = {
+    "para", "como", "este", "esta", "estos", "estas", "que", "del", "los", "las",
+    "una", "uno", "sobre", "entre", "cual", "cuales", "donde", "cuando", "desde",
+    "hasta", "sera", "seran", "dicho", "dicha", "cada", "todo", "toda", "todos",
+    "partes", "documento", "contrato", "quiero", "necesito", "puedes", "favor",
+}
+
+
+def _extract_pages(pdf: bytes, start: int, end: int) -> list[str]:
+    """Extrae el texto de las páginas [start, end). Corre en el process pool."""
+    from pypdf import PdfReader
+
+    reader = PdfReader(io.BytesIO(pdf))
+    pages = []
+    for i in range(start, min(end, len(reader.pages))):
+        try:
+            pages.append(reader.pages[i].extract_text() or "")
+        except Exception:
+            pages.append("")
+    return pages
+
+
+def _register_worker(pids):
+    """Initializer del pool: informa el PID del proceso para poder matarlo"""
+    pids.put(os.getpid())
+
+
+def _count_pages(pdf: bytes) -> int:
+    from pypdf import PdfReader
+
+    return len(PdfReader(io.BytesIO(pdf)).pages)
+
+
+def _normalize(text: str) -> str:
+    """Minúsculas y sin tildes (conservando la ñ)"""
+    text = unicodedata.normalize("NFKD", text.lower().replace("ñ", "\0"))
+    return "".join(c for c in text if not unicodedata.combining(c)).replace("\0", "ñ")
+
+
+def _terms(text: str) -> list[str]:
+    return [w for w in _WORD.findall(_normalize(text)) if w not in _STOPWORDS]
+
+
+@dataclass
+class DocumentChunk:
+    """Trozo de un documento con las páginas que abarca"""
+
+    first_page: int
+    last_page: int
+    text: str
+
+    @property
+    def tokens(self) -> int:
+        return len(self.text) // CHARS_PER_TOKEN + 1
+
+    def render(self) -> str:
+        pages = (
+            f"Página {self.first_page}"
+            if self.first_page == self.last_page
+            else f"Páginas {self.first_page}-{self.last_page}"
+        )
+        return f"[{pages}]\n{self.text}"
+
+
+def chunk_pages(pages: list[str], chunk_tokens: int = CHUNK_TOKENS) -> list[DocumentChunk]:
+    """Agrupa el texto por páginas en trozos de hasta ~chunk_tokens (una página larga se divide)"""
+    max_chars = chunk_tokens * CHARS_PER_TOKEN
+    chunks: list[DocumentChunk] = []
+
+    for number, page in enumerate(pages, start=1):
+        text = re.sub(r"[ \t]+", " ", page).strip()
+        if not text:
+            continue
+
+        for i in range(0, len(text), max_chars):
+            piece = text[i : i + max_chars]
+            last = chunks[-1] if chunks else None
+            if last and i == 0 and len(last.text) + len(piece) + 1 <= max_chars:
+                last.text = f"{last.text}\n{piece}"
+                last.last_page = number
+            else:
+                chunks.append(DocumentChunk(number, number, piece))
+    return chunks
+
+
+def select_relevant(chunks: list[DocumentChunk], query: str | None, budget: int) -> list[DocumentChunk]:
+    """
+    Elige los trozos más relevantes para la consulta (puntaje TF-IDF simple)
+    hasta `budget` tokens, y los devuelve en el orden del documento. Sin
+    consulta, o si nada coincide, se prioriza el inicio del documento (partes,
+    propiedad, montos y plazos suelen estar ahí).
+    """
+    if sum(c.tokens for c in chunks) <= budget:
+        return chunks
+
+    query_terms = set(_terms(query or ""))
+    scores = [0.0] * len(chunks)
+
+    if query_terms:
+        chunk_terms = [Counter(_terms(c.text)) for c in chunks]
+        for term in query_terms:
+            df = sum(1 for terms in chunk_terms if term in terms)
+            if not df:
+                continue
+            idf = math.log(1 + len(chunks) / df)
+            for i, terms in enumerate(chunk_terms):
+                tf = terms[term]
+                if tf:
+                    scores[i] += (1 + math.log(tf)) * idf
+
+    # Desempate por posición: los primeros trozos primero
+    ranked = sorted(range(len(chunks)), key=lambda i: (-scores[i], i))
+
+    selected = []
+    used = 0
+    for i in ranked:
+        if used + chunks[i].tokens > budget:
+            continue
+        selected.append(i)
+        used += chunks[i].tokens
+    return [chunks[i] for i in sorted(selected)]
+
+
+class _ExtractionPool:
+    """
+    Process pool de extracción que se puede matar aunque tenga lotes
+    corriendo (future.cancel() no interrumpe un proceso ocupado).
+    """
+
+    def __init__(self, workers: int):
+        context = multiprocessing.get_context("spawn")
+        self._pids = context.SimpleQueue()
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=context,
+            initializer=_register_worker,
+            initargs=(self._pids,),
+        )
+        self.in_flight = 0  # Extracciones usando este pool
+        self.retired = False  # Tuvo un lote colgado: no recibe más trabajo
+
+    def kill(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        while not self._pids.empty():
+            try:
+                os.kill(self._pids.get(), signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+
+class DocumentPipeline:
+    """
+    Extracción de texto de PDFs para el agente.
+
+    Descarga el PDF por streaming, extrae el texto página a página en un
+    process pool (fuera del event loop) con límite de páginas y de tiempo,
+    cachea el texto por `file_unique_id` y entrega al agente solo los trozos
+    relevantes para el mensaje, dentro de un presupuesto de tokens.
+    """
+
+    def __init__(self):
+        self.settings = get_settings()
+        self.cache = PersistentLRUCache(
+            Path(self.settings.data_dir) / "documents.sqlite3",
+            max_entries=self.settings.document_cache_size,
+        )
+        self._pool: _ExtractionPool | None = None
+
+    @property
+    def pool(self) -> _ExtractionPool:
+        if self._pool is None:
+            self._pool = _ExtractionPool(self.settings.document_workers)
+        return self._pool
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.executor.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        self.cache.close()
+
+    @staticmethod
+    def is_pdf(document: TelegramDocument) -> bool:
+        return document.mime_type == "application/pdf" or (
+            document.file_name or ""
+        ).lower().endswith(".pdf")
+
+    def _retire(self, pool: _ExtractionPool):
+        """
+        Saca de uso un pool con un lote que no terminó a tiempo: las
+        extracciones nuevas van a un pool nuevo y este se mata cuando no
+        queda ninguna otra extracción usándolo (así no les corta sus lotes).
+        """
+        pool.retired = True
+        if self._pool is pool:
+            self._pool = None
+
+    async def extract_pages(self, pdf: bytes) -> tuple[list[str], bool, bool]:
+        """
+        Extrae el texto de cada página en paralelo, todo (conteo de páginas
+        incluido) dentro de DOCUMENT_TIMEOUT.
+        Retorna (páginas, truncado, parcial): truncado si faltan páginas por
+        cualquier motivo; parcial si se cortó por tiempo o por una falla (no
+        solo por DOCUMENT_MAX_PAGES). Se devuelven las páginas listas.
+        """
+        pool = self.pool
+        pool.in_flight += 1
+        try:
+            return await self._extract_pages(pool, pdf)
+        finally:
+            pool.in_flight -= 1
+            if pool.retired and not pool.in_flight:
+                pool.kill()
+
+    async def _extract_pages(
+        self, pool: _ExtractionPool, pdf: bytes
+    ) -> tuple[list[str], bool, bool]:
+        loop = asyncio.get_running_loop()
+        executor = pool.executor
+        deadline = time.monotonic() + self.settings.document_timeout
+
+        try:
+            total = await asyncio.wait_for(
+                loop.run_in_executor(executor, _count_pages, pdf),
+                self.settings.document_timeout,
+            )
+        except asyncio.TimeoutError:
+            logger.warning("PDF page count timed out")
+            self._retire(pool)
+            return [], True, True
+        limit = min(total, self.settings.document_max_pages)
+
+        # Lotes contiguos: cada worker parsea el PDF una vez por lote
+        batches = max(1, min(self.settings.document_workers * 2, limit))
+        size = math.ceil(limit / batches) if limit else 0
+        futures = [
+            loop.run_in_executor(executor, _extract_pages, pdf, start, min(start + size, limit))
+            for start in range(0, limit, size or 1)
+        ]
+        if not futures:
+            return [], False, False
+
+        try:
+            done, pending = await asyncio.wait(
+                futures, timeout=max(deadline - time.monotonic(), 0)
+            )
+        except asyncio.CancelledError:
+            for future in futures:
+                future.cancel()
+            raise
+        if pending:
+            logger.warning("PDF extraction timed out, retiring the document workers")
+            for future in pending:
+                future.cancel()
+            self._retire(pool)
+
+        # Conservar solo el prefijo continuo de lotes terminados
+        pages: list[str] = []
+        failed = False
+        for future in futures:
+            if future not in done or future.exception():
+                failed = True
+                break
+            pages.extend(future.result())
+
+        truncated = len(pages) < total
+        if failed:
+            logger.warning(f"PDF extraction incomplete: {len(pages)}/{total} pages")
+        return pages, truncated, failed
+
+    async def get_pages(self, document: TelegramDocument) -> tuple[list[str], bool] | None:
+        """Texto por página del documento, desde la cache o extrayéndolo"""
+        cached = await self.cache.get(document.file_unique_id)
+        if cached is not None:
+            data = json.loads(cached)
+            return data["pages"], data["truncated"]
+
+        telegram = get_telegram_service()
+        try:
+            pdf = await telegram.download_bytes(document.file_id, file_size=document.file_size)
+        except FileTooLargeError as e:
+            logger.warning(f"Document too large: {e}")
+            return None
+        if not pdf:
+            return None
+
+        start = time.monotonic()
+        try:
+            pages, truncated, partial = await self.extract_pages(pdf)
+        except Exception as e:
+            logger.error(f"Error extracting PDF {document.file_name}: {e!r}")
+            return None
+        logger.info(
+            f"PDF extracted: {document.file_name} {len(pages)} pages "
+            f"in {time.monotonic() - start:.2f}s"
+        )
+
+        # Un corte por tiempo no se cachea: al reenviarlo se vuelve a intentar completo
+        if not partial:
+            await self.cache.set(
+                document.file_unique_id, json.dumps({"pages": pages, "truncated": truncated})
+            )
+        return pages, truncated
+
+    async def build_message(self, document: TelegramDocument, caption: str | None) -> str | None:
+        """
+        Arma el mensaje para el agente: el texto del usuario (caption) y los
+        trozos relevantes del documento. None si no se pudo extraer texto
+        (p.ej. un PDF escaneado).
+        """
+        result = await self.get_pages(document)
+        if result is None:
+            return None
+        pages, truncated = result
+
+        chunks = chunk_pages(pages)
+        if not chunks:
+            return None
+
+        selected = await asyncio.to_thread(
+            select_relevant, chunks, caption, self.settings.document_token_budget
+        )
+        name = document.file_name or "documento.pdf"
+
+        header = f"[Documento: {name} — {len(pages)} páginas"
+        if truncated:
+            header += ", extracción parcial"
+        if len(selected) < len(chunks):
+            header += f", se incluyen {len(selected)} de {len(chunks)} secciones"
+        header += "]"
+
+        parts = [caption] if caption else []
+        parts.append(header)
+        parts.extend(chunk.render() for chunk in selected)
+        return "\n\n".join(parts)
+
+
+_document_pipeline: DocumentPipeline | None = None
+
+
+def get_document_pipeline() -> DocumentPipeline:
+    global _document_pipeline
+    if _document_pipeline is None:
+        _document_pipeline = DocumentPipeline()
+    return _document_pipeline
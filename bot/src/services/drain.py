@@ -0,0 +1,274 @@
+import asyncio
+import json
+import logging
+import os
+import signal
+import threading
+import time
+from collections.abc import Awaitable, Callable
+from datetime import datetime
+from pathlib import Path
+
+from src.config import get_settings
+
+
+logger = logging.getLogger(__name__)
+
+REAP_TIMEOUT = 3.0  # Espera entre SIGTERM y SIGKILL a los procesos hijos
+
+
+def _descendants(pid: int) -> list[int]:
+    """PIDs de todos los descendientes de `pid` (Linux, vía /proc), de hijos a nietos"""
+    children: dict[int, list[int]] = {}
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return []
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    result: list[int] = []
+    pending = [pid]
+    while pending:
+        for child in children.get(pending.pop(), []):
+            result.append(child)
+            pending.append(child)
+    return result
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    # Un zombie sigue "vivo" para kill(0): se recoge aquí si es hijo directo
+    try:
+        return os.waitpid(pid, os.WNOHANG) == (0, 0)
+    except ChildProcessError:
+        return True
+
+
+async def reap_children() -> int:
+    """
+    Termina los procesos que quedaron colgando del proceso (CLI del agente y
+    su MCP, ffmpeg, workers de PDFs): SIGTERM, y SIGKILL a los que no
+    terminan en REAP_TIMEOUT. Retorna cuántos había.
+    """
+    pids = _descendants(os.getpid())
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    deadline = time.monotonic() + REAP_TIMEOUT
+    while time.monotonic() < deadline and any(_alive(pid) for pid in pids):
+        await asyncio.sleep(0.1)
+
+    for pid in pids:
+        if _alive(pid):
+            logger.warning(f"Child process {pid} did not exit, killing it")
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+    return len(pids)
+
+
+class DrainCoordinator:
+    """
+    Apagado ordenado del webhook.
+
+    Al recibir SIGTERM/SIGINT (o al cerrar el lifespan) deja de aceptar trabajo
+    nuevo: los updates que llegan se guardan en DATA_DIR/pending para la
+    siguiente instancia. Los turnos del agente en curso tienen
+    DRAIN_GRACE_SECONDS para terminar; los que no alcanzan se cancelan y su
+    update también se guarda. Al arrancar, `resume_pending` procesa lo
+    guardado.
+    """
+
+    def __init__(self):
+        settings = get_settings()
+        self.grace = settings.drain_grace_seconds
+        self.pending_dir = Path(settings.data_dir) / "pending"
+        self.report_path = Path(settings.data_dir) / "drain.json"
+
+        self.draining = False
+        self._drain_started: float | None = None
+        self._grace_task: asyncio.Task | None = None
+        self._in_flight: dict[asyncio.Task, dict] = {}  # tarea -> update original
+
+        # Métricas
+        self.finished_in_grace = 0
+        self.persisted = 0
+        self.resumed = 0
+        self.previous_report = self._load_previous_report()
+
+    # ---------- Trabajo en curso ----------
+
+    async def run(self, body: dict, work: Awaitable[dict]) -> dict:
+        """
+        Ejecuta el procesamiento de un update registrándolo como trabajo en
+        curso. Corre en su propia tarea (protegida de la cancelación del
+        request) para que el drain decida si esperarlo o guardarlo.
+        """
+        task = asyncio.ensure_future(work)
+        self._in_flight[task] = body
+        task.add_done_callback(self._done)
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if task.cancelled():
+                # Cancelado por el drain: el update ya quedó guardado
+                return {"ok": True}
+            raise
+
+    def _done(self, task: asyncio.Task):
+        self._in_flight.pop(task, None)
+        if self.draining and not task.cancelled():
+            self.finished_in_grace += 1
+
+    def persist(self, body: dict, reason: str):
+        """Guarda un update para que lo procese la siguiente instancia"""
+        try:
+            self.pending_dir.mkdir(parents=True, exist_ok=True)
+            update_id = body.get("update_id", 0)
+            path = self.pending_dir / f"{update_id:012d}.json"
+            path.write_text(json.dumps({"reason": reason, "update": body}, ensure_ascii=False))
+            self.persisted += 1
+        except Exception as e:
+            logger.error(f"Could not persist update {body.get('update_id')}: {e!r}")
+
+    # ---------- Drain ----------
+
+    def install_signal_handlers(self):
+        """
+        Envuelve los handlers de SIGTERM/SIGINT (los de uvicorn) para empezar
+        el drain en cuanto llega la señal, mientras uvicorn espera los
+        requests en curso.
+        """
+        if threading.current_thread() is not threading.main_thread():
+            return
+        loop = asyncio.get_running_loop()
+
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            previous = signal.getsignal(sig)
+
+            def handler(signum, frame, previous=previous):
+                loop.call_soon_threadsafe(self.begin)
+                if callable(previous):
+                    previous(signum, frame)
+
+            signal.signal(sig, handler)
+
+    def begin(self):
+        """Deja de aceptar trabajo y da DRAIN_GRACE_SECONDS a lo que está en curso"""
+        if self.draining:
+            return
+        self.draining = True
+        self._drain_started = time.monotonic()
+        logger.info(
+            f"Draining: {len(self._in_flight)} update(s) in flight, "
+            f"grace period {self.grace:.0f}s"
+        )
+        self._grace_task = asyncio.get_running_loop().create_task(self._expire_grace())
+
+    async def _expire_grace(self):
+        await asyncio.sleep(self.grace)
+        for task, body in list(self._in_flight.items()):
+            logger.warning(f"Update {body.get('update_id')} did not finish in the grace period")
+            self.persist(body, reason="interrupted")
+            task.cancel()
+
+    async def wait(self):
+        """Espera a que termine (o se cancele) todo el trabajo en curso"""
+        self.begin()
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+        if self._grace_task:
+            self._grace_task.cancel()
+
+    def finish(self, **details) -> dict:
+        """Arma y guarda el reporte del drain (la siguiente instancia lo expone en /metrics)"""
+        duration = time.monotonic() - (self._drain_started or time.monotonic())
+        report = {
+            "finished_at": datetime.now().isoformat(),
+            "duration_s": round(duration, 2),
+            "finished_in_grace": self.finished_in_grace,
+            "persisted": self.persisted,
+            **details,
+        }
+        logger.info(f"Drain finished: {json.dumps(report)}")
+        try:
+            self.report_path.parent.mkdir(parents=True, exist_ok=True)
+            self.report_path.write_text(json.dumps(report))
+        except OSError as e:
+            logger.error(f"Could not save drain report: {e}")
+        return report
+
+    # ---------- Arranque ----------
+
+    def _load_previous_report(self) -> dict | None:
+        try:
+            return json.loads(self.report_path.read_text())
+        except (OSError, ValueError):
+            return None
+
+    async def resume_pending(self, process: Callable[[dict, bool], Awaitable[dict]]):
+        """
+        Procesa los updates que dejó la instancia anterior, en orden. `process`
+        recibe el update y si fue interrumpido a medias (el agente pudo haber
+        hecho cambios). Cada archivo se borra antes de procesarlo: si esta
+        instancia también se cae, el update no se repite indefinidamente.
+        """
+        if not self.pending_dir.is_dir():
+            return
+        paths = sorted(self.pending_dir.glob("*.json"))
+        if not paths:
+            return
+        logger.info(f"Resuming {len(paths)} pending update(s) from the previous instance")
+
+        for path in paths:
+            if self.draining:
+                break  # Los que faltan quedan para la siguiente instancia
+            try:
+                data = json.loads(path.read_text())
+                path.unlink()
+            except (OSError, ValueError) as e:
+                logger.error(f"Invalid pending update {path.name}: {e}")
+                path.unlink(missing_ok=True)
+                continue
+            interrupted = data.get("reason") == "interrupted"
+            try:
+                await self.run(data["update"], process(data["update"], interrupted))
+                self.resumed += 1
+            except Exception as e:
+                logger.error(f"Error resuming update {path.stem}: {e!r}")
+
+    def stats(self) -> dict:
+        return {
+            "draining": self.draining,
+            "in_flight": len(self._in_flight),
+            "persisted": self.persisted,
+            "resumed": self.resumed,
+            "previous_drain": self.previous_report,
+        }
+
+
+_drain_coordinator: DrainCoordinator | None = None
+
+
+def get_drain_coordinator() -> DrainCoordinator:
+    global _drain_coordinator
+    if _drain_coordinator is None:
+        _drain_coordinator = DrainCoordinator()
+    return _drain_coordinator
@@ -0,0 +1,280 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from src.config import get_settings
+
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 3  # Un job que tumba a su worker no se reintenta para siempre
+RETENTION_SECONDS = 24 * 3600  # Jobs terminados que se conservan (para stats)
+
+
+@dataclass
+class Job:
+    """Update encolado para que lo procese un worker"""
+
+    id: int
+    telegram_id: int
+    body: dict
+    interrupted: bool  # Un worker lo empezó y no lo terminó
+    enqueued_at: float  # time.time()
+
+
+class JobQueue:
+    """
+    Cola de updates entre el webhook (ingesta) y los workers del agente,
+    persistida en SQLite (DATA_DIR/jobs.db) y compartida entre procesos de
+    una misma máquina (WAL no funciona sobre volúmenes de red).
+
+    - Los updates de un mismo usuario se procesan de a uno y en orden.
+    - Cada usuario queda asignado al último worker que lo atendió mientras ese
+      worker siga vivo: las sesiones del agente viven en la memoria del worker.
+    - Los jobs de un worker que deja de dar latidos se reencolan marcados como
+      interrumpidos (hasta MAX_ATTEMPTS).
+
+    Las operaciones se ejecutan en un thread para no bloquear el event loop.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.heartbeat_timeout = get_settings().worker_heartbeat_timeout
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+
+        # Métricas (de este proceso)
+        self.enqueued = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # Autocommit: las transacciones se abren explícitamente con BEGIN IMMEDIATE
+            conn = sqlite3.connect(
+                self.path, timeout=30, isolation_level=None, check_same_thread=False
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " telegram_id INTEGER NOT NULL,"
+                " body TEXT NOT NULL,"
+                " status TEXT NOT NULL DEFAULT 'queued',"  # queued | running | done | failed
+                " worker_id TEXT,"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " interrupted INTEGER NOT NULL DEFAULT 0,"
+                " error TEXT,"
+                " enqueued_at REAL NOT NULL,"
+                " started_at REAL,"
+                " finished_at REAL);"
+                "CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, id);"
+                "CREATE INDEX IF NOT EXISTS idx_jobs_user ON jobs(telegram_id, status);"
+                "CREATE TABLE IF NOT EXISTS workers ("
+                " id TEXT PRIMARY KEY,"
+                " heartbeat REAL NOT NULL,"
+                " stats TEXT);"
+                "CREATE TABLE IF NOT EXISTS affinity ("
+                " telegram_id INTEGER PRIMARY KEY,"
+                " worker_id TEXT NOT NULL);"
+            )
+            self._conn = conn
+        return self._conn
+
+    # ---------- Ingesta ----------
+
+    def _enqueue(self, telegram_id: int, body: dict, interrupted: bool) -> int:
+        with self._lock:
+            cursor = self._connect().execute(
+                "INSERT INTO jobs (telegram_id, body, interrupted, enqueued_at) VALUES (?, ?, ?, ?)",
+                (telegram_id, json.dumps(body, ensure_ascii=False), int(interrupted), time.time()),
+            )
+            self.enqueued += 1
+            return cursor.lastrowid
+
+    async def enqueue(self, telegram_id: int, body: dict, interrupted: bool = False) -> int:
+        return await asyncio.to_thread(self._enqueue, telegram_id, body, interrupted)
+
+    # ---------- Workers ----------
+
+    def _claim(self, worker_id: str) -> Job | None:
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # El más antiguo de un usuario sin jobs en curso y que sea de
+                # este worker, de nadie, o de un worker muerto
+                row = conn.execute(
+                    "SELECT j.id, j.telegram_id, j.body, j.interrupted, j.enqueued_at"
+                    " FROM jobs j"
+                    " LEFT JOIN affinity a ON a.telegram_id = j.telegram_id"
+                    " LEFT JOIN workers w ON w.id = a.worker_id"
+                    " WHERE j.status = 'queued'"
+                    " AND NOT EXISTS (SELECT 1 FROM jobs r"
+                    "  WHERE r.telegram_id = j.telegram_id AND r.status = 'running')"
+                    " AND (a.worker_id IS NULL OR a.worker_id = ?"
+                    "  OR w.heartbeat IS NULL OR w.heartbeat < ?)"
+                    " ORDER BY j.id LIMIT 1",
+                    (worker_id, now - self.heartbeat_timeout),
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+
+                job_id, telegram_id, body, interrupted, enqueued_at = row
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', worker_id = ?, started_at = ?,"
+                    " attempts = attempts + 1 WHERE id = ?",
+                    (worker_id, now, job_id),
+                )
+                conn.execute(
+                    "INSERT INTO affinity (telegram_id, worker_id) VALUES (?, ?)"
+                    " ON CONFLICT(telegram_id) DO UPDATE SET worker_id = excluded.worker_id",
+                    (telegram_id, worker_id),
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return Job(job_id, telegram_id, json.loads(body), bool(interrupted), enqueued_at)
+
+    async def claim(self, worker_id: str) -> Job | None:
+        """Toma el siguiente job disponible para `worker_id` (None si no hay)"""
+        return await asyncio.to_thread(self._claim, worker_id)
+
+    def _finish(self, job_id: int, error: str | None):
+        with self._lock:
+            self._connect().execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                ("failed" if error else "done", error, time.time(), job_id),
+            )
+
+    async def complete(self, job_id: int):
+        await asyncio.to_thread(self._finish, job_id, None)
+
+    async def fail(self, job_id: int, error: str):
+        await asyncio.to_thread(self._finish, job_id, error)
+
+    def _release(self, job_id: int):
+        with self._lock:
+            self._connect().execute(
+                "UPDATE jobs SET status = 'queued', worker_id = NULL, interrupted = 1"
+                " WHERE id = ?",
+                (job_id,),
+            )
+
+    async def release(self, job_id: int):
+        """Devuelve a la cola un job que este worker no alcanzó a terminar"""
+        await asyncio.to_thread(self._release, job_id)
+
+    def _heartbeat(self, worker_id: str, stats: dict):
+        with self._lock:
+            self._connect().execute(
+                "INSERT INTO workers (id, heartbeat, stats) VALUES (?, ?, ?)"
+                " ON CONFLICT(id) DO UPDATE SET heartbeat = excluded.heartbeat,"
+                " stats = excluded.stats",
+                (worker_id, time.time(), json.dumps(stats)),
+            )
+
+    async def heartbeat(self, worker_id: str, stats: dict):
+        await asyncio.to_thread(self._heartbeat, worker_id, stats)
+
+    def _unregister(self, worker_id: str):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM affinity WHERE worker_id = ?", (worker_id,))
+            conn.execute("DELETE FROM workers WHERE id = ?", (worker_id,))
+
+    async def unregister(self, worker_id: str):
+        """Al apagar un worker: sus usuarios pasan a cualquier otro"""
+        await asyncio.to_thread(self._unregister, worker_id)
+
+    def _recover(self) -> int:
+        """Reencola los jobs de workers muertos y limpia lo viejo. Retorna cuántos reencoló"""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                stale = now - self.heartbeat_timeout
+                dead = "(SELECT id FROM workers WHERE heartbeat < ?)"
+                orphaned = (
+                    "status = 'running' AND (worker_id IN " + dead
+                    + " OR worker_id NOT IN (SELECT id FROM workers))"
+                )
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = 'worker died', finished_at = ?"
+                    f" WHERE {orphaned} AND attempts >= ?",
+                    (now, stale, MAX_ATTEMPTS),
+                )
+                requeued = conn.execute(
+                    "UPDATE jobs SET status = 'queued', worker_id = NULL, interrupted = 1"
+                    f" WHERE {orphaned}",
+                    (stale,),
+                ).rowcount
+                conn.execute(f"DELETE FROM affinity WHERE worker_id IN {dead}", (stale,))
+                conn.execute("DELETE FROM workers WHERE heartbeat < ?", (stale,))
+                conn.execute(
+                    "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+                    (now - RETENTION_SECONDS,),
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        if requeued:
+            logger.warning(f"Requeued {requeued} job(s) from dead workers")
+        return requeued
+
+    async def recover(self) -> int:
+        return await asyncio.to_thread(self._recover)
+
+    # ---------- Métricas ----------
+
+    def _stats(self) -> dict:
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"))
+            oldest = conn.execute(
+                "SELECT MIN(enqueued_at) FROM jobs WHERE status = 'queued'"
+            ).fetchone()[0]
+            workers = {
+                worker_id: {
+                    "last_heartbeat_s": round(now - heartbeat, 1),
+                    **(json.loads(stats) if stats else {}),
+                }
+                for worker_id, heartbeat, stats in conn.execute(
+                    "SELECT id, heartbeat, stats FROM workers ORDER BY id"
+                )
+            }
+        return {
+            "enqueued": self.enqueued,
+            "jobs": counts,
+            "oldest_queued_s": round(now - oldest, 1) if oldest else None,
+            "workers": workers,
+        }
+
+    async def stats(self) -> dict:
+        return await asyncio.to_thread(self._stats)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_job_queue: JobQueue | None = None
+
+
+def get_job_queue() -> JobQueue:
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = JobQueue(Path(get_settings().data_dir) / "jobs.db")
+    return _job_queue
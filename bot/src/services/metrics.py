@@ -0,0 +1,65 @@
+from collections import deque
+
+
+class LatencyWindow:
+    """Ventana de las últimas N latencias (en segundos) para calcular percentiles"""
+
+    def __init__(self, size: int = 1000):
+        self.samples: deque[float] = deque(maxlen=size)
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentiles(self, *ps: float) -> dict[str, float | None]:
+        """Percentiles en milisegundos, p.ej. percentiles(0.5, 0.95) -> {"p50": .., "p95": ..}"""
+        ordered = sorted(self.samples)
+        result = {}
+        for p in ps or (0.50, 0.95, 0.99):
+            key = f"p{round(p * 100):g}"
+            if not ordered:
+                result[key] = None
+                continue
+            value = ordered[min(int(len(ordered) * p), len(ordered) - 1)]
+            result[key] = round(value * 1000, 1)
+        return result
+
+
+# Límites de los buckets del histograma, en milisegundos
+HISTOGRAM_BUCKETS_MS = (
+    5, 10, 25, 50, 100, 250, 500, 1_000, 2_500, 5_000, 10_000, 20_000, 30_000, 60_000, 120_000,
+)
+
+
+class Histogram:
+    """
+    Histograma de latencias con buckets fijos (acumulado desde el arranque)
+    más una ventana reciente para percentiles exactos.
+    """
+
+    def __init__(self, window: int = 1000):
+        self.counts = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.window = LatencyWindow(window)
+
+    def add(self, seconds: float):
+        ms = seconds * 1000
+        for i, bound in enumerate(HISTOGRAM_BUCKETS_MS):
+            if ms <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.total += seconds
+        self.window.add(seconds)
+
+    def snapshot(self) -> dict:
+        buckets = {f"le_{bound}": n for bound, n in zip(HISTOGRAM_BUCKETS_MS, self.counts)}
+        buckets["le_inf"] = self.counts[-1]
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1000, 1) if self.count else None,
+            **self.window.percentiles(0.50, 0.90, 0.95, 0.99),
+            "buckets": buckets,
+        }
@@ -0,0 +1,319 @@
+import asyncio
+import json
+import logging
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+from src.agent.prompts import (
+    DAILY_DIGEST_CONTRACTS,
+    DAILY_DIGEST_DUE_SOON,
+    DAILY_DIGEST_MESSAGE,
+    DAILY_DIGEST_OVERDUE,
+)
+from src.config import get_settings
+from src.services.delivery import DeliveryScheduler, Priority, get_delivery_scheduler
+from src.services.rendering import render_reply
+from src.services.supabase_client import (
+    get_all_telegram_users,
+    get_expiring_contracts,
+    get_organizations_by_ids,
+    get_pending_vouchers,
+    get_properties_by_ids,
+    get_users_by_ids,
+)
+
+
+logger = logging.getLogger(__name__)
+
+# Ítems por sección antes de resumir con "y N más"
+MAX_ITEMS_PER_SECTION = 10
+# Envíos en paralelo (el DeliveryScheduler aplica los límites de Telegram)
+SEND_CONCURRENCY = 20
+
+
+@dataclass
+class OrgDigest:
+    """Pendientes de una organización para la notificación diaria"""
+
+    organizacion_id: str
+    nombre: str
+    overdue: list[dict] = field(default_factory=list)
+    due_soon: list[dict] = field(default_factory=list)
+    expiring: list[dict] = field(default_factory=list)
+
+    @property
+    def empty(self) -> bool:
+        return not (self.overdue or self.due_soon or self.expiring)
+
+
+@dataclass
+class NotificationRunReport:
+    """Resultado de una ejecución del envío diario"""
+
+    run_date: str
+    duration_s: float = 0.0
+    gather_s: float = 0.0
+    organizations: int = 0
+    recipients: int = 0
+    delivered: int = 0
+    skipped: int = 0  # Ya notificados en una ejecución interrumpida
+    failed: int = 0
+
+
+def format_clp(amount) -> str:
+    """Formatea un monto en pesos chilenos: $1.234.567"""
+    return "$" + f"{round(float(amount or 0)):,}".replace(",", ".")
+
+
+def _format_date(value: str) -> str:
+    return date.fromisoformat(value[:10]).strftime("%d/%m/%Y")
+
+
+def _address(prop: dict | None) -> str:
+    if not prop:
+        return "Propiedad sin dirección"
+    parts = [f"{prop.get('calle') or ''} {prop.get('numero') or ''}".strip(), prop.get("comuna")]
+    return ", ".join(p for p in parts if p) or f"Propiedad {prop.get('propiedad_id')}"
+
+
+def _section(title: str, lines: list[str]) -> str:
+    shown = lines[:MAX_ITEMS_PER_SECTION]
+    if len(lines) > MAX_ITEMS_PER_SECTION:
+        shown.append(f"• …y {len(lines) - MAX_ITEMS_PER_SECTION} más")
+    return title + "\n" + "\n".join(shown)
+
+
+class NotificationEngine:
+    """
+    Envío proactivo de la notificación diaria: vouchers vencidos o por vencer
+    y contratos por terminar, a cada usuario de Telegram vinculado según su
+    organización activa.
+
+    Los datos se obtienen con consultas por lote para todas las
+    organizaciones (no una por usuario) y el avance se guarda en disco, así
+    que una ejecución interrumpida retoma sin repetir envíos.
+    """
+
+    def __init__(self, delivery: DeliveryScheduler):
+        self.settings = get_settings()
+        self.delivery = delivery
+        self.state_dir = Path(self.settings.data_dir) / "notifications"
+        self.last_report: NotificationRunReport | None = None
+
+    def _checkpoint_path(self, run_date: date) -> Path:
+        return self.state_dir / f"{run_date.isoformat()}.jsonl"
+
+    def _complete_path(self, run_date: date) -> Path:
+        """Marca de que el envío del día terminó (no hay que retomarlo)"""
+        return self.state_dir / f"{run_date.isoformat()}.done"
+
+    def _load_checkpoint(self, run_date: date) -> set[str]:
+        """IDs de telegram_users ya notificados hoy"""
+        path = self._checkpoint_path(run_date)
+        if not path.exists():
+            return set()
+        with path.open() as f:
+            return {json.loads(line)["id"] for line in f if line.strip()}
+
+    def _prune_checkpoints(self, run_date: date):
+        keep = {self._checkpoint_path(run_date), self._complete_path(run_date)}
+        for path in [*self.state_dir.glob("*.jsonl"), *self.state_dir.glob("*.done")]:
+            if path not in keep:
+                path.unlink(missing_ok=True)
+
+    async def gather(self, today: date) -> tuple[list[dict], dict[str, OrgDigest], dict[str, dict]]:
+        """
+        Obtiene destinatarios, pendientes por organización y datos de usuario
+        con un puñado de consultas por lote.
+        """
+        telegram_users = await get_all_telegram_users()
+        org_ids = sorted({row["organizacion_id"] for row in telegram_users})
+        user_ids = sorted({row["user_id"] for row in telegram_users})
+
+        orgs, users, vouchers, contracts = await asyncio.gather(
+            get_organizations_by_ids(org_ids),
+            get_users_by_ids(user_ids),
+            get_pending_vouchers(
+                org_ids, today + timedelta(days=self.settings.notifications_voucher_days)
+            ),
+            get_expiring_contracts(
+                org_ids, today, today + timedelta(days=self.settings.notifications_contract_days)
+            ),
+        )
+
+        propiedad_ids = {row["propiedad_id"] for row in vouchers + contracts}
+        properties = {
+            row["propiedad_id"]: row for row in await get_properties_by_ids(sorted(propiedad_ids))
+        }
+
+        digests = {
+            org["organizacion_id"]: OrgDigest(org["organizacion_id"], org.get("nombre") or "")
+            for org in orgs
+        }
+        for voucher in vouchers:
+            digest = digests.get(voucher["organizacion_id"])
+            if digest is None:
+                continue
+            voucher["propiedad"] = properties.get(voucher["propiedad_id"])
+            if date.fromisoformat(voucher["fecha_vencimiento"][:10]) < today:
+                digest.overdue.append(voucher)
+            else:
+                digest.due_soon.append(voucher)
+        for contract in contracts:
+            digest = digests.get(contract["organizacion_id"])
+            if digest is None:
+                continue
+            contract["propiedad"] = properties.get(contract["propiedad_id"])
+            digest.expiring.append(contract)
+
+        return telegram_users, digests, {row["user_id"]: row for row in users}
+
+    def render(self, user: dict | None, digest: OrgDigest) -> str:
+        """Arma el mensaje (markdown estándar) para un usuario"""
+        sections = []
+        if digest.overdue:
+            total = sum(float(v.get("monto_arriendo_clp") or 0) for v in digest.overdue)
+            sections.append(
+                _section(
+                    DAILY_DIGEST_OVERDUE.format(count=len(digest.overdue), total=format_clp(total)),
+                    [
+                        f"• {v['folio']} — {_address(v['propiedad'])} — "
+                        f"venció el {_format_date(v['fecha_vencimiento'])}"
+                        for v in digest.overdue
+                    ],
+                )
+            )
+        if digest.due_soon:
+            sections.append(
+                _section(
+                    DAILY_DIGEST_DUE_SOON.format(
+                        count=len(digest.due_soon),
+                        days=self.settings.notifications_voucher_days,
+                    ),
+                    [
+                        f"• {v['folio']} — {_address(v['propiedad'])} — "
+                        f"vence el {_format_date(v['fecha_vencimiento'])}"
+                        for v in digest.due_soon
+                    ],
+                )
+            )
+        if digest.expiring:
+            sections.append(
+                _section(
+                    DAILY_DIGEST_CONTRACTS.format(
+                        count=len(digest.expiring),
+                        days=self.settings.notifications_contract_days,
+                    ),
+                    [
+                        f"• {_address(c['propiedad'])} — termina el {_format_date(c['fecha_termino'])}"
+                        for c in digest.expiring
+                    ],
+                )
+            )
+
+        user_nombre = (user or {}).get("nombre")
+        return DAILY_DIGEST_MESSAGE.format(
+            saludo=f"Buenos días {user_nombre}!" if user_nombre else "Buenos días!",
+            org_nombre=digest.nombre or "tu organización",
+            sections="\n\n".join(sections),
+        ).strip()
+
+    async def run(self, today: date | None = None) -> NotificationRunReport:
+        """Ejecuta el envío diario completo (o retoma uno interrumpido)"""
+        today = today or datetime.now(ZoneInfo(self.settings.timezone)).date()
+        report = NotificationRunReport(run_date=today.isoformat())
+        started = time.monotonic()
+
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        self._prune_checkpoints(today)
+        done = self._load_checkpoint(today)
+
+        telegram_users, digests, users = await self.gather(today)
+        report.gather_s = round(time.monotonic() - started, 3)
+        report.organizations = len(digests)
+
+        pending = []
+        for row in telegram_users:
+            digest = digests.get(row["organizacion_id"])
+            if digest is None or digest.empty:
+                continue
+            report.recipients += 1
+            if row["id"] in done:
+                report.skipped += 1
+                continue
+            pending.append((row, digest))
+
+        semaphore = asyncio.Semaphore(SEND_CONCURRENCY)
+        checkpoint = self._checkpoint_path(today).open("a")
+
+        async def notify(row: dict, digest: OrgDigest):
+            async with semaphore:
+                text = self.render(users.get(row["user_id"]), digest)
+                messages = render_reply(row["telegram_id"], text)
+                try:
+                    results = await self.delivery.send_many(messages, priority=Priority.BULK)
+                except Exception as e:
+                    logger.error(f"Error notifying telegram user {row['id']}: {e}")
+                    results = []
+
+            if results and all(r.get("ok") for r in results):
+                report.delivered += 1
+                checkpoint.write(json.dumps({"id": row["id"]}) + "\n")
+                checkpoint.flush()
+            else:
+                report.failed += 1
+
+        try:
+            await asyncio.gather(*(notify(row, digest) for row, digest in pending))
+            self._complete_path(today).touch()
+        finally:
+            checkpoint.close()
+            report.duration_s = round(time.monotonic() - started, 3)
+            self.last_report = report
+            logger.info(f"Daily notifications: {json.dumps(asdict(report))}")
+
+        return report
+
+    def _seconds_until_next_run(self) -> float:
+        tz = ZoneInfo(self.settings.timezone)
+        now = datetime.now(tz)
+        next_run = now.replace(
+            hour=self.settings.notifications_hour, minute=0, second=0, microsecond=0
+        )
+        if next_run <= now:
+            next_run += timedelta(days=1)
+        return (next_run - now).total_seconds()
+
+    async def run_forever(self):
+        """Loop del envío programado (se lanza desde el lifespan)"""
+        # Si el servidor se reinició a mitad de un envío de hoy, retomarlo (uno
+        # terminado no se repite aunque haya fallidos o destinatarios nuevos)
+        today = datetime.now(ZoneInfo(self.settings.timezone)).date()
+        if self._checkpoint_path(today).exists() and not self._complete_path(today).exists():
+            await self._run_safely()
+
+        while True:
+            await asyncio.sleep(self._seconds_until_next_run())
+            await self._run_safely()
+
+    async def _run_safely(self):
+        try:
+            await self.run()
+        except Exception as e:
+            logger.error(f"Daily notifications failed: {e}")
+
+    def stats(self) -> dict | None:
+        return asdict(self.last_report) if self.last_report else None
+
+
+_notification_engine: NotificationEngine | None = None
+
+
+def get_notification_engine() -> NotificationEngine:
+    global _notification_engine
+    if _notification_engine is None:
+        _notification_engine = NotificationEngine(get_delivery_scheduler())
+    return _notification_engine
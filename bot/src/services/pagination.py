@@ -0,0 +1,218 @@
+import json
+import logging
+import re
+import secrets
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from src.config import get_settings
+from src.services.cache import PersistentLRUCache
+from src.services.delivery import OutboundMessage
+from src.services.rendering import MAX_MESSAGE_LENGTH, render_reply
+
+
+logger = logging.getLogger(__name__)
+
+# Texto fuente máximo por página (cabe en un mensaje aun después de escapar MarkdownV2)
+PAGE_MAX_CHARS = 3000
+# Respuestas paginadas que se conservan a la vez
+PAGES_CACHE_SIZE = 5000
+# callback_data de los botones (máx. 64 bytes): "pg:<clave>:<página>"
+CALLBACK_PREFIX = "pg:"
+NOOP_CALLBACK = "pg:noop"
+
+# Ítem de primer nivel: "- ", "• ", "* " o "1. " / "1) " sin sangría
+_ITEM = re.compile(r"^(?:[-•*]|\d+[.)])\s")
+
+
+@dataclass
+class _Blocks:
+    header: list[str] = field(default_factory=list)
+    items: list[list[str]] = field(default_factory=list)
+    footer: list[str] = field(default_factory=list)
+
+
+def _split_items(text: str) -> _Blocks:
+    """
+    Separa una respuesta en encabezado, ítems de lista (con sus sub-ítems y
+    líneas de continuación) y cierre. Un subtítulo entre dos listas queda
+    pegado al ítem que le sigue.
+    """
+    blocks = _Blocks()
+    pending: list[str] = []  # Líneas sueltas después de un ítem
+    for line in text.split("\n"):
+        if _ITEM.match(line):
+            blocks.items.append(pending + [line])
+            pending = []
+        elif not blocks.items:
+            blocks.header.append(line)
+        elif pending or (line.strip() and not line[0].isspace()):
+            pending.append(line)
+        else:
+            blocks.items[-1].append(line)
+    blocks.footer = pending
+    return blocks
+
+
+def paginate(text: str, page_items: int) -> list[str] | None:
+    """
+    Divide una respuesta con una lista larga en páginas de hasta `page_items`
+    ítems (y PAGE_MAX_CHARS). El encabezado se repite en cada página y el
+    cierre va en la última. None si no hace falta paginar.
+    """
+    blocks = _split_items(text)
+    if len(blocks.items) <= page_items:
+        return None
+
+    header = "\n".join(blocks.header).strip()
+    footer = "\n".join(blocks.footer).strip()
+    budget = PAGE_MAX_CHARS - len(header) - len(footer)
+    items = ["\n".join(lines).strip("\n") for lines in blocks.items]
+    if any(len(item) > budget for item in items):
+        return None
+
+    chunks: list[list[str]] = [[]]
+    size = 0
+    for item in items:
+        if chunks[-1] and (len(chunks[-1]) >= page_items or size + len(item) + 1 > budget):
+            chunks.append([])
+            size = 0
+        chunks[-1].append(item)
+        size += len(item) + 1
+
+    pages = []
+    for i, chunk in enumerate(chunks):
+        # Un ítem que parte con su subtítulo va separado del anterior
+        body = chunk[0]
+        for item in chunk[1:]:
+            body += ("\n" if _ITEM.match(item) else "\n\n") + item
+        parts = [header, body]
+        if i == len(chunks) - 1:
+            parts.append(footer)
+        pages.append("\n\n".join(p for p in parts if p))
+    return pages
+
+
+def page_keyboard(key: str, page: int, total: int) -> dict:
+    """Inline keyboard ◀️ n/N ▶️ (sin flecha en los extremos)"""
+    buttons = []
+    if page > 0:
+        buttons.append({"text": "◀️", "callback_data": f"{CALLBACK_PREFIX}{key}:{page - 1}"})
+    buttons.append({"text": f"{page + 1}/{total}", "callback_data": NOOP_CALLBACK})
+    if page < total - 1:
+        buttons.append({"text": "▶️", "callback_data": f"{CALLBACK_PREFIX}{key}:{page + 1}"})
+    return {"inline_keyboard": [buttons]}
+
+
+class ResultPager:
+    """
+    Respuestas largas con listas ("todas las propiedades", "todos los
+    vouchers") paginadas con inline keyboards.
+
+    Las páginas se guardan bajo una clave corta en DATA_DIR/pages.db (SQLite,
+    compartida entre el webhook y los workers) por PAGINATION_TTL_MINUTES;
+    los botones cambian de página editando el mensaje sin llamar al agente.
+    """
+
+    def __init__(self, page_items: int, ttl_minutes: int):
+        self.page_items = page_items
+        self.ttl = ttl_minutes * 60
+        self.cache = PersistentLRUCache(
+            Path(get_settings().data_dir) / "pages.db", PAGES_CACHE_SIZE
+        )
+
+        # Métricas
+        self.paginated = 0
+        self.page_views = 0
+        self.expired = 0
+
+    async def render(
+        self, chat_id: int, text: str, reply_to_message_id: int | None = None
+    ) -> list[OutboundMessage]:
+        """Como render_reply, pero una lista larga sale como su primera página con botones"""
+        pages = paginate(text, self.page_items)
+        if pages is None:
+            return render_reply(chat_id, text, reply_to_message_id=reply_to_message_id)
+
+        key = secrets.token_urlsafe(8)
+        await self.cache.set(
+            key, json.dumps({"chat_id": chat_id, "pages": pages, "created_at": time.time()})
+        )
+        self.paginated += 1
+        return self._page_messages(chat_id, key, pages, 0, reply_to_message_id=reply_to_message_id)
+
+    async def page(
+        self, chat_id: int, message_id: int, data: str
+    ) -> list[OutboundMessage] | None:
+        """
+        Mensajes que reemplazan `message_id` por la página pedida en el
+        callback_data `data`. None si la respuesta expiró o no es de este chat.
+        """
+        try:
+            key, page = data.removeprefix(CALLBACK_PREFIX).rsplit(":", 1)
+            page = int(page)
+        except ValueError:
+            return None
+
+        raw = await self.cache.get(key)
+        entry = json.loads(raw) if raw else None
+        if (
+            entry is None
+            or entry["chat_id"] != chat_id
+            or time.time() - entry["created_at"] > self.ttl
+            or not 0 <= page < len(entry["pages"])
+        ):
+            self.expired += 1
+            return None
+
+        self.page_views += 1
+        return self._page_messages(chat_id, key, entry["pages"], page, edit_message_id=message_id)
+
+    def _page_messages(
+        self,
+        chat_id: int,
+        key: str,
+        pages: list[str],
+        page: int,
+        reply_to_message_id: int | None = None,
+        edit_message_id: int | None = None,
+    ) -> list[OutboundMessage]:
+        messages = render_reply(chat_id, pages[page], reply_to_message_id=reply_to_message_id)
+        if len(messages) > 1:
+            # No debería pasar (PAGE_MAX_CHARS): la página va como texto plano en un mensaje
+            messages = [
+                OutboundMessage(
+                    chat_id,
+                    pages[page][:MAX_MESSAGE_LENGTH],
+                    reply_to_message_id=reply_to_message_id,
+                )
+            ]
+        message = messages[0]
+        message.reply_markup = page_keyboard(key, page, len(pages))
+        message.edit_message_id = edit_message_id
+        return [message]
+
+    def close(self):
+        self.cache.close()
+
+    def stats(self) -> dict:
+        return {
+            "paginated": self.paginated,
+            "page_views": self.page_views,
+            "expired": self.expired,
+            "cache": self.cache.stats(),
+        }
+
+
+_result_pager: ResultPager | None = None
+
+
+def get_result_pager() -> ResultPager:
+    global _result_pager
+    if _result_pager is None:
+        settings = get_settings()
+        _result_pager = ResultPager(
+            settings.pagination_page_items, settings.pagination_ttl_minutes
+        )
+    return _result_pager
@@ -0,0 +1,282 @@
+import logging
+import re
+
+from src.services.delivery import OutboundMessage
+
+
+logger = logging.getLogger(__name__)
+
+# Largo máximo de un mensaje de la Bot API
+MAX_MESSAGE_LENGTH = 4096
+
+# Trozos en que se corta una línea que no cabe en un mensaje
+LINE_PIECE = 256
+
+# Caracteres que MarkdownV2 exige escapar fuera de las entidades
+_RESERVED = set("_*[]()~`>#+-=|{}.!")
+_FENCE = re.compile(r"^\s*```")
+
+
+def is_valid_markdown_v2(text: str) -> bool:
+    """
+    Valida localmente que un texto sea MarkdownV2 aceptable para Telegram:
+    caracteres reservados escapados, entidades balanceadas y bien anidadas,
+    y links/código bien cerrados.
+    """
+    stack: list[str] = []
+    i = 0
+    n = len(text)
+
+    def toggle(token: str) -> bool:
+        if stack and stack[-1] == token:
+            stack.pop()
+            return True
+        if token in stack:
+            return False  # Entidades cruzadas: *a _b* c_
+        stack.append(token)
+        return True
+
+    while i < n:
+        c = text[i]
+        line_start = i == 0 or text[i - 1] == "\n"
+
+        if c == "\\":
+            if i + 1 >= n:
+                return False
+            i += 2
+            continue
+
+        if c == "`":
+            fence = "```" if text.startswith("```", i) else "`"
+            j = i + len(fence)
+            while j < n and not text.startswith(fence, j):
+                if text[j] == "\\":
+                    j += 1
+                elif text[j] == "`":
+                    return False
+                j += 1
+            if j >= n:
+                return False
+            i = j + len(fence)
+            continue
+
+        if c == "[":
+            stack.append("[")
+            i += 1
+            continue
+
+        if c == "]":
+            if not stack or stack[-1] != "[" or not text.startswith("(", i + 1):
+                return False
+            stack.pop()
+            j = i + 2
+            while j < n and text[j] != ")":
+                j += 2 if text[j] == "\\" else 1
+            if j >= n:
+                return False
+            i = j + 1
+            continue
+
+        if c == ">" and line_start:
+            i += 1
+            continue
+
+        if text.startswith("**>", i) and line_start:
+            i += 3
+            continue
+
+        if text.startswith("__", i) or text.startswith("||", i):
+            if not toggle(text[i : i + 2]):
+                return False
+            i += 2
+            continue
+
+        if c in "*_~":
+            if not toggle(c):
+                return False
+            i += 1
+            continue
+
+        if c in _RESERVED:
+            return False
+
+        i += 1
+
+    return not stack
+
+
+def _split_blocks(text: str) -> list[str]:
+    """Separa el markdown en párrafos, sin cortar bloques de código"""
+    blocks: list[str] = []
+    current: list[str] = []
+    in_fence = False
+
+    for line in text.split("\n"):
+        if _FENCE.match(line):
+            in_fence = not in_fence
+        if not line.strip() and not in_fence:
+            if current:
+                blocks.append("\n".join(current))
+                current = []
+            continue
+        current.append(line)
+
+    if current:
+        blocks.append("\n".join(current))
+    return blocks
+
+
+def _split_oversized(block: str, limit: int) -> list[str]:
+    """Divide un bloque que no cabe en un mensaje: por líneas, palabras y como último recurso por largo"""
+    lines = block.split("\n")
+
+    # Bloque de código: cada parte se vuelve a envolver en su fence
+    if len(lines) > 2 and _FENCE.match(lines[0]) and _FENCE.match(lines[-1]):
+        opener, closer = lines[0], lines[-1]
+        inner_limit = max(limit - len(opener) - len(closer) - 2, 1)
+        return [f"{opener}\n{part}\n{closer}" for part in _pack(lines[1:-1], inner_limit, "\n")]
+
+    if len(lines) > 1:
+        return _pack(lines, limit, "\n")
+
+    words = block.split(" ")
+    if len(words) > 1:
+        return _pack(words, limit, " ")
+
+    limit = max(limit, 1)
+    return [block[i : i + limit] for i in range(0, len(block), limit)]
+
+
+def _pack(pieces: list[str], limit: int, separator: str) -> list[str]:
+    """Agrupa piezas consecutivas en la menor cantidad de partes de hasta `limit` caracteres"""
+    parts: list[str] = []
+    current = ""
+
+    for piece in pieces:
+        if len(piece) > limit:
+            if current:
+                parts.append(current)
+                current = ""
+            parts.extend(_split_oversized(piece, limit))
+            continue
+
+        candidate = f"{current}{separator}{piece}" if current else piece
+        if len(candidate) <= limit:
+            current = candidate
+        else:
+            parts.append(current)
+            current = piece
+
+    if current:
+        parts.append(current)
+    return parts
+
+
+def _convert(source: str) -> str | None:
+    """Convierte a MarkdownV2; None si la conversión falla o no es válida"""
+    import telegramify_markdown  # Import diferido: el arranque no lo necesita
+
+    try:
+        converted = telegramify_markdown.markdownify(source).rstrip()
+    except Exception as e:
+        logger.warning(f"Markdown conversion failed: {e}")
+        return None
+    if not is_valid_markdown_v2(converted):
+        logger.warning("Converted markdown is not valid MarkdownV2, sending as plain text")
+        return None
+    return converted
+
+
+def _line_pieces(line: str) -> list[tuple[str, str]]:
+    """
+    Trozos de hasta LINE_PIECE caracteres de una línea que no cabe en un
+    mensaje (por palabras; una palabra más larga se corta), cada uno con el
+    separador que lo une al anterior.
+    """
+    pieces: list[tuple[str, str]] = []
+    for word in line.split(" "):
+        chunks = [word[i : i + LINE_PIECE] for i in range(0, len(word), LINE_PIECE)] or [""]
+        for k, chunk in enumerate(chunks):
+            separator = "" if k else " "
+            if pieces and separator and len(pieces[-1][0]) + 1 + len(chunk) <= LINE_PIECE:
+                pieces[-1] = (f"{pieces[-1][0]} {chunk}", pieces[-1][1])
+            else:
+                pieces.append((chunk, separator))
+    return pieces
+
+
+def _to_units(block: str, limit: int, separator: str) -> list[tuple[str, str | None, str]]:
+    """
+    Divide un bloque de markdown en unidades (fuente, MarkdownV2, separador
+    con la anterior) que caben en un mensaje ya convertidas: el bloque entero
+    si cabe; si no, cada línea convertida por separado (y una línea larga en
+    trozos), para después juntarlas en la menor cantidad de mensajes.
+    MarkdownV2 es None si no se pudo convertir a un texto válido.
+    """
+    if len(block) <= limit:
+        converted = _convert(block)
+        if converted is None or len(converted) <= limit:
+            return [(block, converted, separator)]
+
+    lines = block.split("\n")
+    if len(lines) > 2 and _FENCE.match(lines[0]) and _FENCE.match(lines[-1]):
+        parts = _split_oversized(block, limit)
+        if len(parts) == 1:
+            # Código que el escape alarga más que el límite
+            parts = _split_oversized(block, limit // 3)
+        if len(parts) == 1:
+            return [(block, None, separator)]
+        pieces = [(part, "\n") for part in parts]
+    elif len(lines) > 1:
+        pieces = [(line, "\n") for line in lines]
+    else:
+        pieces = _line_pieces(block)
+
+    pieces[0] = (pieces[0][0], separator)
+    return [unit for piece, sep in pieces for unit in _to_units(piece, limit, sep)]
+
+
+def render_reply(
+    chat_id: int,
+    text: str,
+    reply_to_message_id: int | None = None,
+) -> list[OutboundMessage]:
+    """
+    Prepara la respuesta del agente para enviarla a Telegram.
+
+    Convierte el markdown estándar a MarkdownV2 y lo valida localmente. Si no
+    cabe en un mensaje, lo divide en párrafos (sin cortar bloques de código),
+    y los que no caben en líneas, y los agrupa según su largo ya convertido en
+    la menor cantidad de mensajes. Cada parte lleva su texto plano como
+    respaldo por si Telegram rechaza el formato.
+    """
+    messages: list[OutboundMessage] = []
+    for block in _split_blocks(text):
+        for source, converted, separator in _to_units(block, MAX_MESSAGE_LENGTH, "\n\n"):
+            parse_mode = "MarkdownV2" if converted is not None else None
+            rendered = converted if converted is not None else source
+
+            last = messages[-1] if messages else None
+            if (
+                last is not None
+                and last.parse_mode == parse_mode
+                and len(last.text) + len(separator) + len(rendered) <= MAX_MESSAGE_LENGTH
+                and len(last.fallback_text or "") + len(separator) + len(source)
+                <= MAX_MESSAGE_LENGTH
+            ):
+                last.text = f"{last.text}{separator}{rendered}"
+                if parse_mode:
+                    last.fallback_text = f"{last.fallback_text}{separator}{source}"
+            else:
+                messages.append(
+                    OutboundMessage(
+                        chat_id=chat_id,
+                        text=rendered,
+                        parse_mode=parse_mode,
+                        fallback_text=source if parse_mode else None,
+                    )
+                )
+
+    if messages:
+        messages[0].reply_to_message_id = reply_to_message_id
+    return messages
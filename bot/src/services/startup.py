@@ -0,0 +1,139 @@
+import asyncio
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+from src.config import get_settings
+
+
+logger = logging.getLogger(__name__)
+
+
+def _process_age() -> float | None:
+    """Segundos desde que partió el proceso (Linux, vía /proc); None si no se puede saber"""
+    try:
+        with open("/proc/self/stat") as f:
+            # Después del nombre del comando (entre paréntesis) el campo 22 es el inicio
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StartupProfile:
+    """
+    Tiempos del arranque: intérprete e imports, cada paso del lifespan y el
+    prewarm, hasta que la app queda lista para recibir requests.
+    """
+
+    def __init__(self):
+        age = _process_age()
+        self.process_start = time.monotonic() - (age or 0.0)
+        self._last_mark = self.process_start
+        self.phases: dict[str, float] = {}
+        self.ready_after: float | None = None
+
+    def mark(self, name: str):
+        """Registra el tiempo desde la marca anterior (la primera parte del inicio del proceso)"""
+        now = time.monotonic()
+        self.phases[name] = now - self._last_mark
+        self._last_mark = now
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.monotonic() - start
+            self._last_mark = time.monotonic()
+
+    def mark_ready(self):
+        self.ready_after = time.monotonic() - self.process_start
+        phases = ", ".join(f"{name}={seconds:.2f}s" for name, seconds in self.phases.items())
+        logger.info(f"Ready in {self.ready_after:.2f}s ({phases})")
+
+    def report(self) -> dict:
+        from src.services.tracing import get_tracer
+
+        first_request = get_tracer().first_request
+        return {
+            "ready_after_ms": round(self.ready_after * 1000) if self.ready_after else None,
+            "phases_ms": {name: round(seconds * 1000) for name, seconds in self.phases.items()},
+            "first_request_ms": round(first_request * 1000) if first_request else None,
+        }
+
+
+async def _prewarm_telegram():
+    from src.services.telegram import get_telegram_service
+
+    # Abre la conexión HTTP/2 (DNS + TLS) que usarán los envíos
+    await get_telegram_service().get_me()
+
+
+async def _prewarm_supabase():
+    from src.services.supabase_client import ping_supabase
+
+    await ping_supabase()
+
+
+async def _prewarm_agent():
+    from src.agent.agent import get_agent
+
+    await get_agent().prewarm()
+
+
+async def _prewarm_imports():
+    """Módulos que se importan al primer uso (render de respuestas, transcripción)"""
+    import telegramify_markdown  # noqa: F401
+
+    from src.services.transcription import get_transcription_service
+
+    get_transcription_service()
+
+
+async def prewarm(profile: StartupProfile):
+    """
+    Crea y conecta los recursos que usa la primera respuesta antes de
+    declarar la app lista: conexión a Telegram, cliente de Supabase, CLI del
+    agente con su MCP y los imports diferidos. Corre en paralelo y con
+    PREWARM_TIMEOUT; una falla solo se registra (el recurso se crea al
+    primer uso, como sin prewarm).
+    """
+    steps = {
+        "telegram": _prewarm_telegram,
+        "supabase": _prewarm_supabase,
+        "agent": _prewarm_agent,
+        "imports": _prewarm_imports,
+    }
+
+    async def run(name: str, step):
+        start = time.monotonic()
+        try:
+            await step()
+        except Exception as e:
+            logger.warning(f"Prewarm {name} failed: {e!r}")
+        finally:
+            profile.phases[f"prewarm.{name}"] = time.monotonic() - start
+
+    with profile.phase("prewarm"):
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(run(name, step) for name, step in steps.items())),
+                get_settings().prewarm_timeout,
+            )
+        except asyncio.TimeoutError:
+            logger.warning("Prewarm timed out, continuing startup")
+
+
+_startup_profile: StartupProfile | None = None
+
+
+def get_startup_profile() -> StartupProfile:
+    global _startup_profile
+    if _startup_profile is None:
+        _startup_profile = StartupProfile()
+    return _startup_profile
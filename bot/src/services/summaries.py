@@ -0,0 +1,277 @@
+import asyncio
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from calendar import monthrange
+from dataclasses import asdict, dataclass, field
+from datetime import date, datetime
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+from src.config import get_settings
+from src.services.notifications import format_clp
+from src.services.supabase_client import (
+    get_all_telegram_users,
+    get_expiring_contracts,
+    get_pending_payouts,
+    get_pending_vouchers,
+)
+
+
+logger = logging.getLogger(__name__)
+
+# Cada cuánto el loop revisa las organizaciones invalidadas (agrupa varias
+# escrituras seguidas en un solo recálculo)
+INVALIDATE_POLL = 2.0
+# Reintento de un refresco completo que falló
+REFRESH_RETRY = 60.0
+
+# SQL del agente que cambia las cifras de los resúmenes
+_SUMMARY_WRITE = re.compile(
+    r"\b(insert\s+into|update|delete\s+from)\s+(public\.)?\"?(vouchers|contratos|payouts)\b",
+    re.IGNORECASE,
+)
+
+
+def touches_summary(sql: str) -> bool:
+    """True si la consulta escribe en una tabla que entra en los resúmenes"""
+    return bool(_SUMMARY_WRITE.search(sql))
+
+
+@dataclass
+class OrgSummary:
+    """Cifras agregadas de la cartera de una organización"""
+
+    organizacion_id: str
+    refreshed_at: str  # ISO, hora local
+    overdue_count: int = 0  # Vouchers impagos ya vencidos (deuda)
+    overdue_total: float = 0.0  # CLP
+    due_this_month_count: int = 0  # Impagos que vencen de hoy a fin de mes
+    due_this_month_total: float = 0.0
+    contracts_expiring_this_month: int = 0
+    payouts_pending_count: int = 0
+    payouts_pending_total: dict[str, float] = field(default_factory=dict)  # moneda -> monto
+
+    def values(self) -> dict[str, str | int]:
+        """Campos formateados para las plantillas de prompts.py"""
+        payouts = " + ".join(
+            format_clp(amount) if moneda == "CLP" else f"{amount:,.2f} {moneda}"
+            for moneda, amount in sorted(self.payouts_pending_total.items())
+        )
+        return {
+            "refreshed_at": datetime.fromisoformat(self.refreshed_at).strftime("%d/%m %H:%M"),
+            "overdue_count": self.overdue_count,
+            "overdue_total": format_clp(self.overdue_total),
+            "due_count": self.due_this_month_count,
+            "due_total": format_clp(self.due_this_month_total),
+            "contracts": self.contracts_expiring_this_month,
+            "payouts_count": self.payouts_pending_count,
+            "payouts_total": payouts or format_clp(0),
+        }
+
+
+class SummaryMaterializer:
+    """
+    Resúmenes por organización (deuda vencida, vouchers por cobrar, contratos
+    que terminan este mes, payouts pendientes) calculados en segundo plano.
+
+    Se recalculan cada SUMMARIES_REFRESH_MINUTES para todas las
+    organizaciones con usuarios vinculados (con las mismas consultas por lote
+    que la notificación diaria) y, para una organización, poco después de
+    que el agente escribe en vouchers, contratos o payouts.
+
+    Viven en SQLite (DATA_DIR/summaries.db), compartido entre el webhook y los
+    workers como pages.db: cualquier proceso lee los resúmenes e invalida una
+    organización, y el loop de refresco corre solo en el proceso del webhook.
+    Después de un reinicio hay cifras desde el primer mensaje.
+    """
+
+    def __init__(self):
+        self.settings = get_settings()
+        self.interval = self.settings.summaries_refresh_minutes * 60
+        self.path = Path(self.settings.data_dir) / "summaries.db"
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+
+        # Métricas (de este proceso)
+        self.refreshes = 0
+        self.invalidations = 0
+        self.last_refresh_s: float | None = None
+        self.organizations = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(
+                self.path, timeout=30, isolation_level=None, check_same_thread=False
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(
+                "CREATE TABLE IF NOT EXISTS summaries ("
+                " organizacion_id TEXT PRIMARY KEY,"
+                " data TEXT NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS dirty ("
+                " organizacion_id TEXT PRIMARY KEY);"
+            )
+            self._conn = conn
+        return self._conn
+
+    def _get(self, organizacion_id: str) -> OrgSummary | None:
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT data FROM summaries WHERE organizacion_id = ?", (organizacion_id,)
+            ).fetchone()
+        return OrgSummary(**json.loads(row[0])) if row else None
+
+    async def get(self, organizacion_id: str) -> OrgSummary | None:
+        return await asyncio.to_thread(self._get, organizacion_id)
+
+    def _invalidate(self, organizacion_id: str):
+        with self._lock:
+            self._connect().execute(
+                "INSERT OR IGNORE INTO dirty (organizacion_id) VALUES (?)", (organizacion_id,)
+            )
+
+    async def invalidate(self, organizacion_id: str):
+        """Pide recalcular una organización (lo puede llamar cualquier proceso)"""
+        self.invalidations += 1
+        await asyncio.to_thread(self._invalidate, organizacion_id)
+
+    def _take_dirty(self) -> list[str]:
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                org_ids = [row[0] for row in conn.execute("SELECT organizacion_id FROM dirty")]
+                conn.execute("DELETE FROM dirty")
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return sorted(org_ids)
+
+    def _save(self, summaries: dict[str, OrgSummary]):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    "INSERT INTO summaries (organizacion_id, data) VALUES (?, ?)"
+                    " ON CONFLICT(organizacion_id) DO UPDATE SET data = excluded.data",
+                    [(org_id, json.dumps(asdict(s))) for org_id, s in summaries.items()],
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            self.organizations = conn.execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
+
+    async def refresh(self, org_ids: list[str] | None = None) -> dict[str, OrgSummary]:
+        """
+        Recalcula los resúmenes de `org_ids` (por defecto, todas las
+        organizaciones con usuarios vinculados) y los retorna.
+        """
+        started = time.monotonic()
+        now = datetime.now(ZoneInfo(self.settings.timezone))
+        today = now.date()
+        month_end = date(today.year, today.month, monthrange(today.year, today.month)[1])
+
+        if org_ids is None:
+            org_ids = sorted({row["organizacion_id"] for row in await get_all_telegram_users()})
+        if not org_ids:
+            return {}
+
+        vouchers, contracts, payouts = await asyncio.gather(
+            get_pending_vouchers(org_ids, month_end),
+            get_expiring_contracts(org_ids, today, month_end),
+            get_pending_payouts(org_ids),
+        )
+
+        refreshed_at = now.isoformat(timespec="seconds")
+        summaries = {org_id: OrgSummary(org_id, refreshed_at) for org_id in org_ids}
+        for voucher in vouchers:
+            summary = summaries.get(voucher["organizacion_id"])
+            if summary is None:
+                continue
+            amount = float(voucher.get("monto_arriendo_clp") or 0)
+            if date.fromisoformat(voucher["fecha_vencimiento"][:10]) < today:
+                summary.overdue_count += 1
+                summary.overdue_total += amount
+            else:
+                summary.due_this_month_count += 1
+                summary.due_this_month_total += amount
+        for contract in contracts:
+            summary = summaries.get(contract["organizacion_id"])
+            if summary is not None:
+                summary.contracts_expiring_this_month += 1
+        for payout in payouts:
+            summary = summaries.get(payout["organizacion_id"])
+            if summary is None:
+                continue
+            moneda = payout.get("moneda") or "CLP"
+            summary.payouts_pending_count += 1
+            summary.payouts_pending_total[moneda] = (
+                summary.payouts_pending_total.get(moneda, 0.0) + float(payout.get("monto") or 0)
+            )
+
+        await asyncio.to_thread(self._save, summaries)
+        self.refreshes += 1
+        self.last_refresh_s = round(time.monotonic() - started, 3)
+        return summaries
+
+    async def get_or_refresh(self, organizacion_id: str) -> OrgSummary:
+        """El resumen guardado o, si no hay, uno calculado en el momento"""
+        summary = await self.get(organizacion_id)
+        if summary is None:
+            summary = (await self.refresh([organizacion_id]))[organizacion_id]
+        return summary
+
+    async def run_forever(self):
+        """Loop de refresco (se lanza desde el lifespan del webhook, uno por despliegue)"""
+        next_full = 0.0
+        while True:
+            try:
+                if time.monotonic() >= next_full:
+                    next_full = time.monotonic() + self.interval
+                    await asyncio.to_thread(self._take_dirty)
+                    summaries = await self.refresh()
+                    logger.info(
+                        f"Refreshed {len(summaries)} organization summaries "
+                        f"in {self.last_refresh_s}s"
+                    )
+                else:
+                    org_ids = await asyncio.to_thread(self._take_dirty)
+                    if org_ids:
+                        await self.refresh(org_ids)
+            except Exception as e:
+                logger.error(f"Summary refresh failed: {e!r}")
+                next_full = min(next_full, time.monotonic() + REFRESH_RETRY)
+
+            await asyncio.sleep(min(max(next_full - time.monotonic(), 0.1), INVALIDATE_POLL))
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self) -> dict:
+        return {
+            "organizations": self.organizations,
+            "refreshes": self.refreshes,
+            "invalidations": self.invalidations,
+            "last_refresh_s": self.last_refresh_s,
+        }
+
+
+_summary_materializer: SummaryMaterializer | None = None
+
+
+def get_summary_materializer() -> SummaryMaterializer:
+    global _summary_materializer
+    if _summary_materializer is None:
+        _summary_materializer = SummaryMaterializer()
+    return _summary_materializer
@@ -1,16 +1,23 @@
-from supabase import create_client, Client
+import asyncio
+from datetime import date
+from typing import TYPE_CHECKING
 
 from src.config import get_settings
 from src.models.schemas import TelegramUserData
 
+if TYPE_CHECKING:
+    from supabase import Client
 
-_supabase_client: Client | None = None
 
+_supabase_client: "Client | None" = None
 
-def get_supabase() -> Client:
-    """Obtiene el cliente de Supabase (singleton)"""
+
+def get_supabase() -> "Client":
+    """Obtiene el cliente de Supabase (singleton, se importa al primer uso)"""
     global _supabase_client
     if _supabase_client is None:
+        from supabase import create_client
+
         settings = get_settings()
         _supabase_client = create_client(
             settings.supabase_url,
@@ -19,11 +26,24 @@ def get_supabase() -> Client:
     return _supabase_client
 
 
+async def ping_supabase():
+    """Crea el cliente y hace una consulta mínima (abre la conexión)"""
+
+    def ping():
+        get_supabase().table("telegram_users").select("id").limit(1).execute()
+
+    await asyncio.to_thread(ping)
+
+
 async def get_user_by_telegram_id(telegram_id: int) -> TelegramUserData | None:
     """
     Busca un usuario por su telegram_id.
     Retorna los datos del usuario y su organización activa.
     """
+    return await asyncio.to_thread(_get_user_by_telegram_id, telegram_id)
+
+
+def _get_user_by_telegram_id(telegram_id: int) -> TelegramUserData | None:
     supabase = get_supabase()
 
     # Query simple sin JOINs para evitar problemas con RLS
@@ -35,7 +55,8 @@ async def get_user_by_telegram_id(telegram_id: int) -> TelegramUserData | None:
         .execute()
     )
 
-    if not result.data:
+    # maybe_single() retorna None (no una respuesta vacía) si no hay filas
+    if not result or not result.data:
         return None
 
     data = result.data
@@ -48,7 +69,7 @@ async def get_user_by_telegram_id(telegram_id: int) -> TelegramUserData | None:
         .maybe_single()
         .execute()
     )
-    user_data = user_result.data or {}
+    user_data = (user_result.data if user_result else None) or {}
     user_nombre = user_data.get("nombre", "")
     user_apellido = user_data.get("apellido", "")
     full_name = f"{user_nombre} {user_apellido}".strip() or "Usuario"
@@ -61,7 +82,7 @@ async def get_user_by_telegram_id(telegram_id: int) -> TelegramUserData | None:
         .maybe_single()
         .execute()
     )
-    org_data = org_result.data or {}
+    org_data = (org_result.data if org_result else None) or {}
     org_nombre = org_data.get("nombre")
     org_url = org_data.get("url")
 
@@ -80,6 +101,10 @@ async def get_user_organizations(user_id: str) -> list[dict]:
     """
     Obtiene todas las organizaciones a las que pertenece un usuario.
     """
+    return await asyncio.to_thread(_get_user_organizations, user_id)
+
+
+def _get_user_organizations(user_id: str) -> list[dict]:
     supabase = get_supabase()
 
     # Obtener IDs de organizaciones
@@ -101,7 +126,7 @@ async def get_user_organizations(user_id: str) -> list[dict]:
             .maybe_single()
             .execute()
         )
-        org_data = org_result.data or {}
+        org_data = (org_result.data if org_result else None) or {}
         orgs.append({
             "organizacion_id": org_id,
             "nombre": org_data.get("nombre", "Sin nombre"),
@@ -114,6 +139,10 @@ async def update_telegram_user_org(telegram_user_id: str, new_org_id: str) -> bo
     """
     Actualiza la organización activa de un usuario de Telegram.
     """
+    return await asyncio.to_thread(_update_telegram_user_org, telegram_user_id, new_org_id)
+
+
+def _update_telegram_user_org(telegram_user_id: str, new_org_id: str) -> bool:
     supabase = get_supabase()
 
     result = (
@@ -132,6 +161,12 @@ async def create_telegram_user(
     """
     Crea un nuevo registro de telegram_user.
     """
+    return await asyncio.to_thread(_create_telegram_user, telegram_id, user_id, organizacion_id)
+
+
+def _create_telegram_user(
+    telegram_id: int, user_id: str, organizacion_id: str
+) -> TelegramUserData:
     supabase = get_supabase()
 
     result = (
@@ -153,3 +188,118 @@ async def create_telegram_user(
         user_id=data["user_id"],
         organizacion_id=data["organizacion_id"],
     )
+
+
+# ============== Consultas masivas (notificaciones / resúmenes) ==============
+
+PAGE_SIZE = 1000
+IN_BATCH_SIZE = 100  # IDs por filtro IN (largo de URL)
+
+# Estados de voucher que aún esperan pago
+PENDING_VOUCHER_STATES = ["GENERADO", "ENVIADO", "VENCIDO"]
+# Estados de payout aún no pagados al beneficiario
+PENDING_PAYOUT_STATES = ["pending", "processing"]
+
+
+def _fetch_all(build_query) -> list[dict]:
+    """Ejecuta una consulta paginando con range() hasta traer todas las filas"""
+    rows: list[dict] = []
+    start = 0
+    while True:
+        result = build_query().range(start, start + PAGE_SIZE - 1).execute()
+        page = result.data or []
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            return rows
+        start += PAGE_SIZE
+
+
+def _fetch_in(table: str, columns: str, column: str, values: list, apply_filters=None) -> list[dict]:
+    """Consulta `table` filtrando `column IN values`, en lotes"""
+    supabase = get_supabase()
+    rows: list[dict] = []
+    values = list(dict.fromkeys(values))
+
+    for i in range(0, len(values), IN_BATCH_SIZE):
+        batch = values[i : i + IN_BATCH_SIZE]
+
+        def build_query(batch=batch):
+            query = supabase.table(table).select(columns).in_(column, batch)
+            return apply_filters(query) if apply_filters else query
+
+        rows.extend(_fetch_all(build_query))
+    return rows
+
+
+async def get_all_telegram_users() -> list[dict]:
+    """Todos los usuarios de Telegram vinculados"""
+    supabase = get_supabase()
+    return await asyncio.to_thread(
+        _fetch_all,
+        lambda: supabase.table("telegram_users")
+        .select("id, telegram_id, user_id, organizacion_id")
+        .order("id"),
+    )
+
+
+async def get_users_by_ids(user_ids: list[str]) -> list[dict]:
+    return await asyncio.to_thread(
+        _fetch_in, "users", "user_id, nombre, apellido", "user_id", user_ids
+    )
+
+
+async def get_organizations_by_ids(org_ids: list[str]) -> list[dict]:
+    return await asyncio.to_thread(
+        _fetch_in, "organizaciones", "organizacion_id, nombre, url", "organizacion_id", org_ids
+    )
+
+
+async def get_properties_by_ids(propiedad_ids: list[int]) -> list[dict]:
+    return await asyncio.to_thread(
+        _fetch_in, "propiedades", "propiedad_id, calle, numero, comuna", "propiedad_id", propiedad_ids
+    )
+
+
+async def get_pending_vouchers(org_ids: list[str], due_before: date) -> list[dict]:
+    """
+    Vouchers sin pagar de las organizaciones dadas con vencimiento
+    anterior o igual a `due_before`.
+    """
+    return await asyncio.to_thread(
+        _fetch_in,
+        "vouchers",
+        "voucher_id, organizacion_id, propiedad_id, folio, periodo, "
+        "fecha_vencimiento, moneda, monto_arriendo, monto_arriendo_clp, estado",
+        "organizacion_id",
+        org_ids,
+        lambda query: query.in_("estado", PENDING_VOUCHER_STATES)
+        .lte("fecha_vencimiento", due_before.isoformat())
+        .order("fecha_vencimiento"),
+    )
+
+
+async def get_expiring_contracts(org_ids: list[str], start: date, end: date) -> list[dict]:
+    """Contratos vigentes de las organizaciones dadas que terminan entre `start` y `end`"""
+    return await asyncio.to_thread(
+        _fetch_in,
+        "contratos",
+        "contrato_id, organizacion_id, propiedad_id, fecha_termino",
+        "organizacion_id",
+        org_ids,
+        lambda query: query.eq("estado", "VIGENTE")
+        .gte("fecha_termino", start.isoformat())
+        .lte("fecha_termino", end.isoformat())
+        .order("fecha_termino"),
+    )
+
+
+async def get_pending_payouts(org_ids: list[str]) -> list[dict]:
+    """Payouts de las organizaciones dadas que aún no se completan"""
+    return await asyncio.to_thread(
+        _fetch_in,
+        "payouts",
+        "payout_id, organizacion_id, estado, monto, moneda",
+        "organizacion_id",
+        org_ids,
+        lambda query: query.in_("estado", PENDING_PAYOUT_STATES),
+    )
@@ -1,16 +1,73 @@
-import httpx
-import tempfile
+import logging
 import os
+import tempfile
+from collections.abc import AsyncIterator
+
+import httpx
 
 from src.config import get_settings
+from src.services.tracing import get_tracer
+
+
+logger = logging.getLogger(__name__)
+
+
+# Pool de conexiones hacia api.telegram.org (keep-alive + HTTP/2)
+POOL_LIMITS = httpx.Limits(
+    max_connections=100,
+    max_keepalive_connections=20,
+    keepalive_expiry=120.0,
+)
+POOL_TIMEOUT = httpx.Timeout(30.0, connect=5.0, pool=10.0)
+TEMP_PREFIX = "rsbot-"  # Prefijo de los archivos temporales de descargas
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
+class TelegramFileError(Exception):
+    """No se pudo descargar un archivo de Telegram"""
+
+
+class FileTooLargeError(TelegramFileError):
+    """El archivo supera el tamaño máximo permitido"""
+
+    def __init__(self, size: int, max_size: int):
+        super().__init__(f"File size {size} exceeds limit of {max_size} bytes")
+        self.size = size
+        self.max_size = max_size
 
 
 class TelegramService:
     def __init__(self):
         settings = get_settings()
         self.token = settings.telegram_bot_token
-        self.base_url = f"https://api.telegram.org/bot{self.token}"
-        self.file_url = f"https://api.telegram.org/file/bot{self.token}"
+        self.base_url = f"{settings.telegram_api_url}/bot{self.token}"
+        self.file_url = f"{settings.telegram_api_url}/file/bot{self.token}"
+        self._client: httpx.AsyncClient | None = None
+        self.temp_files: set[str] = set()  # Descargas a disco aún no liberadas
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """
+        Cliente HTTP compartido. Se crea en el lifespan de la app; si se usa
+        fuera de él (scripts), se crea al primer uso.
+        """
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                http2=True,
+                limits=POOL_LIMITS,
+                timeout=POOL_TIMEOUT,
+            )
+        return self._client
+
+    async def start(self):
+        """Abre el pool de conexiones"""
+        _ = self.client
+
+    async def close(self):
+        """Cierra el pool de conexiones"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
 
     async def send_message(
         self,
@@ -18,66 +75,218 @@ class TelegramService:
         text: str,
         reply_to_message_id: int | None = None,
         parse_mode: str | None = None,
+        reply_markup: dict | None = None,
     ) -> dict:
-        """Envía un mensaje a un chat"""
-        async with httpx.AsyncClient() as client:
-            payload = {
-                "chat_id": chat_id,
-                "text": text,
-            }
-            if parse_mode:
-                payload["parse_mode"] = parse_mode
-            if reply_to_message_id:
-                payload["reply_to_message_id"] = reply_to_message_id
+        """Envía un mensaje a un chat. Retorna la respuesta de la Bot API"""
+        payload = {
+            "chat_id": chat_id,
+            "text": text,
+        }
+        if parse_mode:
+            payload["parse_mode"] = parse_mode
+        if reply_to_message_id:
+            payload["reply_to_message_id"] = reply_to_message_id
+        if reply_markup:
+            payload["reply_markup"] = reply_markup
+
+        with get_tracer().span("telegram.send_message"):
+            response = await self.client.post(f"{self.base_url}/sendMessage", json=payload)
+        return self._json(response)
+
+    async def edit_message_text(
+        self,
+        chat_id: int,
+        message_id: int,
+        text: str,
+        parse_mode: str | None = None,
+        reply_markup: dict | None = None,
+    ) -> dict:
+        """Reemplaza el texto (y el teclado) de un mensaje ya enviado"""
+        payload = {"chat_id": chat_id, "message_id": message_id, "text": text}
+        if parse_mode:
+            payload["parse_mode"] = parse_mode
+        if reply_markup:
+            payload["reply_markup"] = reply_markup
+
+        with get_tracer().span("telegram.edit_message"):
+            response = await self.client.post(f"{self.base_url}/editMessageText", json=payload)
+        return self._json(response)
+
+    async def answer_callback_query(self, callback_query_id: str, text: str | None = None) -> dict:
+        """Confirma la pulsación de un botón (quita el indicador de carga del cliente)"""
+        payload = {"callback_query_id": callback_query_id}
+        if text:
+            payload["text"] = text
+        response = await self.client.post(f"{self.base_url}/answerCallbackQuery", json=payload)
+        return self._json(response)
 
-            response = await client.post(f"{self.base_url}/sendMessage", json=payload)
+    @staticmethod
+    def _json(response: httpx.Response) -> dict:
+        """Respuesta de la Bot API; si no es JSON (p.ej. un 502 del proxy) una de error equivalente"""
+        try:
             return response.json()
+        except ValueError:
+            return {
+                "ok": False,
+                "error_code": response.status_code,
+                "description": response.text[:200],
+            }
 
-    async def download_file(self, file_id: str) -> str | None:
+    async def _get_file_path(self, file_id: str, max_size: int | None) -> str:
+        """Resuelve el file_path de un archivo validando su tamaño"""
+        with get_tracer().span("telegram.get_file"):
+            response = await self.client.get(
+                f"{self.base_url}/getFile", params={"file_id": file_id}
+            )
+        try:
+            data = response.json()
+        except ValueError:
+            raise TelegramFileError(f"HTTP {response.status_code} on getFile")
+
+        if not data.get("ok"):
+            raise TelegramFileError(data.get("description", "getFile failed"))
+
+        result = data["result"]
+        size = result.get("file_size")
+        if max_size and size and size > max_size:
+            raise FileTooLargeError(size, max_size)
+
+        return result["file_path"]
+
+    async def stream_file(
+        self,
+        file_id: str,
+        file_size: int | None = None,
+        max_size: int | None = None,
+    ) -> AsyncIterator[bytes]:
         """
-        Descarga un archivo de Telegram y lo guarda en un archivo temporal.
-        Retorna la ruta del archivo.
+        Descarga un archivo de Telegram por partes, sin cargarlo completo en memoria.
+
+        `file_size` es el tamaño informado en el update (TelegramVoice/Document):
+        si supera `max_size` se rechaza antes de pedir nada a Telegram.
+        Lanza FileTooLargeError si el archivo supera el límite y
+        TelegramFileError si no se puede descargar.
         """
-        async with httpx.AsyncClient() as client:
-            # Obtener file_path
-            response = await client.get(f"{self.base_url}/getFile", params={"file_id": file_id})
-            data = response.json()
+        file_path, max_size = await self._resolve_download(file_id, file_size, max_size)
+        async for chunk in self._stream_path(file_path, max_size):
+            yield chunk
 
-            if not data.get("ok"):
-                return None
+    async def _resolve_download(
+        self, file_id: str, file_size: int | None, max_size: int | None
+    ) -> tuple[str, int]:
+        """Valida el tamaño y obtiene el file_path de Telegram. Retorna (file_path, max_size)"""
+        if max_size is None:
+            max_size = get_settings().max_download_bytes
+        if file_size and file_size > max_size:
+            raise FileTooLargeError(file_size, max_size)
+        return await self._get_file_path(file_id, max_size), max_size
 
-            file_path = data["result"]["file_path"]
+    async def _stream_path(self, file_path: str, max_size: int) -> AsyncIterator[bytes]:
+        async with self.client.stream("GET", f"{self.file_url}/{file_path}") as response:
+            if response.status_code != 200:
+                raise TelegramFileError(f"HTTP {response.status_code} downloading {file_path}")
 
-            # Descargar archivo
-            file_response = await client.get(f"{self.file_url}/{file_path}")
+            received = 0
+            async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                received += len(chunk)
+                if received > max_size:
+                    raise FileTooLargeError(received, max_size)
+                yield chunk
 
-            if file_response.status_code != 200:
-                return None
+    async def download_bytes(
+        self,
+        file_id: str,
+        file_size: int | None = None,
+        max_size: int | None = None,
+    ) -> bytes | None:
+        """
+        Descarga un archivo de Telegram a memoria.
+        Retorna None si no se pudo descargar; FileTooLargeError se propaga.
+        """
+        buffer = bytearray()
+        try:
+            async for chunk in self.stream_file(file_id, file_size=file_size, max_size=max_size):
+                buffer += chunk
+        except FileTooLargeError:
+            raise
+        except (TelegramFileError, httpx.HTTPError) as e:
+            logger.error(f"Error downloading file {file_id}: {e}")
+            return None
+        return bytes(buffer)
 
-            # Guardar en archivo temporal
-            extension = os.path.splitext(file_path)[1] or ".tmp"
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=extension)
-            temp_file.write(file_response.content)
-            temp_file.close()
+    async def download_file(
+        self,
+        file_id: str,
+        file_size: int | None = None,
+        max_size: int | None = None,
+        suffix: str | None = None,
+    ) -> str | None:
+        """
+        Descarga un archivo de Telegram y lo guarda en un archivo temporal,
+        escribiendo cada parte a medida que llega. Retorna la ruta del archivo.
+        Sin `suffix`, se usa la extensión del file_path de Telegram.
+        """
+        temp_file = None
+        try:
+            file_path, max_size = await self._resolve_download(file_id, file_size, max_size)
+            if suffix is None:
+                suffix = os.path.splitext(file_path)[1] or ".tmp"
+            async for chunk in self._stream_path(file_path, max_size):
+                if temp_file is None:
+                    temp_file = tempfile.NamedTemporaryFile(
+                        delete=False, suffix=suffix, prefix=TEMP_PREFIX
+                    )
+                    self.temp_files.add(temp_file.name)
+                temp_file.write(chunk)
+            if temp_file is not None:
+                temp_file.close()
+        except BaseException as e:
+            # Cualquier falla (también de disco o cancelación) no deja el archivo a medias
+            if temp_file is not None:
+                temp_file.close()
+                self.release_temp_file(temp_file.name)
+            if isinstance(e, (TelegramFileError, httpx.HTTPError)):
+                logger.error(f"Error downloading file {file_id}: {e}")
+                if not isinstance(e, FileTooLargeError):
+                    return None
+            raise
 
-            return temp_file.name
+        return temp_file.name if temp_file is not None else None
+
+    def release_temp_file(self, path: str):
+        """Borra un archivo de download_file cuando ya no se necesita"""
+        self.temp_files.discard(path)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def cleanup_temp_files(self) -> int:
+        """Borra las descargas que nadie liberó (al apagar). Retorna cuántas eran"""
+        paths = list(self.temp_files)
+        for path in paths:
+            self.release_temp_file(path)
+        return len(paths)
+
+    async def get_me(self) -> dict:
+        """Datos del bot (también sirve para abrir la conexión al arrancar)"""
+        response = await self.client.get(f"{self.base_url}/getMe")
+        return response.json()
 
     async def set_webhook(self, webhook_url: str) -> bool:
         """Configura el webhook de Telegram"""
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/setWebhook",
-                json={"url": webhook_url},
-            )
-            data = response.json()
-            return data.get("ok", False)
+        response = await self.client.post(
+            f"{self.base_url}/setWebhook",
+            json={"url": webhook_url},
+        )
+        data = response.json()
+        return data.get("ok", False)
 
     async def delete_webhook(self) -> bool:
         """Elimina el webhook de Telegram"""
-        async with httpx.AsyncClient() as client:
-            response = await client.post(f"{self.base_url}/deleteWebhook")
-            data = response.json()
-            return data.get("ok", False)
+        response = await self.client.post(f"{self.base_url}/deleteWebhook")
+        data = response.json()
+        return data.get("ok", False)
 
 
 _telegram_service: TelegramService | None = None
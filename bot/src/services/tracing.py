@@ -0,0 +1,126 @@
+import json
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from src.config import get_settings
+from src.services.metrics import Histogram
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Span:
+    name: str
+    start: float  # Segundos desde el inicio del trace
+    duration: float
+
+
+@dataclass
+class Trace:
+    """Spans de un update de Telegram, de punta a punta"""
+
+    update_id: int
+    started_at: float = field(default_factory=time.perf_counter)
+    spans: list[Span] = field(default_factory=list)
+    attributes: dict = field(default_factory=dict)
+
+
+_current_trace: ContextVar[Trace | None] = ContextVar("current_trace", default=None)
+
+
+class Tracer:
+    """
+    Registra la duración de cada etapa del pipeline de mensajes.
+
+    Cada etapa alimenta un histograma por nombre (servido en /metrics) y, si
+    hay un trace activo (un update en proceso), queda como span de ese trace.
+    Los traces que superan TRACE_SLOW_SECONDS se escriben completos en el
+    log como JSON (exemplars).
+    """
+
+    def __init__(self):
+        self.slow_seconds = get_settings().trace_slow_seconds
+        self.histograms: dict[str, Histogram] = {}
+        self.first_request: float | None = None  # Duración del primer update tras el arranque
+
+    def record(self, name: str, duration: float, start: float | None = None):
+        """Registra una etapa ya medida (`start` en perf_counter)"""
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.add(duration)
+
+        trace = _current_trace.get()
+        if trace is not None:
+            offset = (start if start is not None else time.perf_counter() - duration) - trace.started_at
+            trace.spans.append(Span(name, offset, duration))
+
+    @contextmanager
+    def span(self, name: str):
+        """Mide un bloque (sync o async) como una etapa"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start, start)
+
+    def annotate(self, **attributes):
+        """Agrega atributos al trace activo (p.ej. tipo de mensaje)"""
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.attributes.update(attributes)
+
+    @contextmanager
+    def trace(self, update_id: int):
+        """Abre el trace de un update; al cerrar registra el total y el exemplar si fue lento"""
+        trace = Trace(update_id)
+        token = _current_trace.set(trace)
+        try:
+            yield trace
+        finally:
+            _current_trace.reset(token)
+            total = time.perf_counter() - trace.started_at
+            self.record("request", total)
+            if self.first_request is None:
+                self.first_request = total
+            if total >= self.slow_seconds:
+                self._log_exemplar(trace, total)
+
+    def _log_exemplar(self, trace: Trace, total: float):
+        logger.warning(
+            json.dumps(
+                {
+                    "event": "slow_request",
+                    "update_id": trace.update_id,
+                    "total_ms": round(total * 1000, 1),
+                    **trace.attributes,
+                    "spans": [
+                        {
+                            "name": s.name,
+                            "start_ms": round(s.start * 1000, 1),
+                            "duration_ms": round(s.duration * 1000, 1),
+                        }
+                        for s in sorted(trace.spans, key=lambda s: s.start)
+                    ],
+                },
+                ensure_ascii=False,
+            )
+        )
+
+    def stats(self) -> dict:
+        """Histograma y percentiles por etapa"""
+        return {name: h.snapshot() for name, h in sorted(self.histograms.items())}
+
+
+_tracer: Tracer | None = None
+
+
+def get_tracer() -> Tracer:
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer()
+    return _tracer
@@ -1,28 +1,156 @@
-from groq import Groq
+import asyncio
+import logging
+import random
+import time
+from pathlib import Path
 
 from src.config import get_settings
+from src.services.audio import AudioProcessingError, get_audio_pipeline
+from src.services.cache import PersistentLRUCache
+from src.services.metrics import LatencyWindow
+
+
+logger = logging.getLogger(__name__)
+
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
 
 
 class TranscriptionService:
+    """
+    Transcripción con Groq Whisper sin bloquear el event loop.
+
+    Limita las transcripciones simultáneas, corta cada llamada con un timeout
+    y reintenta los errores transitorios con backoff exponencial con jitter.
+    `GROQ_BASE_URL` permite apuntar a un endpoint falso local
+    (ver benchmarks/fakes/groq.py).
+    """
+
     def __init__(self):
+        # groq se importa aquí y no al cargar el módulo: el arranque no lo necesita
+        from groq import (
+            APIConnectionError,
+            APITimeoutError,
+            AsyncGroq,
+            InternalServerError,
+            RateLimitError,
+        )
+
         settings = get_settings()
-        self.client = Groq(api_key=settings.groq_api_key)
+        self.client = AsyncGroq(
+            api_key=settings.groq_api_key,
+            base_url=settings.groq_base_url,
+            max_retries=0,  # Los reintentos se manejan aquí
+            timeout=settings.transcription_timeout,
+        )
+        self.timeout = settings.transcription_timeout
+        self.max_retries = settings.transcription_max_retries
+        self.semaphore = asyncio.Semaphore(settings.transcription_concurrency)
+
+        # Errores que vale la pena reintentar
+        self.transient_errors = (
+            asyncio.TimeoutError,
+            APIConnectionError,
+            APITimeoutError,
+            RateLimitError,
+            InternalServerError,
+        )
 
-    async def transcribe(self, audio_path: str) -> str | None:
+        # Métricas
+        self.completed = 0
+        self.failed = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.in_flight = 0
+        self.latencies = LatencyWindow()
+
+    async def _request(self, audio: bytes, filename: str) -> str:
+        async with self.semaphore:
+            self.in_flight += 1
+            try:
+                transcription = await asyncio.wait_for(
+                    self.client.audio.transcriptions.create(
+                        file=(filename, audio),
+                        model="whisper-large-v3-turbo",
+                        language="es",
+                    ),
+                    self.timeout,
+                )
+            finally:
+                self.in_flight -= 1
+        return transcription.text
+
+    async def transcribe(self, audio: bytes, filename: str = "voice.ogg") -> str | None:
         """
-        Transcribe un archivo de audio usando Groq Whisper.
+        Transcribe audio en memoria usando Groq Whisper.
+        `filename` solo se usa para que la API detecte el formato.
         """
+        start = time.monotonic()
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                text = await self._request(audio, filename)
+                self.completed += 1
+                self.latencies.add(time.monotonic() - start)
+                return text
+            except self.transient_errors as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    self.timeouts += 1
+                if attempt == self.max_retries:
+                    logger.error(f"Error transcribing audio after {attempt + 1} attempts: {e!r}")
+                    break
+
+                # Full jitter: espera aleatoria hasta el backoff exponencial
+                delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2**attempt))
+                self.retries += 1
+                logger.warning(f"Transient transcription error ({e!r}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+            except Exception as e:
+                logger.error(f"Error transcribing audio: {e!r}")
+                break
+
+        self.failed += 1
+        return None
+
+    async def transcribe_voice(self, audio: bytes, duration: int | None = None) -> str | None:
+        """
+        Transcribe una nota de voz. Las largas se cortan en sus silencios y los
+        chunks se transcriben en paralelo y se unen en orden, así la latencia no
+        crece con el largo del audio. Ante cualquier falla se transcribe el
+        audio original completo.
+        """
+        pipeline = get_audio_pipeline()
+        if not pipeline.should_split(duration):
+            return await self.transcribe(audio)
+
         try:
-            with open(audio_path, "rb") as audio_file:
-                transcription = self.client.audio.transcriptions.create(
-                    file=(audio_path, audio_file.read()),
-                    model="whisper-large-v3-turbo",
-                    language="es",
-                )
-                return transcription.text
-        except Exception as e:
-            print(f"Error transcribing audio: {e}")
-            return None
+            chunks = await pipeline.split(audio)
+        except AudioProcessingError as e:
+            logger.warning(f"Audio preprocessing failed, transcribing original: {e}")
+            return await self.transcribe(audio)
+
+        if not chunks:
+            return None  # Solo silencio
+
+        texts = await asyncio.gather(
+            *(self.transcribe(chunk, f"chunk-{i}.ogg") for i, chunk in enumerate(chunks))
+        )
+        if any(text is None for text in texts):
+            logger.warning("Chunk transcription failed, transcribing original")
+            return await self.transcribe(audio)
+
+        return " ".join(text.strip() for text in texts if text.strip())
+
+    def stats(self) -> dict:
+        """Métricas de transcripción"""
+        return {
+            "completed": self.completed,
+            "failed": self.failed,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "in_flight": self.in_flight,
+            "latency_ms": self.latencies.percentiles(0.50, 0.95, 0.99),
+        }
 
 
 _transcription_service: TranscriptionService | None = None
@@ -33,3 +161,18 @@ def get_transcription_service() -> TranscriptionService:
     if _transcription_service is None:
         _transcription_service = TranscriptionService()
     return _transcription_service
+
+
+_transcription_cache: PersistentLRUCache | None = None
+
+
+def get_transcription_cache() -> PersistentLRUCache:
+    """Transcripciones por file_unique_id de Telegram (mismo audio => misma clave)"""
+    global _transcription_cache
+    if _transcription_cache is None:
+        settings = get_settings()
+        _transcription_cache = PersistentLRUCache(
+            Path(settings.data_dir) / "transcriptions.sqlite3",
+            max_entries=settings.transcription_cache_size,
+        )
+    return _transcription_cache
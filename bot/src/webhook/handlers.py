@@ -1,20 +1,33 @@
+import asyncio
 import logging
-import os
+from collections.abc import Awaitable
 
-import telegramify_markdown
 from fastapi import APIRouter, Request
 from pydantic import ValidationError
 
-from src.models.schemas import TelegramUpdate, TelegramUserData
-from src.services.telegram import get_telegram_service
-from src.services.transcription import get_transcription_service
+from src.config import get_settings
+from src.models.schemas import TelegramCallbackQuery, TelegramUpdate, TelegramUserData
+from src.services.capture import get_update_recorder
+from src.services.delivery import Priority, get_delivery_scheduler
+from src.services.documents import get_document_pipeline
+from src.services.drain import get_drain_coordinator
+from src.services.jobs import get_job_queue
+from src.services.pagination import CALLBACK_PREFIX, NOOP_CALLBACK, get_result_pager
+from src.services.rendering import render_reply
+from src.services.summaries import get_summary_materializer
+from src.services.telegram import FileTooLargeError, get_telegram_service
+from src.services.tracing import get_tracer
+from src.services.transcription import get_transcription_cache, get_transcription_service
 from src.services.supabase_client import (
     get_user_by_telegram_id,
     get_user_organizations,
     update_telegram_user_org,
 )
-from src.agent.agent import get_agent
+from src.agent.agent import PreparedTurn, get_agent
 from src.agent.prompts import (
+    INTERRUPTED_NOTE,
+    PAGE_EXPIRED_MESSAGE,
+    PORTFOLIO_SUMMARY_MESSAGE,
     UNLINKED_USER_MESSAGE,
     WELCOME_MESSAGE,
     NO_MORE_ORGS_MESSAGE,
@@ -32,8 +45,6 @@ _pending_org_selection: dict[int, list[dict]] = {}
 @router.post("/webhook")
 async def telegram_webhook(request: Request):
     """Recibe y procesa updates de Telegram"""
-    telegram = get_telegram_service()
-
     try:
         body = await request.json()
         update = TelegramUpdate.model_validate(body)
@@ -41,92 +52,253 @@ async def telegram_webhook(request: Request):
         logger.error(f"Error validating update: {e}")
         return {"ok": False, "error": "Invalid update"}
 
+    get_update_recorder().record(body)
+
+    # Apagándose: el update queda guardado para la siguiente instancia
+    drain = get_drain_coordinator()
+    if drain.draining:
+        drain.persist(body, reason="draining")
+        return {"ok": True}
+
+    with get_tracer().trace(update.update_id):
+        return await drain.run(body, process_update(update))
+
+
+async def resume_update(body: dict, interrupted: bool) -> dict:
+    """Procesa un update que dejó pendiente la instancia anterior al apagarse"""
+    update = TelegramUpdate.model_validate(body)
+    with get_tracer().trace(update.update_id):
+        get_tracer().annotate(resumed=True)
+        return await process_update(update, interrupted=interrupted)
+
+
+async def process_update(update: TelegramUpdate, interrupted: bool = False) -> dict:
+    """
+    Procesa un update ya validado. En EXECUTION_MODE=queue los comandos y la
+    selección de organización se atienden aquí y el resto se encola para los
+    workers; si no, todo se procesa en este proceso.
+    `interrupted` indica que una instancia anterior lo dejó a medias.
+    """
+    # Botones (paginación): se atienden aquí, sin el agente
+    if update.callback_query:
+        get_tracer().annotate(kind="callback")
+        await handle_callback_query(update.callback_query)
+        return {"ok": True}
+
     if not update.message or not update.message.from_user:
         return {"ok": True}
 
+    if get_settings().execution_mode == "queue" and not _handled_by_ingestion(update.message):
+        get_tracer().annotate(kind="queued")
+        with get_tracer().span("enqueue"):
+            await get_job_queue().enqueue(
+                update.message.from_user.id,
+                update.model_dump(by_alias=True, exclude_none=True),
+                interrupted=interrupted,
+            )
+        return {"ok": True}
+
+    return await handle_message(update, interrupted)
+
+
+def _handled_by_ingestion(message) -> bool:
+    """
+    Comandos y respuestas a la selección de organización: son rápidos y la
+    selección pendiente vive en la memoria de este proceso.
+    """
+    text = message.text or ""
+    return text.startswith("/") or message.from_user.id in _pending_org_selection
+
+
+async def handle_message(update: TelegramUpdate, interrupted: bool = False) -> dict:
+    """Procesa un mensaje completo (texto, audio o documento) hasta enviar la respuesta"""
+    delivery = get_delivery_scheduler()
+    tracer = get_tracer()
+
     message = update.message
     chat_id = message.from_user.id
     telegram_id = message.from_user.id
 
-    # Obtener usuario vinculado
-    user_data = await get_user_by_telegram_id(telegram_id)
+    # Comandos de texto: solo necesitan el usuario
+    if message.text and message.text.startswith("/"):
+        tracer.annotate(kind="command")
+        with tracer.span("user_lookup"):
+            user_data = await get_user_by_telegram_id(telegram_id)
+        await handle_command(chat_id, telegram_id, message.text, user_data)
+        return {"ok": True}
+
+    # Etapas previas al agente en paralelo: la búsqueda del usuario y la
+    # extracción del contenido (descarga y transcripción, PDFs). Con el usuario
+    # resuelto se conecta el agente mientras termina el contenido; si una etapa
+    # descarta el mensaje, lo que sigue corriendo se cancela.
+    agent = get_agent()
+    selecting = telegram_id in _pending_org_selection
+    # Un caption con comando (p.ej. /vincular en una foto) sigue el camino de
+    # los comandos: sirve aunque el usuario no esté vinculado
+    caption_command = (message.caption or "").startswith("/")
+    prepared: PreparedTurn | None = None
+    try:
+        async with asyncio.TaskGroup() as stages:
+            user_task = stages.create_task(
+                _stage("user_lookup", get_user_by_telegram_id(telegram_id))
+            )
+            content_task = stages.create_task(
+                _stage("extract_content", extract_message_content(message))
+            )
+            user_data = await user_task
+            if not (selecting or caption_command):
+                if not user_data:
+                    # Usuario no vinculado: no hace falta descargar ni transcribir
+                    content_task.cancel()
+                else:
+                    prepared = agent.prepare(
+                        telegram_id=telegram_id,
+                        organizacion_id=user_data.organizacion_id,
+                        org_nombre=user_data.org_nombre or "Sin nombre",
+                        user_nombre=user_data.user_nombre or "Usuario",
+                        org_url=user_data.org_url or "",
+                    )
+    except BaseException:
+        if prepared:
+            agent.discard(prepared)
+        raise
+
+    # Usuario no vinculado (ya se canceló la extracción)
+    if content_task.cancelled():
+        await delivery.send(chat_id, UNLINKED_USER_MESSAGE, priority=Priority.COMMAND)
+        return {"ok": True}
 
-    # Extraer contenido del mensaje
-    content = await extract_message_content(message)
+    content = content_task.result()
+    if prepared and (content is None or content.startswith("/")):
+        agent.discard(prepared)
 
     if content is None:
-        await telegram.send_message(
+        await delivery.send(
             chat_id,
             "No pude entender tu mensaje. Envía texto, audio o un documento PDF.",
+            priority=Priority.COMMAND,
         )
         return {"ok": True}
 
-    # Manejar comandos especiales
+    # Comando en el caption de un documento o foto
     if content.startswith("/"):
+        tracer.annotate(kind="command")
         await handle_command(chat_id, telegram_id, content, user_data)
         return {"ok": True}
 
-    # Verificar si hay selección de org pendiente
-    if telegram_id in _pending_org_selection:
+    # Selección de org pendiente
+    if selecting:
         await handle_org_selection(chat_id, telegram_id, content, user_data)
         return {"ok": True}
 
     # Verificar usuario vinculado
     if not user_data:
-        await telegram.send_message(chat_id, UNLINKED_USER_MESSAGE)
+        await delivery.send(chat_id, UNLINKED_USER_MESSAGE, priority=Priority.COMMAND)
         return {"ok": True}
 
-    # Procesar mensaje con el agente
-    agent = get_agent()
-    response = await agent.process_message(
-        telegram_id=telegram_id,
-        message=content,
-        organizacion_id=user_data.organizacion_id,
-        org_nombre=user_data.org_nombre or "Sin nombre",
-        user_nombre=user_data.user_nombre or "Usuario",
-        org_url=user_data.org_url or "",
-    )
-
-    # Convertir markdown estándar a Telegram MarkdownV2
-    try:
-        converted = telegramify_markdown.markdownify(response)
-        await telegram.send_message(
-            chat_id, converted, reply_to_message_id=message.message_id, parse_mode="MarkdownV2"
+    # El agente pudo haber hecho cambios antes de la interrupción
+    if interrupted:
+        content += INTERRUPTED_NOTE
+
+    # Procesar mensaje con el agente (conectado mientras se extraía el contenido)
+    with tracer.span("agent"):
+        response = await agent.process_message(
+            telegram_id=telegram_id,
+            message=content,
+            organizacion_id=user_data.organizacion_id,
+            org_nombre=user_data.org_nombre or "Sin nombre",
+            user_nombre=user_data.user_nombre or "Usuario",
+            org_url=user_data.org_url or "",
+            prepared=prepared,
         )
-    except Exception:
-        # Fallback: enviar como texto plano si la conversión falla
-        await telegram.send_message(
-            chat_id, response, reply_to_message_id=message.message_id, parse_mode=None
+
+    # Convertir a MarkdownV2 (validado localmente) y dividir en mensajes de hasta 4096
+    # Las listas largas salen paginadas con botones
+    with tracer.span("render"):
+        messages = await get_result_pager().render(
+            chat_id, response, reply_to_message_id=message.message_id
         )
+    with tracer.span("send"):
+        await delivery.send_many(messages)
     return {"ok": True}
 
 
+async def _stage(name: str, work: Awaitable):
+    """Etapa previa al agente, medida como un span del update"""
+    with get_tracer().span(name):
+        return await work
+
+
+async def handle_callback_query(callback: TelegramCallbackQuery):
+    """Cambia de página una respuesta paginada editando el mensaje con los botones"""
+    telegram = get_telegram_service()
+    data = callback.data or ""
+
+    messages = None
+    if data.startswith(CALLBACK_PREFIX) and data != NOOP_CALLBACK and callback.message:
+        with get_tracer().span("page"):
+            messages = await get_result_pager().page(
+                callback.from_user.id, callback.message.message_id, data
+            )
+
+    if messages:
+        await get_delivery_scheduler().send_many(messages, priority=Priority.COMMAND)
+    # Quita el indicador de carga del botón (y avisa si la respuesta expiró)
+    text = PAGE_EXPIRED_MESSAGE if messages is None and data != NOOP_CALLBACK else None
+    result = await telegram.answer_callback_query(callback.id, text)
+    if not result.get("ok"):
+        logger.warning(f"answerCallbackQuery failed: {result.get('description')}")
+
+
 async def extract_message_content(message) -> str | None:
     """
     Extrae el contenido del mensaje (texto, audio transcrito, o caption de documento).
     """
+    tracer = get_tracer()
+
     # Texto directo
     if message.text:
+        tracer.annotate(kind="text")
         return message.text
 
-    # Audio (voice note)
+    # Audio (voice note): primero la cache por file_unique_id (reenvíos del
+    # mismo audio); si no está, se descarga a memoria y se transcribe
     if message.voice:
+        tracer.annotate(kind="voice", duration=message.voice.duration)
+        cache = get_transcription_cache()
+        with tracer.span("transcription_cache"):
+            cached = await cache.get(message.voice.file_unique_id)
+        if cached is not None:
+            return cached
+
         telegram = get_telegram_service()
         transcription = get_transcription_service()
 
-        audio_path = await telegram.download_file(message.voice.file_id)
-        if audio_path:
-            try:
-                text = await transcription.transcribe(audio_path)
-                return text
-            finally:
-                # Limpiar archivo temporal
-                if os.path.exists(audio_path):
-                    os.remove(audio_path)
-
-    # Documento (PDF) - por ahora solo extraemos caption
-    # TODO: Implementar extracción de contenido de PDF
+        try:
+            with tracer.span("download"):
+                audio = await telegram.download_bytes(
+                    message.voice.file_id, file_size=message.voice.file_size
+                )
+        except FileTooLargeError as e:
+            logger.warning(f"Voice note too large: {e}")
+            audio = None
+
+        if audio:
+            with tracer.span("transcription"):
+                text = await transcription.transcribe_voice(audio, duration=message.voice.duration)
+            if text:
+                await cache.set(message.voice.file_unique_id, text)
+            return text
+
+    # Documento: si es PDF se extrae su texto; si no se puede, solo caption
     if message.document:
+        tracer.annotate(kind="document")
+        documents = get_document_pipeline()
+        if documents.is_pdf(message.document):
+            with tracer.span("document"):
+                content = await documents.build_message(message.document, message.caption)
+            if content:
+                return content
         if message.caption:
             return message.caption
         return f"[Documento: {message.document.file_name}]"
@@ -145,45 +317,48 @@ async def handle_command(
     user_data: TelegramUserData | None,
 ):
     """Maneja comandos especiales del bot"""
-    telegram = get_telegram_service()
+    delivery = get_delivery_scheduler()
     cmd = command.lower().strip()
 
     # /start
     if cmd == "/start":
         if user_data:
-            await telegram.send_message(
+            await delivery.send(
                 chat_id,
                 WELCOME_MESSAGE.format(
                     user_nombre=user_data.user_nombre or "Usuario",
                     org_nombre=user_data.org_nombre or "tu organización",
                 ),
+                priority=Priority.COMMAND,
             )
         else:
-            await telegram.send_message(chat_id, UNLINKED_USER_MESSAGE)
+            await delivery.send(chat_id, UNLINKED_USER_MESSAGE, priority=Priority.COMMAND)
         return
 
     # /vincular <codigo>
     if cmd.startswith("/vincular"):
         # TODO: Implementar vinculación con código
-        await telegram.send_message(
+        await delivery.send(
             chat_id,
             "La vinculación por código estará disponible pronto. "
             "Por ahora, contacta al administrador.",
+            priority=Priority.COMMAND,
         )
         return
 
     # /cambiar_org
     if cmd == "/cambiar_org":
         if not user_data:
-            await telegram.send_message(chat_id, UNLINKED_USER_MESSAGE)
+            await delivery.send(chat_id, UNLINKED_USER_MESSAGE, priority=Priority.COMMAND)
             return
 
         orgs = await get_user_organizations(user_data.user_id)
 
         if len(orgs) <= 1:
-            await telegram.send_message(
+            await delivery.send(
                 chat_id,
                 NO_MORE_ORGS_MESSAGE.format(org_nombre=user_data.org_nombre or "tu organización"),
+                priority=Priority.COMMAND,
             )
             return
 
@@ -194,18 +369,33 @@ async def handle_command(
         org_list = "\n".join(
             [f"{i+1}. {org['nombre']}" for i, org in enumerate(orgs)]
         )
-        await telegram.send_message(
+        await delivery.send(
             chat_id,
             SELECT_ORG_MESSAGE.format(org_list=org_list),
+            priority=Priority.COMMAND,
         )
         return
 
+    # /resumen: cifras precalculadas de la cartera, sin pasar por el agente
+    if cmd == "/resumen":
+        if not user_data:
+            await delivery.send(chat_id, UNLINKED_USER_MESSAGE, priority=Priority.COMMAND)
+            return
+
+        summary = await get_summary_materializer().get_or_refresh(user_data.organizacion_id)
+        text = PORTFOLIO_SUMMARY_MESSAGE.format(
+            org_nombre=user_data.org_nombre or "tu organización", **summary.values()
+        ).strip()
+        await delivery.send_many(render_reply(chat_id, text), priority=Priority.COMMAND)
+        return
+
     # /help
     if cmd == "/help":
         help_text = """
 Comandos disponibles:
 
 /start - Inicia el bot
+/resumen - Deuda, vencidos, contratos y payouts de tu organización
 /cambiar_org - Cambiar de organización
 /vincular <código> - Vincular tu cuenta
 /help - Muestra esta ayuda
@@ -215,13 +405,14 @@ También puedes enviarme:
 • Audio describiendo lo que necesitas
 • Documentos PDF de contratos
         """
-        await telegram.send_message(chat_id, help_text)
+        await delivery.send(chat_id, help_text, priority=Priority.COMMAND)
         return
 
     # Comando no reconocido
-    await telegram.send_message(
+    await delivery.send(
         chat_id,
         "Comando no reconocido. Usa /help para ver los comandos disponibles.",
+        priority=Priority.COMMAND,
     )
 
 
@@ -232,7 +423,7 @@ async def handle_org_selection(
     user_data: TelegramUserData | None,
 ):
     """Maneja la selección de organización"""
-    telegram = get_telegram_service()
+    delivery = get_delivery_scheduler()
     orgs = _pending_org_selection.get(telegram_id, [])
 
     try:
@@ -251,18 +442,21 @@ async def handle_org_selection(
             agent = get_agent()
             agent._clear_session(telegram_id)
 
-            await telegram.send_message(
+            await delivery.send(
                 chat_id,
                 f"Cambiaste a la organización: {selected_org['nombre']}\n\n"
                 f"¿En qué te puedo ayudar?",
+                priority=Priority.COMMAND,
             )
         else:
-            await telegram.send_message(
+            await delivery.send(
                 chat_id,
                 "Número inválido. Por favor selecciona un número de la lista.",
+                priority=Priority.COMMAND,
             )
     except ValueError:
-        await telegram.send_message(
+        await delivery.send(
             chat_id,
             "Por favor responde con el número de la organización.",
+            priority=Priority.COMMAND,
         )
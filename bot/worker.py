@@ -0,0 +1,219 @@
+"""
+Worker del agente para EXECUTION_MODE=queue.
+
+Toma los mensajes que encola el webhook (DATA_DIR/jobs.db), los procesa
+(transcripción, PDFs, agente, render) y envía las respuestas. Cada proceso
+atiende WORKER_CONCURRENCY mensajes a la vez; se escalan por separado del
+webhook con --processes o más contenedores, siempre en la misma máquina que
+el webhook: la cola es SQLite en modo WAL sobre un DATA_DIR local (no sirve
+en un volumen de red compartido entre hosts).
+
+Uso (desde bot/):
+    python worker.py
+    python worker.py --processes 4
+"""
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from src.agent.agent import get_agent
+from src.config import get_settings
+from src.models.schemas import TelegramUpdate
+from src.services.delivery import get_delivery_scheduler
+from src.services.documents import get_document_pipeline
+from src.services.drain import reap_children
+from src.services.jobs import Job, get_job_queue
+from src.services.pagination import get_result_pager
+from src.services.startup import get_startup_profile, prewarm
+from src.services.summaries import get_summary_materializer
+from src.services.telegram import get_telegram_service
+from src.services.tracing import get_tracer
+from src.services.transcription import get_transcription_cache
+from src.webhook.handlers import handle_message
+
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_INTERVAL = 5.0
+
+
+class AgentWorker:
+    """Loop de un proceso worker: toma jobs de la cola y los procesa en paralelo"""
+
+    def __init__(self):
+        settings = get_settings()
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}"
+        self.concurrency = settings.worker_concurrency
+        self.poll_interval = settings.worker_poll_interval
+        self.grace = settings.drain_grace_seconds
+        self.queue = get_job_queue()
+        self.stopping = asyncio.Event()
+        self._running: dict[asyncio.Task, Job] = {}
+
+        # Métricas
+        self.processed = 0
+        self.failed = 0
+        self.released = 0
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self.stopping.set)
+
+        await self.queue.heartbeat(self.worker_id, self.stats())
+        await self.queue.recover()
+        heartbeat = asyncio.create_task(self._heartbeat_loop())
+        logger.info(f"Worker {self.worker_id} ready ({self.concurrency} slots)")
+
+        slots = asyncio.Semaphore(self.concurrency)
+
+        def done(task: asyncio.Task):
+            self._running.pop(task, None)
+            slots.release()
+
+        while not self.stopping.is_set():
+            await slots.acquire()
+            job = None if self.stopping.is_set() else await self.queue.claim(self.worker_id)
+            if job is None:
+                slots.release()
+                try:
+                    await asyncio.wait_for(self.stopping.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            task = asyncio.create_task(self._process(job))
+            self._running[task] = job
+            task.add_done_callback(done)
+
+        await self._drain()
+        heartbeat.cancel()
+        await self.queue.unregister(self.worker_id)
+
+    async def _process(self, job: Job):
+        tracer = get_tracer()
+        update = TelegramUpdate.model_validate(job.body)
+        try:
+            with tracer.trace(update.update_id):
+                tracer.record("queue_wait", max(time.time() - job.enqueued_at, 0.0))
+                await handle_message(update, interrupted=job.interrupted)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception(f"Job {job.id} failed")
+            self.failed += 1
+            await self.queue.fail(job.id, repr(e))
+            return
+        self.processed += 1
+        await self.queue.complete(job.id)
+
+    async def _drain(self):
+        """Espera los jobs en curso hasta DRAIN_GRACE_SECONDS; los demás vuelven a la cola"""
+        if not self._running:
+            return
+        logger.info(f"Draining {len(self._running)} job(s), grace period {self.grace:.0f}s")
+        _, pending = await asyncio.wait(list(self._running), timeout=self.grace)
+        for task in pending:
+            job = self._running.get(task)
+            task.cancel()
+            if job is not None:
+                logger.warning(f"Job {job.id} did not finish in the grace period, requeued")
+                await self.queue.release(job.id)
+                self.released += 1
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            try:
+                await self.queue.heartbeat(self.worker_id, self.stats())
+                await self.queue.recover()
+            except Exception as e:
+                logger.error(f"Heartbeat failed: {e!r}")
+
+    def stats(self) -> dict:
+        return {
+            "running": len(self._running),
+            "slots": self.concurrency,
+            "processed": self.processed,
+            "failed": self.failed,
+            "released": self.released,
+            "stages": get_tracer().stats(),
+        }
+
+
+async def serve():
+    settings = get_settings()
+    telegram = get_telegram_service()
+    await telegram.start()
+    delivery = get_delivery_scheduler()
+    delivery.start()
+    if settings.prewarm_enabled:
+        await prewarm(get_startup_profile())
+    try:
+        await AgentWorker().run()
+    finally:
+        await get_agent().close()
+        await delivery.stop()
+        await telegram.close()
+        get_transcription_cache().close()
+        get_document_pipeline().close()
+        get_result_pager().close()
+        get_summary_materializer().close()
+        get_job_queue().close()
+        await reap_children()
+        telegram.cleanup_temp_files()
+
+
+def run_process():
+    asyncio.run(serve())
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--processes", type=int, default=1, help="procesos worker a levantar")
+    args = parser.parse_args()
+
+    if get_settings().execution_mode != "queue":
+        logger.warning("EXECUTION_MODE no es 'queue': el webhook no encolará mensajes")
+    if args.processes <= 1:
+        run_process()
+        return
+
+    # Un proceso por core; SIGTERM se reenvía y cada uno hace su propio drain
+    processes = [
+        multiprocessing.Process(target=run_process, name=f"worker-{i}")
+        for i in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+
+    def forward(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()